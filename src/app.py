@@ -2,7 +2,7 @@
 import sys
 from datetime import date
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 import streamlit as st
 
@@ -14,7 +14,13 @@ if str(ROOT) not in sys.path:
 from src import config
 from src.models import TravelerProfile, Stop, SearchRequest  # noqa: E402
 from src.services.search_coordinator import run_search  # noqa: E402
-from src.services.nsga2_solver import solve_nsga2, diagnose_missing  # noqa: E402
+from src.services.nsga2_solver import (  # noqa: E402
+    compile_offers,
+    diagnose_missing,
+    rank_front,
+    solve_nsga2,
+    solve_nsga2_anytime,
+)
 from src.utils.autocomplete import search_locations  # noqa: E402
 from src.utils.cancel import request_cancel, clear_cancel  # noqa: E402
 
@@ -25,6 +31,22 @@ st.title("Planejador de Viagens (BR-EUA)")
 DEFAULT_LOCATION_CODE = "GYN"
 
 
+@st.cache_data(show_spinner=False)
+def location_options() -> Tuple[List[str], List[str]]:
+    """Monta uma única vez as opções do seletor de localidades.
+
+    Args:
+        None.
+
+    Returns:
+        Tupla (códigos, rótulos exibidos), na ordem dos arquivos.
+    """
+    options = search_locations("", limit=5000)
+    codes = [o["code"] for o in options]
+    display = [f"{o['code']} - {o['city']}/{o['state']} ({o['country']})" for o in options]
+    return codes, display
+
+
 def render_location_picker(container, label: str, key: str, current: str) -> str:
     """Renderiza um selectbox de localidades com busca interna.
 
@@ -37,20 +59,16 @@ def render_location_picker(container, label: str, key: str, current: str) -> str
     Returns:
         Código da localidade escolhida.
     """
-    options = search_locations("", limit=5000)
-    if not options:
+    codes, display = location_options()
+    if not codes:
         return current.strip().upper()
-    display = [f"{o['code']} - {o['city']}/{o['state']} ({o['country']})" for o in options]
     default_index = 0
     target_code = current or DEFAULT_LOCATION_CODE
-    if target_code:
-        for i, opt in enumerate(options):
-            if opt["code"] == target_code:
-                default_index = i
-                break
+    if target_code in codes:
+        default_index = codes.index(target_code)
     choice = container.selectbox(label, display, index=default_index, key=f"{key}_select")
     idx = display.index(choice)
-    return options[idx]["code"]
+    return codes[idx]
 
 
 def init_state():
@@ -71,6 +89,7 @@ def init_state():
     st.session_state.setdefault("trip_end_date", date.today())
     st.session_state.setdefault("last_search_data", None)
     st.session_state.setdefault("last_nsga_solutions", None)
+    st.session_state.setdefault("last_offers", None)
     st.session_state.setdefault("last_preview_rows", [])
 
 
@@ -422,6 +441,34 @@ def render_stops():
             st.rerun()
 
 
+def run_solver(data: dict, offers, preference: str) -> Tuple[list, bool]:
+    """Roda o otimizador: anytime com SOLVER_DEADLINE_S, NSGA-II completo sem prazo.
+
+    Args:
+        data: JSON da busca.
+        offers: ofertas compiladas (``compile_offers``).
+        preference: prioridade escolhida ("best", "price" ou "duration").
+
+    Returns:
+        Tupla (soluções ranqueadas, prazo esgotado).
+    """
+    if not getattr(config, "SOLVER_DEADLINE_S", None):
+        solutions = solve_nsga2(data, preference=preference, max_solutions=config.NSGA_MAX_SOLUTIONS, offers=offers)
+        return solutions, False
+    progress = st.empty()
+    solutions = []
+    for solutions in solve_nsga2_anytime(
+        data,
+        preference=preference,
+        max_solutions=config.NSGA_MAX_SOLUTIONS,
+        offers=offers,
+    ):
+        progress.caption(f"Otimizando... {len(solutions)} solucao(oes) parcial(is) encontrada(s).")
+    progress.empty()
+    stopped = data.get("meta", {}).get("solver_stats", {}).get("anytime", {}).get("stopped")
+    return solutions, stopped == "deadline"
+
+
 @st.cache_data(ttl=300, show_spinner=False)
 def cached_search(req_payload: dict):
     """Executa a busca usando o payload ja serializado, com cache de 5 minutos.
@@ -634,13 +681,16 @@ def render_search_and_results():
             st.session_state.last_preview_rows = []
         with st.spinner("Encontrando voos, carros e hospedagem..."):
             data = cached_search(payload)
-        nsga_solutions = solve_nsga2(
-            data,
-            preference=selected_sort,
-            max_solutions=config.NSGA_MAX_SOLUTIONS,
-        )
-        if not nsga_solutions:
-            missing = diagnose_missing(data)
+        offers = compile_offers(data)
+        nsga_solutions, timed_out = run_solver(data, offers, selected_sort)
+        if not nsga_solutions and timed_out:
+            data.setdefault("meta", {})["solver_status"] = {
+                "status": "timeout",
+                "reason": "prazo do otimizador (SOLVER_DEADLINE_S) esgotado antes da primeira solucao",
+                "missing": [],
+            }
+        elif not nsga_solutions:
+            missing = diagnose_missing(data, offers=offers)
             data.setdefault("meta", {})["solver_status"] = {
                 "status": "no_solution",
                 "reason": "faltam voos, hoteis ou carros para o itinerario completo",
@@ -649,15 +699,22 @@ def render_search_and_results():
         else:
             data.setdefault("meta", {})["solver_status"] = {
                 "status": "ok",
-                "reason": None,
+                "reason": "prazo do otimizador esgotado: frente parcial" if timed_out else None,
                 "missing": [],
             }
         st.session_state.last_search_data = data
         st.session_state.last_nsga_solutions = nsga_solutions
+        st.session_state.last_offers = offers
         st.success("Busca finalizada.")
 
     data = st.session_state.last_search_data
     nsga_solutions = st.session_state.last_nsga_solutions
+    if nsga_solutions and selected_sort != st.session_state.get("last_solver_preference"):
+        # Troca de prioridade sem nova busca: mesmo caminho (e prazo) da busca;
+        # sem prazo, a frente fica em cache no solver
+        nsga_solutions, _ = run_solver(data, st.session_state.last_offers, selected_sort)
+        st.session_state.last_nsga_solutions = nsga_solutions
+        st.session_state.last_solver_preference = selected_sort
     if data:
         with st.expander("JSON enviado ao solver", expanded=False):
             st.json(data)
@@ -679,6 +736,39 @@ def render_search_and_results():
         """
         return (value or "").split("T")[0]
 
+    def _nearby_text(origin: str, destination: str) -> str:
+        """Resume os aeroportos alternativos das pontas de uma perna.
+
+        Args:
+            origin: codigo de origem.
+            destination: codigo de destino.
+
+        Returns:
+            Texto com as alternativas (codigo e km de carro) ou vazio se nao houver.
+        """
+        nearby = ((data or {}).get("meta") or {}).get("nearby_airports") or {}
+        parts = []
+        for label, code in (("origem", origin), ("destino", destination)):
+            alternatives = ", ".join(
+                f"{alt['code']} ({alt['drive_distance_km']:.0f} km)" for alt in nearby.get(code) or []
+            )
+            if alternatives:
+                parts.append(f"{label} {code}: {alternatives}")
+        return "; ".join(parts)
+
+    def _missing_leg_text(leg: dict) -> str:
+        """Descreve uma perna sem transporte, com os aeroportos alternativos.
+
+        Args:
+            leg: perna faltante (origin/destination/date).
+
+        Returns:
+            Texto da perna.
+        """
+        alternatives = _nearby_text(leg["origin"], leg["destination"])
+        text = f"{leg['origin']} -> {leg['destination']} em {leg['date']}"
+        return f"{text} (alternativas: {alternatives})" if alternatives else text
+
     def _format_itinerary(sol: dict) -> List[str]:
         """Formata uma solucao em linhas legiveis por ordem temporal.
 
@@ -691,6 +781,7 @@ def render_search_and_results():
         events = []
         for flight in sol["selections"].get("flights", []):
             leg = flight.get("leg", {})
+            alternatives = _nearby_text(leg.get("origin"), leg.get("destination"))
             events.append(
                 {
                     "when": leg.get("departure", ""),
@@ -700,6 +791,7 @@ def render_search_and_results():
                         f"| Horario: {flight.get('details', {}).get('times', '-') or '-'} "
                         f"| Companhia: {flight.get('provider') or '-'} "
                         f"| Preco: {flight.get('price')} {flight.get('currency')}"
+                        + (f" | Aeroportos proximos: {alternatives}" if alternatives else "")
                     ),
                 }
             )
@@ -737,33 +829,10 @@ def render_search_and_results():
 
     if nsga_solutions:
         st.subheader("Melhores solucoes (NSGA-II)")
+        if data.get("meta", {}).get("solver_status", {}).get("reason"):
+            st.caption(f"Aviso: {data['meta']['solver_status']['reason']}.")
         preference = st.session_state.get("last_solver_preference", "best")
-        if preference == "price":
-            ordered_solutions = sorted(
-                nsga_solutions,
-                key=lambda s: (s["objectives"]["cost_total"], s["objectives"]["flight_duration_hours"]),
-            )
-        elif preference == "duration":
-            ordered_solutions = sorted(
-                nsga_solutions,
-                key=lambda s: (s["objectives"]["flight_duration_hours"], s["objectives"]["cost_total"]),
-            )
-        else:
-            weight_cost = getattr(config, "NSGA_WEIGHT_COST", 0.5)
-            weight_duration = getattr(config, "NSGA_WEIGHT_DURATION", 0.5)
-            min_cost = min(s["objectives"]["cost_total"] for s in nsga_solutions)
-            max_cost = max(s["objectives"]["cost_total"] for s in nsga_solutions)
-            min_dur = min(s["objectives"]["flight_duration_hours"] for s in nsga_solutions)
-            max_dur = max(s["objectives"]["flight_duration_hours"] for s in nsga_solutions)
-
-            def _score(sol: dict) -> float:
-                cost = sol["objectives"]["cost_total"]
-                dur = sol["objectives"]["flight_duration_hours"]
-                norm_cost = 0.0 if max_cost == min_cost else (cost - min_cost) / (max_cost - min_cost)
-                norm_dur = 0.0 if max_dur == min_dur else (dur - min_dur) / (max_dur - min_dur)
-                return (weight_cost * norm_cost) + (weight_duration * norm_dur)
-
-            ordered_solutions = sorted(nsga_solutions, key=_score)
+        ordered_solutions = rank_front(nsga_solutions, preference)
 
         for idx, sol in enumerate(ordered_solutions, start=1):
             st.markdown(
@@ -780,6 +849,11 @@ def render_search_and_results():
                 mime="application/json",
                 data=json.dumps(ordered_solutions, ensure_ascii=False, indent=2),
             )
+    elif data is not None and data.get("meta", {}).get("solver_status", {}).get("status") == "timeout":
+        st.warning(
+            "O otimizador atingiu o prazo (SOLVER_DEADLINE_S) antes de encontrar um itinerario completo. "
+            "Aumente o prazo e busque novamente."
+        )
     elif data is not None:
         st.warning("Nenhum itinerario completo disponivel (faltam voos, hoteis ou carros).")
         missing = data.get("meta", {}).get("solver_status", {}).get("missing", [])
@@ -790,7 +864,7 @@ def render_search_and_results():
                 if item.get("missing_legs"):
                     legs_text = "; ".join(
                         [
-                            f"{leg['origin']} -> {leg['destination']} em {leg['date']}"
+                            _missing_leg_text(leg)
                             for leg in item["missing_legs"]
                         ]
                     )
@@ -9,11 +9,36 @@ Parametros:
 - DEFAULT_MAX_ITEMS: limite padrao de itens retornados (top N) por categoria.
 - GAP_FILL_DAYS: dias maximos para preencher lacunas de hospedagem antes/depois de janelas fixas.
 - LOCATIONS_FILES: lista de arquivos CSV com localidades (IATA/cidades/UF/pais).
+- LOCATIONS_CACHE_DIR: diretorio da base de localidades pre-compilada (arrays NumPy abertos via memmap, reconstruida quando um CSV muda); None le os CSVs a cada processo.
 - DRIVE_DISTANCE_FACTOR: fator multiplicador para estimar distancia de estrada a partir do Haversine.
 - MAX_CAR_DISTANCE_KM: distancia maxima (ajustada) para considerar carro; acima disso, usa apenas voo.
 - AVG_DRIVE_SPEED_KMH: velocidade media para estimar tempo de carro.
+- NEARBY_AIRPORT_RADIUS_KM / NEARBY_AIRPORT_MAX: raio de estrada (km) e quantidade maxima de aeroportos alternativos sugeridos para a origem/destino de cada perna (0 desativa).
+- DRIVE_MATRIX_AIRPORTS: se True, as distancias de carro vem de uma matriz de todos os aeroportos com voos regulares (ou sem essa informacao no CSV), calculada uma vez e guardada em .npy (memmap, distancias em float32) em LOCATIONS_CACHE_DIR.
 - CAR_FUEL_COST_PER_KM: custo de combustivel por km para estimar custo total do carro.
 - NSGA_MAX_SOLUTIONS: numero maximo de solucoes retornadas pelo NSGA-II.
+- SOLVER_ENGINE: motor de otimizacao registrado em nsga2_solver.ENGINES ("nsga2" via pymoo, "exact" para a frente de Pareto exata, "enumerate" forca bruta, "random" amostragem de referencia).
+- SOLVER_PARALLEL: se True, resolve os cenarios em paralelo (ProcessPoolExecutor + memoria compartilhada).
+- SOLVER_MAX_WORKERS: numero de processos do modo paralelo (None = nucleos da maquina).
+- SOLVER_PRUNE_SCENARIOS: se True, ordena cenarios pelo ponto ideal e pula os dominados pelas solucoes ja encontradas.
+- SOLVER_KBEST_FAST_PATH: se True, preferencias "price"/"duration" usam enumeracao exata dos k melhores (sem pymoo).
+- SOLVER_ENUMERATION_LIMIT: cenarios com ate esse numero de combinacoes sao enumerados por completo em vez de rodar o NSGA-II.
+- SOLVER_PRUNE_OPTIONS: se True, remove de cada grupo as opcoes dominadas (mais caras e mais lentas) antes de otimizar.
+- SOLVER_ARCHIVE_SIZE: tamanho maximo da frente global entre cenarios (None = ilimitado; excesso sai por crowding distance).
+- SOLVER_EVAL_CACHE_SIZE: tamanho do cache LRU de avaliacoes de genomas repetidos no NSGA-II (0 desativa).
+- SOLVER_ISLANDS: numero de ilhas do NSGA-II (populacoes independentes em processos, com sementes diferentes, dividindo o orcamento do cenario); <= 1 desativa.
+- SOLVER_MIGRATION_INTERVAL / SOLVER_MIGRANTS: a cada quantas geracoes e quantos individuos migram entre ilhas vizinhas.
+- SOLVER_OPERATORS: operadores do NSGA-II ("integer" = SBX/mutacao polinomial inteiros; "uniform"/"group_swap" = cruzamento categorico + mutacao por sorteio).
+- SOLVER_SORT_OPTIONS: se True, ordena as opcoes de cada grupo por custo (indices proximos = custos proximos).
+- SOLVER_DEADLINE_S: prazo (segundos) do solver "anytime" usado pela interface; None usa o solver completo.
+- SOLVER_STAGNATION_GENERATIONS / SOLVER_STAGNATION_TOL: para o solver "anytime" apos N rodadas com ganho relativo de hipervolume <= TOL (0 desativa).
+- SOLVER_FRONT_CACHE_SIZE: quantas frentes globais (por impressao digital das ofertas) ficam em cache para reordenar sem resolver de novo (0 desativa).
+- SOLVER_BUDGET_ALLOCATION / SOLVER_EVALUATION_BUDGET: divide um orcamento total de avaliacoes (None = populacao x geracoes por cenario) entre os cenarios pelo tamanho do espaco de busca e pela qualidade do ponto ideal; cenarios pequenos sao enumerados.
+- SOLVER_TRACE / SOLVER_TRACE_CSV: registra a convergencia por cenario (avaliacoes, tempo, menor custo, hipervolume, IGD por geracao) em meta.solver_stats.traces e, com um caminho, em CSV.
+- SOLVER_WARM_START_SIZE: quantos cenarios guardam a populacao final do NSGA-II para semear a proxima busca (0 desativa; desligado por padrao, pois o resultado passa a depender das buscas anteriores).
+- SOLVER_WARM_START_PATH: arquivo JSON onde o warm start e gravado ao fim de cada busca e lido no inicio do processo; None mantem so em memoria.
+- SCENARIO_EXHAUSTIVE_LIMIT / SCENARIO_MAX_ORDERS / SCENARIO_BEAM_WIDTH: ate LIMIT stops flexiveis todas as ordens sao testadas; acima disso, uma busca em feixe (BEAM_WIDTH estados por nivel) pela distancia de estrada entrega as MAX_ORDERS melhores ordens.
+- SCRAPE_BATCH_SCENARIOS: quantos cenarios o planejamento gera antes de mandar as pernas/estadas ineditas aos scrapers (None faz um lote unico no fim da enumeracao).
 """
 
 # "mock" (usa JSONs locais) ou "live" (Playwright no Kayak)
@@ -40,6 +65,9 @@ LOCATIONS_FILES = [
     "data/us-airports.csv",
 ]
 
+# Base de localidades pre-compilada (NumPy/memmap); None desativa
+LOCATIONS_CACHE_DIR = "data/.cache/locations"
+
 # Fator para converter distancia Haversine em estimativa de estrada (ex.: 1.2 = +20%)
 DRIVE_DISTANCE_FACTOR = 1.2
 
@@ -53,8 +81,84 @@ NSGA_WEIGHT_DURATION = 0.5
 # Velocidade media para estimar tempo de carro (km/h)
 AVG_DRIVE_SPEED_KMH = 80.0
 
+# Matriz de distancias/tempos de carro entre aeroportos com voos regulares (cache .npy)
+DRIVE_MATRIX_AIRPORTS = True
+
+# Aeroportos alternativos por perna: raio de estrada (km) e maximo de sugestoes (0 desativa)
+NEARBY_AIRPORT_RADIUS_KM = 150.0
+NEARBY_AIRPORT_MAX = 3
+
 # Custo de combustivel por km (BRL)
 CAR_FUEL_COST_PER_KM = 0.5
 
 # Numero maximo de solucoes retornadas pelo NSGA-II
 NSGA_MAX_SOLUTIONS = 3
+
+# Motor de otimizacao: "nsga2" (pymoo), "exact" (frente exata por grupos), "enumerate" ou "random"
+SOLVER_ENGINE = "nsga2"
+
+# Resolve cenarios em processos paralelos (matrizes em memoria compartilhada)
+SOLVER_PARALLEL = False
+
+# Numero de processos no modo paralelo (None = os.cpu_count())
+SOLVER_MAX_WORKERS = None
+
+# Branch-and-bound entre cenarios: pula cenarios cujo ponto ideal ja e dominado
+SOLVER_PRUNE_SCENARIOS = True
+
+# Preferencias "price"/"duration" via k melhores exatos (fila de prioridade), sem pymoo
+SOLVER_KBEST_FAST_PATH = True
+
+# Ate esse numero de combinacoes por cenario, enumera tudo (vetorizado) em vez de rodar o GA
+SOLVER_ENUMERATION_LIMIT = 50000
+
+# Remove opcoes dominadas dentro de cada grupo (perna/estada) antes da otimizacao
+SOLVER_PRUNE_OPTIONS = True
+
+# Tamanho maximo da frente de Pareto global entre cenarios (None = ilimitado)
+SOLVER_ARCHIVE_SIZE = 200
+
+# Cache LRU de avaliacoes de genomas repetidos durante o NSGA-II (0 desativa)
+SOLVER_EVAL_CACHE_SIZE = 10000
+
+# Modelo de ilhas do NSGA-II: numero de ilhas (<= 1 desativa), intervalo de migracao (geracoes) e migrantes
+SOLVER_ISLANDS = 1
+SOLVER_MIGRATION_INTERVAL = 10
+SOLVER_MIGRANTS = 5
+
+# Operadores do NSGA-II: "integer" (SBX/polinomial), "uniform" ou "group_swap" (categoricos)
+SOLVER_OPERATORS = "integer"
+
+# Ordena opcoes de cada grupo por custo antes de otimizar
+SOLVER_SORT_OPTIONS = False
+
+# Prazo do solver "anytime" em segundos (None = roda todas as geracoes com solve_nsga2)
+SOLVER_DEADLINE_S = None
+
+# Parada por estagnacao do hipervolume no solver "anytime"
+SOLVER_STAGNATION_GENERATIONS = 10
+SOLVER_STAGNATION_TOL = 1e-3
+
+# Warm start do NSGA-II: cenarios com populacao final guardada (0 desativa)
+SOLVER_WARM_START_SIZE = 0
+# Arquivo de persistencia do warm start (None = apenas em memoria)
+SOLVER_WARM_START_PATH = "data/.cache/warm_start.json"
+
+# Cache de frentes globais por impressao digital das ofertas (0 desativa)
+SOLVER_FRONT_CACHE_SIZE = 8
+
+# Alocacao do orcamento de avaliacoes entre cenarios (None = mesmo total sem alocacao)
+SOLVER_BUDGET_ALLOCATION = True
+SOLVER_EVALUATION_BUDGET = None
+
+# Traces de convergencia do solver (meta.solver_stats.traces) e CSV opcional
+SOLVER_TRACE = False
+SOLVER_TRACE_CSV = None
+
+# Ordens de stops flexiveis: permutacoes completas ate o limite; acima, busca em feixe por distancia
+SCENARIO_EXHAUSTIVE_LIMIT = 6
+SCENARIO_MAX_ORDERS = 24
+SCENARIO_BEAM_WIDTH = 64
+
+# Cenarios por lote entre planejamento e scrapers (None = todos de uma vez)
+SCRAPE_BATCH_SCENARIOS = 120
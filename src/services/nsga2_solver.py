@@ -1,9 +1,23 @@
+import bisect
+import contextlib
+import copy
+import csv
+import hashlib
+import heapq
 import json
-import random
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from src import config
+from src.utils.geo import drive_matrix
+from src.utils.logs import add_log
 
 
 def _parse_date(value: str) -> datetime:
@@ -183,112 +197,281 @@ def _index_cars(data: Dict[str, Any]) -> Dict[Tuple[str, str, str, str], List[Di
     return index
 
 
-def _fast_nondominated_sort(pop: List[Dict[str, Any]]) -> List[List[int]]:
-    """Executa a ordenacao nao-dominada do NSGA-II.
+def _car_drive(
+    data: Dict[str, Any], car_index: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]]
+) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """Distancia (km) e tempo (h) de estrada de cada par (retirada, devolucao) com carros.
+
+    Fontes, nesta ordem: o ``rental_block`` das ofertas (gravado pelo
+    coordenador), as pernas de ``meta.legs`` e a matriz de distancias
+    (``utils.geo.drive_matrix``) para os pares restantes. Pares sem
+    coordenadas ficam com (0, 0), como antes, e geram um aviso no log da
+    busca; a compilacao das demais ofertas segue normalmente.
 
     Args:
-        pop: populacao com objetivos avaliados.
+        data: JSON completo de resultados.
+        car_index: carros indexados por ``_index_cars``.
 
     Returns:
-        Lista de frentes com indices da populacao.
+        Dicionario (retirada, devolucao) -> (distancia km, tempo horas).
     """
-    fronts: List[List[int]] = []
-    dom_count = [0] * len(pop)
-    dominated: List[List[int]] = [[] for _ in pop]
-    for p in range(len(pop)):
-        for q in range(len(pop)):
-            if p == q:
-                continue
-            if _dominates(pop[p]["objectives"], pop[q]["objectives"]):
-                dominated[p].append(q)
-            elif _dominates(pop[q]["objectives"], pop[p]["objectives"]):
-                dom_count[p] += 1
-        if dom_count[p] == 0:
-            pop[p]["rank"] = 0
-            if not fronts:
-                fronts.append([])
-            fronts[0].append(p)
-    i = 0
-    while i < len(fronts):
-        next_front: List[int] = []
-        for p in fronts[i]:
-            for q in dominated[p]:
-                dom_count[q] -= 1
-                if dom_count[q] == 0:
-                    pop[q]["rank"] = i + 1
-                    next_front.append(q)
-        if next_front:
-            fronts.append(next_front)
-        i += 1
-    return fronts
+    drive: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    for leg in data.get("meta", {}).get("legs", []):
+        if leg.get("drive_distance_km") is not None:
+            drive[(leg.get("origin"), leg.get("destination"))] = (
+                float(leg["drive_distance_km"]),
+                float(leg.get("drive_time_hours") or 0.0),
+            )
+    for items in car_index.values():
+        for item in items:
+            block = item.get("rental_block") or {}
+            if block.get("drive_distance_km") is not None:
+                drive[(block["pickup"], block["dropoff"])] = (
+                    float(block["drive_distance_km"]),
+                    float(block.get("drive_time_hours") or 0.0),
+                )
+    missing = sorted({(key[0], key[1]) for key in car_index} - set(drive))
+    if missing:
+        matrix = drive_matrix([code for pair in missing for code in pair])
+        unknown = []
+        for pickup, dropoff in missing:
+            found = matrix.lookup(pickup, dropoff)
+            if found is None:
+                unknown.append(f"{pickup} -> {dropoff}")
+            drive[(pickup, dropoff)] = found or (0.0, 0.0)
+        if unknown:
+            add_log(
+                f"[solver] Distancia de carro desconhecida (sem coordenadas) para: {', '.join(unknown)}; "
+                "combustivel e duracao dessas locacoes ficam em 0."
+            )
+    return drive
+
 
+OFFER_KINDS = ("flight", "car", "hotel")
+_KIND_FLIGHT, _KIND_CAR, _KIND_HOTEL = range(len(OFFER_KINDS))
 
-def _dominates(a: Dict[str, float], b: Dict[str, float]) -> bool:
-    """Verifica se a solucao A domina a solucao B.
+
+def _intern(table: Dict[str, int], value: str) -> int:
+    """Retorna o id inteiro de uma string, registrando-a se necessario.
 
     Args:
-        a: objetivos da solucao A.
-        b: objetivos da solucao B.
+        table: tabela string->id.
+        value: string a internar.
 
     Returns:
-        True se A domina B.
+        Id inteiro da string.
     """
-    not_worse = all(a[k] <= b[k] for k in a)
-    strictly_better = any(a[k] < b[k] for k in a)
-    return not_worse and strictly_better
-
+    if value not in table:
+        table[value] = len(table)
+    return table[value]
 
-def _crowding_distance(pop: List[Dict[str, Any]], front: List[int]) -> Dict[int, float]:
-    """Calcula a distancia de aglomeracao para uma frente.
 
-    Args:
-        pop: populacao com objetivos.
-        front: indices da frente.
+@dataclass
+class CompiledOfferSet:
+    """Ofertas (voos, carros, hoteis) compiladas uma unica vez em colunas NumPy.
 
-    Returns:
-        Dicionario indice->distancia.
+    Cada oferta vira uma linha; os grupos de decisao referenciam ids de linha
+    em vez de copias de dicionarios. Os dicionarios de saida so sao montados
+    (``option``) para as solucoes finais.
     """
-    distance = {i: 0.0 for i in front}
-    if not front:
-        return distance
-    keys = list(pop[0]["objectives"].keys())
-    for key in keys:
-        sorted_idx = sorted(front, key=lambda i: pop[i]["objectives"][key])
-        distance[sorted_idx[0]] = float("inf")
-        distance[sorted_idx[-1]] = float("inf")
-        min_val = pop[sorted_idx[0]]["objectives"][key]
-        max_val = pop[sorted_idx[-1]]["objectives"][key]
-        if max_val == min_val:
-            continue
-        for j in range(1, len(sorted_idx) - 1):
-            prev_val = pop[sorted_idx[j - 1]]["objectives"][key]
-            next_val = pop[sorted_idx[j + 1]]["objectives"][key]
-            distance[sorted_idx[j]] += (next_val - prev_val) / (max_val - min_val)
-    return distance
 
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    kind: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int8))
+    price: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=float))
+    fuel: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=float))
+    duration: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=float))
+    cost: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=float))
+    origin: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    destination: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    start_date: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    end_date: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    locations: Dict[str, int] = field(default_factory=dict)
+    dates: Dict[str, int] = field(default_factory=dict)
+    index: Dict[Tuple[str, ...], np.ndarray] = field(default_factory=dict)
+    context: Tuple[Any, Any] = field(default_factory=lambda: ([], {}), repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "CompiledOfferSet":
+        """Compila o JSON de busca em colunas e indice por chave.
+
+        O custo/tempo de carro usa a distancia de estrada de cada locacao
+        (``_car_drive``).
+
+        Args:
+            data: JSON completo com voos/hoteis/carros e meta.
+
+        Returns:
+            Conjunto de ofertas compilado.
+        """
+        meta = data.get("meta", {})
+        offers = cls(context=(meta.get("scenarios", []), meta.get("trip", {})))
+        car_index = _index_cars(data)
+        drive = _car_drive(data, car_index)
+        columns: Dict[str, List[Any]] = {
+            name: []
+            for name in ("kind", "price", "fuel", "duration", "origin", "destination", "start_date", "end_date")
+        }
+
+        rows_by_key: Dict[Tuple[str, ...], List[int]] = {}
+
+        def _add(
+            kind: int,
+            item: Dict[str, Any],
+            key: Tuple[str, ...],
+            values: Tuple[float, float, float],
+            places: Tuple[str, str],
+            period: Tuple[str, str],
+        ) -> None:
+            rows_by_key.setdefault((OFFER_KINDS[kind],) + key, []).append(len(offers.items))
+            offers.items.append(item)
+            columns["kind"].append(kind)
+            columns["price"].append(values[0])
+            columns["fuel"].append(values[1])
+            columns["duration"].append(values[2])
+            columns["origin"].append(_intern(offers.locations, places[0]))
+            columns["destination"].append(_intern(offers.locations, places[1]))
+            columns["start_date"].append(_intern(offers.dates, period[0]))
+            columns["end_date"].append(_intern(offers.dates, period[1]))
+
+        for key, items in _index_flights(data).items():
+            origin, destination, departure = key
+            for item in items:
+                duration = _parse_time_range((item.get("details") or {}).get("times", ""))
+                values = (float(item.get("price") or 0), 0.0, duration)
+                _add(_KIND_FLIGHT, item, key, values, (origin, destination), (departure, departure))
+        for key, items in car_index.items():
+            pickup, dropoff, pickup_date, dropoff_date = key
+            distance_km, duration = drive[(pickup, dropoff)]
+            fuel = round(distance_km * config.CAR_FUEL_COST_PER_KM, 2)
+            for item in items:
+                values = (float(item.get("price_total") or 0), fuel, duration)
+                _add(_KIND_CAR, item, key, values, (pickup, dropoff), (pickup_date, dropoff_date))
+        for key, items in _index_hotels(data).items():
+            city, checkin, checkout = key
+            for item in items:
+                values = (float(item.get("price_total") or 0), 0.0, 0.0)
+                _add(_KIND_HOTEL, item, key, values, (city, city), (checkin, checkout))
+
+        offers.kind = np.array(columns["kind"], dtype=np.int8)
+        offers.price = np.array(columns["price"], dtype=float)
+        offers.fuel = np.array(columns["fuel"], dtype=float)
+        offers.duration = np.array(columns["duration"], dtype=float)
+        offers.cost = offers.price + offers.fuel
+        for name in ("origin", "destination", "start_date", "end_date"):
+            setattr(offers, name, np.array(columns[name], dtype=np.int32))
+        offers.index = {key: np.array(rows, dtype=int) for key, rows in rows_by_key.items()}
+        return offers
+
+    def transport_rows(self, leg: Dict[str, Any]) -> np.ndarray:
+        """Retorna as linhas de voo e carro disponiveis para uma perna.
+
+        Args:
+            leg: perna com origem/destino/datas.
+
+        Returns:
+            Vetor de ids de linha (voos seguidos de carros).
+        """
+        departure = _date_key(leg["departure"])
+        flights = self.index.get(("flight", leg["origin"], leg["destination"], departure))
+        cars = self.index.get(("car", leg["origin"], leg["destination"], departure, _date_key(leg["arrival"])))
+        parts = [rows for rows in (flights, cars) if rows is not None]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=int)
+
+    def hotel_rows(self, stay: Dict[str, Any]) -> np.ndarray:
+        """Retorna as linhas de hotel disponiveis para uma estada.
+
+        Args:
+            stay: estada com localidade e datas.
+
+        Returns:
+            Vetor de ids de linha.
+        """
+        key = ("hotel", stay.get("location"), _date_key(stay.get("checkin")), _date_key(stay.get("checkout")))
+        rows = self.index.get(key)
+        return rows if rows is not None else np.zeros(0, dtype=int)
+
+    def fingerprint(self) -> str:
+        """Calcula (uma vez) um hash do conteudo das ofertas.
+
+        Inclui os cenarios e a viagem do JSON de origem (``context``), que
+        definem os grupos montados sobre estas ofertas.
+
+        Returns:
+            Hash hexadecimal das colunas numericas, dos itens originais e do
+            contexto da busca.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for column in (self.kind, self.cost, self.duration, self.origin, self.destination, self.start_date, self.end_date):
+                digest.update(np.ascontiguousarray(column).tobytes())
+            digest.update(json.dumps([self.items, self.context], sort_keys=True, default=str).encode("utf-8"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def signature(self, row: int) -> Tuple[str, ...]:
+        """Identifica uma oferta dentro do seu grupo de forma estavel entre buscas.
+
+        O preco fica de fora: a mesma oferta com preco atualizado mantem a
+        assinatura.
+
+        Args:
+            row: id da linha.
+
+        Returns:
+            Tupla (tipo, fornecedor/nome, horarios).
+        """
+        item = self.items[row]
+        details = item.get("details") or {}
+        return (
+            OFFER_KINDS[int(self.kind[row])],
+            str(item.get("provider") or item.get("name") or ""),
+            str(details.get("times") or ""),
+        )
 
-def _tournament(pop: List[Dict[str, Any]], distances: Dict[int, float]) -> Dict[str, Any]:
-    """Seleciona um individuo por torneio (rank + crowding).
+    def option(self, row: int) -> Dict[str, Any]:
+        """Monta o dicionario de saida de uma linha (com campos derivados).
+
+        Args:
+            row: id da linha.
+
+        Returns:
+            Dicionario da oferta; voos/carros recebem ``_kind`` e
+            ``_duration_hours``, carros tambem ``_fuel_cost``.
+        """
+        item = self.items[row]
+        kind = int(self.kind[row])
+        if kind == _KIND_HOTEL:
+            return item
+        option = dict(item)
+        option["_kind"] = OFFER_KINDS[kind]
+        option["_duration_hours"] = float(self.duration[row])
+        if kind == _KIND_CAR:
+            fuel_cost = float(self.fuel[row])
+            option["_fuel_cost"] = fuel_cost
+            details = dict(option.get("details") or {})
+            details["fuel_cost"] = fuel_cost
+            option["details"] = details
+        return option
+
+
+def compile_offers(data: Dict[str, Any]) -> CompiledOfferSet:
+    """Compila as ofertas do JSON de busca para reuso entre solver e diagnostico.
 
     Args:
-        pop: populacao atual.
-        distances: distancias de aglomeracao.
+        data: JSON completo com voos/hoteis/carros e meta.
 
     Returns:
-        Solucao vencedora.
+        Conjunto de ofertas compilado.
     """
-    a, b = random.sample(range(len(pop)), 2)
-    if pop[a]["rank"] < pop[b]["rank"]:
-        return pop[a]
-    if pop[b]["rank"] < pop[a]["rank"]:
-        return pop[b]
-    return pop[a] if distances.get(a, 0) >= distances.get(b, 0) else pop[b]
+    return CompiledOfferSet.from_data(data)
 
 
-def _evaluate_solution(groups: List[Dict[str, Any]], choice: List[int]) -> Dict[str, Any]:
+def _evaluate_solution(offers: CompiledOfferSet, groups: List[Dict[str, Any]], choice: List[int]) -> Dict[str, Any]:
     """Avalia uma solucao calculando objetivos e selecoes.
 
     Args:
+        offers: ofertas compiladas.
         groups: grupos de decisao (transporte/hotel).
         choice: indices escolhidos por grupo.
 
@@ -298,111 +481,1894 @@ def _evaluate_solution(groups: List[Dict[str, Any]], choice: List[int]) -> Dict[
     flights = []
     hotels = []
     cars = []
-    total_cost = 0.0
-    total_duration = 0.0
-    for idx, group in enumerate(groups):
-        option = group["options"][choice[idx]]
-        if group["type"] == "transport":
-            if option.get("_kind") == "car":
-                cars.append(option)
-                total_cost += float(option.get("price_total") or 0) + float(option.get("_fuel_cost") or 0)
-            else:
-                flights.append(option)
-                total_cost += float(option.get("price") or 0)
-            total_duration += float(option.get("_duration_hours") or 0.0)
-        elif group["type"] == "hotel":
-            hotels.append(option)
-            total_cost += float(option.get("price_total") or 0)
+    rows = [int(group["rows"][choice[idx]]) for idx, group in enumerate(groups)]
+    for row in rows:
+        kind = offers.kind[row]
+        if kind == _KIND_FLIGHT:
+            flights.append(offers.option(row))
+        elif kind == _KIND_HOTEL:
+            hotels.append(offers.option(row))
         else:
-            cars.append(option)
-            total_cost += float(option.get("price_total") or 0)
+            cars.append(offers.option(row))
     return {
         "choices": choice,
         "selections": {"flights": flights, "hotels": hotels, "cars": cars},
         "objectives": {
-            "cost_total": round(total_cost, 2),
-            "flight_duration_hours": round(total_duration, 2),
+            "cost_total": round(float(offers.cost[rows].sum()), 2),
+            "flight_duration_hours": round(float(offers.duration[rows].sum()), 2),
         },
     }
 
 
-def _build_transport_options(
-    leg: Dict[str, Any],
-    flight_index: Dict[Tuple[str, str, str], List[Dict[str, Any]]],
-    car_index: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]],
+def _compile_groups(offers: CompiledOfferSet, groups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compila os grupos em matrizes NumPy de custo e duracao (grupo x opcao).
+
+    As linhas menores que a maior cardinalidade sao preenchidas com zero; os
+    indices validos de cada grupo sao limitados por ``upper``.
+
+    Args:
+        offers: ofertas compiladas.
+        groups: grupos de decisao (transporte/hotel).
+
+    Returns:
+        Dicionario com matrizes "cost"/"duration" e vetores "lower"/"upper".
+    """
+    sizes = [len(group["rows"]) for group in groups]
+    width = max(sizes) if sizes else 0
+    cost = np.zeros((len(groups), width), dtype=float)
+    duration = np.zeros((len(groups), width), dtype=float)
+    for gi, group in enumerate(groups):
+        cost[gi, : sizes[gi]] = offers.cost[group["rows"]]
+        duration[gi, : sizes[gi]] = offers.duration[group["rows"]]
+    return {
+        "cost": cost,
+        "duration": duration,
+        "lower": np.zeros(len(groups), dtype=int),
+        "upper": np.array(sizes, dtype=int) - 1,
+    }
+
+
+def _decode_choices(compiled: Dict[str, Any], X: Any) -> np.ndarray:
+    """Arredonda e limita vetores de decisao continuos para indices validos.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        X: matriz (ou vetor) de decisao vinda do otimizador.
+
+    Returns:
+        Matriz inteira (n_solucoes x n_grupos).
+    """
+    X_int = np.rint(np.atleast_2d(X)).astype(int)
+    return np.clip(X_int, compiled["lower"], compiled["upper"])
+
+
+def _evaluate_batch(compiled: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Avalia uma populacao inteira de escolhas em uma unica indexacao vetorizada.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        X: matriz inteira de escolhas (n_solucoes x n_grupos).
+
+    Returns:
+        Matriz (n_solucoes x 2) com custo total e duracao total.
+    """
+    rows = np.arange(compiled["cost"].shape[0])
+    cost = compiled["cost"][rows, X].sum(axis=1)
+    duration = compiled["duration"][rows, X].sum(axis=1)
+    return np.round(np.column_stack([cost, duration]), 2)
+
+
+class EvaluationCache:
+    """Memo LRU de avaliacoes indexado pela tupla de escolhas arredondadas.
+
+    Serve tanto para problemas em lote (``evaluate``) quanto elementwise
+    (``evaluate_one``). Linhas repetidas dentro do mesmo lote contam como
+    acerto; apenas as combinacoes ineditas chamam a funcao de avaliacao.
+    """
+
+    def __init__(self, evaluate: Callable[[np.ndarray], np.ndarray], max_size: int = 10000):
+        """Cria o cache.
+
+        Args:
+            evaluate: funcao que avalia uma matriz inteira de escolhas.
+            max_size: numero maximo de combinacoes guardadas.
+        """
+        self._evaluate = evaluate
+        self.max_size = max_size
+        self._store: "OrderedDict[Tuple[int, ...], np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, X: np.ndarray) -> np.ndarray:
+        """Avalia uma matriz de escolhas reaproveitando resultados ja vistos.
+
+        Args:
+            X: matriz inteira (n_solucoes x n_grupos).
+
+        Returns:
+            Matriz de objetivos na mesma ordem de ``X``.
+        """
+        unique, inverse = np.unique(X, axis=0, return_inverse=True)
+        keys = [tuple(row) for row in unique.tolist()]
+        values: List[Optional[np.ndarray]] = []
+        missing: List[int] = []
+        for idx, key in enumerate(keys):
+            cached = self._store.get(key)
+            if cached is None:
+                missing.append(idx)
+            else:
+                self._store.move_to_end(key)
+            values.append(cached)
+        if missing:
+            fresh = self._evaluate(unique[missing])
+            for idx, value in zip(missing, fresh):
+                values[idx] = value
+                self._store[keys[idx]] = value
+            while len(self._store) > self.max_size:
+                self._store.popitem(last=False)
+        self.misses += len(missing)
+        self.hits += len(X) - len(missing)
+        return np.array(values)[np.ravel(inverse)]
+
+    def evaluate_one(self, x: Sequence[int]) -> np.ndarray:
+        """Avalia uma unica escolha (uso em problemas elementwise).
+
+        Args:
+            x: vetor inteiro de escolhas.
+
+        Returns:
+            Vetor de objetivos.
+        """
+        return self.evaluate(np.atleast_2d(np.asarray(x, dtype=int)))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Resume acertos/faltas do cache.
+
+        Returns:
+            Dicionario com hits, misses, hit_rate e size.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._store),
+        }
+
+
+class WarmStartStore:
+    """Populacoes finais do NSGA-II por cenario, para semear novas execucoes.
+
+    A chave e a assinatura dos grupos do cenario (tipo + chave de cada
+    perna/estada) e cada individuo e guardado como assinaturas de oferta
+    (``CompiledOfferSet.signature``), nao como indices: assim ele continua
+    valido quando a busca e refeita com precos novos, outros viajantes ou
+    outra preferencia. Mantem os ``max_size`` cenarios usados mais
+    recentemente. Com ``path``, o conteudo e lido desse arquivo JSON na
+    criacao e regravado (de forma atomica) por ``flush``.
+    """
+
+    def __init__(self, max_size: int = 32, path: Optional[str] = None):
+        """Cria o armazenamento.
+
+        Args:
+            max_size: numero maximo de cenarios guardados.
+            path: arquivo JSON de persistencia (None mantem so em memoria).
+        """
+        self.max_size = max_size
+        self.path = path
+        self._store: "OrderedDict[Tuple[Hashable, ...], List[Tuple[Tuple[str, ...], ...]]]" = OrderedDict()
+        self._digest: Optional[str] = None
+        self._dirty = False
+        if path:
+            self._load(path)
+
+    @staticmethod
+    def scenario_key(groups: List[Dict[str, Any]]) -> Tuple[Hashable, ...]:
+        """Monta a chave de um cenario a partir dos seus grupos.
+
+        Args:
+            groups: grupos de decisao (transporte/hotel).
+
+        Returns:
+            Tupla de (tipo, chave) por grupo.
+        """
+        return tuple((group["type"], group["key"]) for group in groups)
+
+    def save(self, offers: CompiledOfferSet, groups: List[Dict[str, Any]], X: np.ndarray) -> None:
+        """Guarda a populacao final de um cenario.
+
+        Args:
+            offers: ofertas compiladas.
+            groups: grupos de decisao do cenario.
+            X: matriz inteira de escolhas (populacao final).
+        """
+        if not len(X):
+            return
+        key = self.scenario_key(groups)
+        individuals = []
+        for x in np.unique(np.asarray(X, dtype=int), axis=0).tolist():
+            individuals.append(tuple(offers.signature(int(groups[g]["rows"][idx])) for g, idx in enumerate(x)))
+        self._store[key] = individuals
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_size:
+            self._store.popitem(last=False)
+        self._digest = None
+        self._dirty = True
+
+    def initial(
+        self,
+        offers: CompiledOfferSet,
+        groups: List[Dict[str, Any]],
+        compiled: Dict[str, Any],
+        size: int,
+        seed: int,
+    ) -> Tuple[Optional[np.ndarray], int]:
+        """Monta a populacao inicial com os individuos ainda validos.
+
+        Um individuo guardado e valido se todas as ofertas escolhidas ainda
+        existem nos grupos atuais; o restante da populacao e sorteado.
+
+        Args:
+            offers: ofertas compiladas.
+            groups: grupos de decisao do cenario.
+            compiled: grupos compilados do cenario.
+            size: tamanho da populacao.
+            seed: semente do sorteio complementar.
+
+        Returns:
+            Tupla (populacao inicial ou None sem historico, individuos reaproveitados).
+        """
+        individuals = self._store.get(self.scenario_key(groups))
+        if not individuals:
+            return None, 0
+        positions = []
+        for group in groups:
+            lookup: Dict[Tuple[str, ...], int] = {}
+            for idx, row in enumerate(group["rows"].tolist()):
+                lookup.setdefault(offers.signature(row), idx)
+            positions.append(lookup)
+        seeded = []
+        for individual in individuals:
+            x = [positions[g].get(signature) for g, signature in enumerate(individual)]
+            if None not in x:
+                seeded.append(x)
+            if len(seeded) >= size:
+                break
+        if not seeded:
+            return None, 0
+        rng = np.random.default_rng(seed)
+        filler = rng.integers(compiled["lower"], compiled["upper"] + 1, size=(size - len(seeded), len(groups)))
+        return np.vstack([np.array(seeded, dtype=int).reshape(-1, len(groups)), filler]), len(seeded)
+
+    def digest(self) -> str:
+        """Resume o conteudo atual (entra na chave do cache de frentes).
+
+        Duas execucoes com o mesmo digest partem do mesmo historico e, com a
+        mesma semente, chegam a mesma frente.
+
+        Returns:
+            Hash sha1 hexadecimal dos cenarios e individuos guardados.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha1(self._dumps().encode("utf-8")).hexdigest()
+        return self._digest
+
+    def flush(self) -> None:
+        """Grava o conteudo em ``path`` se houve alteracao desde a ultima gravacao.
+
+        Falhas de escrita apenas deixam o historico em memoria.
+
+        Returns:
+            None.
+        """
+        if not self.path or not self._dirty:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as handle:
+                handle.write(self._dumps())
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as exc:
+            add_log(f"[solver] Nao foi possivel gravar o warm start em {self.path}: {exc}")
+
+    def _dumps(self) -> str:
+        """Serializa o conteudo em JSON (ordem LRU preservada)."""
+        return json.dumps([[list(key), individuals] for key, individuals in self._store.items()])
+
+    def _load(self, path: str) -> None:
+        """Carrega o conteudo gravado por ``flush`` (arquivo ausente/invalido e ignorado)."""
+        try:
+            with open(path, encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            return
+        for key, individuals in entries[-self.max_size:] if self.max_size else []:
+            self._store[_as_tuple(key)] = [_as_tuple(individual) for individual in individuals]
+
+
+def _as_tuple(value: Any) -> Any:
+    """Converte listas aninhadas (vindas do JSON) de volta em tuplas."""
+    if isinstance(value, list):
+        return tuple(_as_tuple(item) for item in value)
+    return value
+
+
+_WARM_STARTS: Optional[WarmStartStore] = None
+
+
+def _warm_start_store() -> Optional[WarmStartStore]:
+    """Retorna o armazenamento de warm start do processo (None se desativado).
+
+    Returns:
+        ``WarmStartStore`` com config.SOLVER_WARM_START_SIZE cenarios, lido de
+        config.SOLVER_WARM_START_PATH na primeira chamada.
+    """
+    global _WARM_STARTS
+    size = getattr(config, "SOLVER_WARM_START_SIZE", 0)
+    if not size:
+        return None
+    path = getattr(config, "SOLVER_WARM_START_PATH", None)
+    if _WARM_STARTS is None or _WARM_STARTS.path != path:
+        _WARM_STARTS = WarmStartStore(size, path)
+    _WARM_STARTS.max_size = size
+    return _WARM_STARTS
+
+
+def _add_stats(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """Soma contadores numericos de ``source`` em ``target``.
+
+    Args:
+        target: dicionario acumulador.
+        source: contadores a somar.
+
+    Returns:
+        None.
+    """
+    for key, value in source.items():
+        if isinstance(value, (int, float)):
+            target[key] = target.get(key, 0) + value
+
+
+def _nondominated_mask(F: np.ndarray) -> np.ndarray:
+    """Marca os pontos nao dominados de uma matriz de 2 objetivos (minimizacao).
+
+    Ordena por (custo, duracao) e varre mantendo a menor duracao ja vista,
+    em O(N log N). Pontos repetidos mantem apenas a primeira ocorrencia.
+
+    Args:
+        F: matriz (n x 2) de objetivos.
+
+    Returns:
+        Vetor booleano com True para os pontos nao dominados.
+    """
+    mask = np.zeros(len(F), dtype=bool)
+    if not len(F):
+        return mask
+    order = np.lexsort((F[:, 1], F[:, 0]))
+    durations = F[order, 1]
+    best_before = np.minimum.accumulate(np.concatenate(([np.inf], durations[:-1])))
+    mask[order[durations < best_before]] = True
+    return mask
+
+
+def _is_dominated(point: Tuple[float, float], archive: np.ndarray) -> bool:
+    """Verifica se algum ponto do arquivo domina o ponto informado.
+
+    Args:
+        point: objetivos (custo, duracao).
+        archive: matriz (n x 2) de objetivos ja encontrados.
+
+    Returns:
+        True se o ponto e dominado por algum elemento do arquivo.
+    """
+    if not len(archive):
+        return False
+    target = np.asarray(point, dtype=float)
+    not_worse = np.all(archive <= target, axis=1)
+    better = np.any(archive < target, axis=1)
+    return bool(np.any(not_worse & better))
+
+
+def _fast_nondominated_sort(F: np.ndarray) -> List[np.ndarray]:
+    """Ordenacao nao-dominada para 2 objetivos em O(N log N).
+
+    Percorre os pontos ordenados por (custo, duracao) e coloca cada um na
+    primeira frente cuja ultima duracao e maior que a sua (busca binaria);
+    pontos repetidos ficam na mesma frente.
+
+    Args:
+        F: matriz (n x 2) de objetivos.
+
+    Returns:
+        Lista de frentes (vetores de indices), da melhor para a pior.
+    """
+    order = np.lexsort((F[:, 1], F[:, 0]))
+    tails: List[float] = []
+    fronts: List[List[int]] = []
+    previous: Optional[Tuple[float, float]] = None
+    previous_front = 0
+    for idx in order.tolist():
+        point = (float(F[idx, 0]), float(F[idx, 1]))
+        if point == previous:
+            front = previous_front
+        else:
+            front = bisect.bisect_right(tails, point[1])
+            if front == len(tails):
+                tails.append(point[1])
+                fronts.append([])
+            else:
+                tails[front] = point[1]
+        fronts[front].append(idx)
+        previous, previous_front = point, front
+    return [np.array(front, dtype=int) for front in fronts]
+
+
+def _crowding_distance(F: np.ndarray) -> np.ndarray:
+    """Calcula a distancia de aglomeracao de uma frente.
+
+    Args:
+        F: matriz (n x m) de objetivos de uma mesma frente.
+
+    Returns:
+        Vetor de distancias (extremos recebem infinito).
+    """
+    n = len(F)
+    distance = np.zeros(n, dtype=float)
+    if n <= 2:
+        distance[:] = np.inf
+        return distance
+    for k in range(F.shape[1]):
+        order = np.argsort(F[:, k], kind="stable")
+        values = F[order, k]
+        distance[order[0]] = distance[order[-1]] = np.inf
+        span = values[-1] - values[0]
+        if span == 0:
+            continue
+        distance[order[1:-1]] += (values[2:] - values[:-2]) / span
+    return distance
+
+
+class ParetoArchive:
+    """Arquivo de solucoes nao dominadas para 2 objetivos (minimizacao).
+
+    A insercao filtra a uniao arquivo + candidatos com a varredura ordenada de
+    ``_nondominated_mask``; candidatos com chave (tupla de escolhas) ja vista
+    sao ignorados. Com ``max_size`` definido, os pontos de menor distancia
+    de aglomeracao sao descartados (os extremos sempre permanecem).
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        """Cria um arquivo vazio.
+
+        Args:
+            max_size: tamanho maximo do arquivo; None para ilimitado.
+        """
+        self.max_size = max_size
+        self._F = np.zeros((0, 2), dtype=float)
+        self._keys: List[Hashable] = []
+        self._payloads: List[Any] = []
+        self._seen: set = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, F: np.ndarray, keys: Sequence[Hashable], payloads: Optional[Sequence[Any]] = None) -> int:
+        """Insere candidatos mantendo apenas os nao dominados.
+
+        Args:
+            F: matriz (n x 2) de objetivos dos candidatos.
+            keys: chave hashable de cada candidato (ex.: tupla de escolhas).
+            payloads: dado associado a cada candidato.
+
+        Returns:
+            Quantidade de candidatos que permaneceram no arquivo.
+        """
+        payloads = list(payloads) if payloads is not None else [None] * len(keys)
+        fresh = []
+        for idx, key in enumerate(keys):
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            fresh.append(idx)
+        if not fresh:
+            return 0
+        size = len(self._keys)
+        merged_F = np.vstack([self._F, np.asarray(F, dtype=float)[fresh]])
+        merged_keys = self._keys + [keys[idx] for idx in fresh]
+        merged_payloads = self._payloads + [payloads[idx] for idx in fresh]
+        keep = np.flatnonzero(_nondominated_mask(merged_F))
+        if self.max_size is not None and len(keep) > self.max_size:
+            distance = _crowding_distance(merged_F[keep])
+            keep = np.sort(keep[np.argsort(-distance, kind="stable")[: self.max_size]])
+        self._F = merged_F[keep]
+        self._keys = [merged_keys[idx] for idx in keep]
+        self._payloads = [merged_payloads[idx] for idx in keep]
+        return int(np.count_nonzero(keep >= size))
+
+    def dominates(self, point: Tuple[float, float]) -> bool:
+        """Indica se algum ponto do arquivo domina o ponto informado.
+
+        Args:
+            point: objetivos (custo, duracao).
+
+        Returns:
+            True se o ponto e dominado pelo arquivo.
+        """
+        return _is_dominated(point, self._F)
+
+    def objectives(self) -> np.ndarray:
+        """Retorna uma copia da matriz de objetivos do arquivo.
+
+        Returns:
+            Matriz (n x 2) de objetivos.
+        """
+        return self._F.copy()
+
+    def items(self) -> List[Tuple[Tuple[float, float], Hashable, Any]]:
+        """Lista os elementos do arquivo em ordem de insercao.
+
+        Returns:
+            Tuplas ((custo, duracao), chave, payload).
+        """
+        return [
+            ((float(f[0]), float(f[1])), key, payload)
+            for f, key, payload in zip(self._F, self._keys, self._payloads)
+        ]
+
+
+def _exact_pareto_front(compiled: Dict[str, Any], stats: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """Calcula a frente de Pareto exata combinando os grupos um a um.
+
+    Como custo e duracao sao somas sobre grupos independentes, a frente do
+    cenario e obtida somando a frente parcial com as opcoes nao dominadas do
+    proximo grupo e descartando as somas parciais dominadas.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        stats: acumulador opcional; recebe em "evaluations" o numero de
+            somas parciais avaliadas.
+
+    Returns:
+        Matriz inteira de escolhas da frente exata.
+    """
+    front_F = np.zeros((1, 2), dtype=float)
+    evaluated = 0
+    front_X = np.zeros((1, 0), dtype=int)
+    for g, upper in enumerate(compiled["upper"]):
+        option_F = np.column_stack([compiled["cost"][g, : upper + 1], compiled["duration"][g, : upper + 1]])
+        options = np.flatnonzero(_nondominated_mask(option_F))
+        F = (front_F[:, None, :] + option_F[options][None, :, :]).reshape(-1, 2)
+        evaluated += len(F)
+        # Arredonda somas parciais para evitar falsos empates por ponto flutuante
+        F = np.round(F, 6)
+        parents = np.repeat(np.arange(len(front_F)), len(options))
+        chosen = np.tile(options, len(front_F))
+        keep = _nondominated_mask(F)
+        front_F = F[keep]
+        front_X = np.column_stack([front_X[parents[keep]], chosen[keep]])
+    if stats is not None:
+        _add_stats(stats, {"evaluations": evaluated})
+    return front_X
+
+
+def _ideal_point(compiled: Dict[str, Any]) -> Tuple[float, float]:
+    """Calcula o ponto ideal (limite inferior) de um cenario compilado.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+
+    Returns:
+        Tupla (soma dos custos minimos, soma das duracoes minimas) por grupo.
+    """
+    cost = 0.0
+    duration = 0.0
+    for g, upper in enumerate(compiled["upper"]):
+        cost += float(compiled["cost"][g, : upper + 1].min())
+        duration += float(compiled["duration"][g, : upper + 1].min())
+    return round(cost, 2), round(duration, 2)
+
+
+def _search_space_size(compiled: Dict[str, Any]) -> int:
+    """Calcula o numero de combinacoes possiveis de um cenario compilado.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+
+    Returns:
+        Produto das cardinalidades dos grupos.
+    """
+    return math.prod(int(upper) + 1 for upper in compiled["upper"])
+
+
+def _enumerate_front(compiled: Dict[str, Any]) -> np.ndarray:
+    """Avalia todas as combinacoes de um cenario pequeno e filtra a frente.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+
+    Returns:
+        Matriz inteira de escolhas da frente exata.
+    """
+    sizes = [int(upper) + 1 for upper in compiled["upper"]]
+    X = np.indices(sizes).reshape(len(sizes), -1).T
+    return X[_nondominated_mask(_evaluate_batch(compiled, X))]
+
+
+def _kbest_choices(compiled: Dict[str, Any], k: int, primary: str) -> np.ndarray:
+    """Enumera de forma preguicosa as k melhores combinacoes por um objetivo.
+
+    Cada grupo e ordenado por (objetivo principal, desempate); partindo da
+    combinacao com o melhor de cada grupo, uma fila de prioridade avanca uma
+    posicao por vez em grupos de indice >= ao ultimo alterado, o que gera cada
+    combinacao uma unica vez e em ordem crescente da chave.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        k: quantidade de combinacoes desejadas.
+        primary: "cost" ou "duration" (o outro objetivo desempata).
+
+    Returns:
+        Matriz inteira (ate k x n_grupos) de escolhas em ordem crescente.
+    """
+    first, second = (compiled["cost"], compiled["duration"])
+    if primary == "duration":
+        first, second = second, first
+    orders: List[np.ndarray] = []
+    values: List[List[Tuple[float, float]]] = []
+    for g, upper in enumerate(compiled["upper"]):
+        main = first[g, : upper + 1]
+        tie = second[g, : upper + 1]
+        order = np.lexsort((tie, main))
+        orders.append(order)
+        values.append(list(zip(main[order].tolist(), tie[order].tolist())))
+
+    def _key(state: Tuple[int, ...]) -> Tuple[float, float]:
+        return (
+            round(sum(values[g][i][0] for g, i in enumerate(state)), 6),
+            round(sum(values[g][i][1] for g, i in enumerate(state)), 6),
+        )
+
+    n_groups = len(orders)
+    start = (0,) * n_groups
+    heap = [(_key(start), start, 0)]
+    chosen: List[List[int]] = []
+    while heap and len(chosen) < k:
+        _, state, last = heapq.heappop(heap)
+        chosen.append([int(orders[g][i]) for g, i in enumerate(state)])
+        for j in range(last, n_groups):
+            if state[j] + 1 < len(orders[j]):
+                child = state[:j] + (state[j] + 1,) + state[j + 1 :]
+                heapq.heappush(heap, (_key(child), child, j))
+    return np.array(chosen, dtype=int).reshape(-1, n_groups)
+
+
+def _solve_kbest(
+    offers: CompiledOfferSet,
+    prepared: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]],
+    preference: str,
+    max_solutions: int,
 ) -> List[Dict[str, Any]]:
-    """Monta opcoes de transporte (voo ou carro) para uma perna.
+    """Caminho exato para preferencias "price"/"duration" (k melhores globais).
+
+    Os cenarios sao visitados pelo ponto ideal na chave da preferencia; assim
+    que o ponto ideal de um cenario nao supera a k-esima melhor solucao ja
+    encontrada, os demais cenarios sao descartados.
+
+    Args:
+        offers: ofertas compiladas.
+        prepared: tuplas (cenario, grupos, compilado, ponto ideal).
+        preference: "price" ou "duration".
+        max_solutions: limite de solucoes retornadas.
+
+    Returns:
+        Lista de solucoes ordenadas pela chave da preferencia.
+    """
+    primary = "duration" if preference == "duration" else "cost"
+
+    def _sort_key(objectives: Tuple[float, float]) -> Tuple[float, float]:
+        return (objectives[1], objectives[0]) if primary == "duration" else objectives
+
+    ranked: List[Tuple[Tuple[float, float], int, Dict[str, Any], List[Dict[str, Any]], List[int]]] = []
+    for position, (scenario, groups, compiled, ideal) in enumerate(sorted(prepared, key=lambda item: _sort_key(item[3]))):
+        if len(ranked) >= max_solutions and _sort_key(ideal) >= ranked[max_solutions - 1][0]:
+            break
+        X = _kbest_choices(compiled, max_solutions, primary)
+        F = _evaluate_batch(compiled, X)
+        for x, f in zip(X, F):
+            ranked.append((_sort_key((float(f[0]), float(f[1]))), position, scenario, groups, x.tolist()))
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        del ranked[max_solutions:]
+
+    results: List[Dict[str, Any]] = []
+    for _, _, scenario, groups, choice in ranked:
+        sol = _evaluate_solution(offers, groups, choice)
+        results.append(
+            {
+                "scenario_order": scenario.get("order", []),
+                "objectives": sol["objectives"],
+                "selections": sol["selections"],
+            }
+        )
+    return results
+
+
+def _hypervolume_2d(F: np.ndarray, reference: Tuple[float, float]) -> float:
+    """Calcula o hipervolume (area dominada) de pontos com 2 objetivos.
 
     Args:
-        leg: perna com origem/destino/datas.
-        flight_index: indice de voos.
-        car_index: indice de carros.
+        F: matriz (n x 2) de objetivos (minimizacao).
+        reference: ponto de referencia (pior que todos os pontos de interesse).
 
     Returns:
-        Lista de opcoes de transporte.
+        Area dominada pelos pontos e limitada pela referencia.
     """
-    key_flight = (leg["origin"], leg["destination"], _date_key(leg["departure"]))
-    key_car = (
-        leg["origin"],
-        leg["destination"],
-        _date_key(leg["departure"]),
-        _date_key(leg["arrival"]),
+    F = np.asarray(F, dtype=float).reshape(-1, 2)
+    F = F[(F[:, 0] < reference[0]) & (F[:, 1] < reference[1])]
+    if not len(F):
+        return 0.0
+    F = F[_nondominated_mask(F)]
+    F = F[np.argsort(F[:, 0])]
+    widths = np.diff(np.append(F[:, 0], reference[0]))
+    return float(np.sum(widths * (reference[1] - F[:, 1])))
+
+
+def _reference_point(compiled: Dict[str, Any]) -> Tuple[float, float]:
+    """Ponto de referencia do hipervolume de um cenario (pior custo e pior duracao).
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+
+    Returns:
+        Tupla (soma dos custos maximos, soma das duracoes maximas) por grupo.
+    """
+    cost = 0.0
+    duration = 0.0
+    for g, upper in enumerate(compiled["upper"]):
+        cost += float(compiled["cost"][g, : upper + 1].max())
+        duration += float(compiled["duration"][g, : upper + 1].max())
+    return cost, duration
+
+
+def _igd(F: np.ndarray, reference_F: np.ndarray, scale: Tuple[float, float]) -> float:
+    """Distancia geracional invertida: media da distancia de cada ponto da
+    frente de referencia ao ponto encontrado mais proximo.
+
+    Args:
+        F: objetivos encontrados (n x 2).
+        reference_F: objetivos da frente exata (m x 2).
+        scale: amplitude de cada objetivo para normalizar as distancias.
+
+    Returns:
+        IGD normalizado (0 = frente exata encontrada).
+    """
+    F = np.asarray(F, dtype=float).reshape(-1, 2)
+    if not len(F) or not len(reference_F):
+        return float("inf") if len(reference_F) else 0.0
+    scale_arr = np.where(np.asarray(scale, dtype=float) > 0, scale, 1.0)
+    diff = (reference_F[:, None, :] - F[None, :, :]) / scale_arr
+    return float(np.sqrt((diff**2).sum(axis=2)).min(axis=1).mean())
+
+
+def _scenario_tracer(compiled: Dict[str, Any], points: List[Dict[str, Any]]) -> Callable[[int, np.ndarray, int], None]:
+    """Cria o registrador de convergencia de um cenario.
+
+    Cada chamada acrescenta em ``points`` a geracao, as avaliacoes
+    acumuladas, o tempo decorrido (sem o custo da propria medicao), o menor
+    custo, o hipervolume (referencia = ``_reference_point``) e o IGD frente
+    a frente exata do cenario.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        points: lista que recebe um dicionario por chamada.
+
+    Returns:
+        Funcao (geracao, objetivos da frente atual, avaliacoes acumuladas).
+    """
+    reference = _reference_point(compiled)
+    ideal = _ideal_point(compiled)
+    scale = (reference[0] - ideal[0], reference[1] - ideal[1])
+    exact_F = _evaluate_batch(compiled, _exact_pareto_front(compiled))
+    # O tempo gasto medindo (hipervolume/IGD) nao entra em "seconds"
+    clock = {"started": time.perf_counter(), "overhead": 0.0}
+
+    def _record(generation: int, F: np.ndarray, evaluations: int) -> None:
+        now = time.perf_counter()
+        F = np.asarray(F, dtype=float).reshape(-1, 2)
+        points.append(
+            {
+                "generation": int(generation),
+                "evaluations": int(evaluations),
+                "seconds": round(now - clock["started"] - clock["overhead"], 4),
+                "best_cost": round(float(F[:, 0].min()), 2) if len(F) else None,
+                "hypervolume": round(_hypervolume_2d(F, reference), 4),
+                "igd": round(_igd(F, exact_F, scale), 6),
+            }
+        )
+        clock["overhead"] += time.perf_counter() - now
+
+    return _record
+
+
+def _categorical_operators(mode: str) -> Tuple[Any, Any]:
+    """Cria operadores de cruzamento/mutacao para genes categoricos.
+
+    Os genes sao indices de opcao sem ordem (a opcao 3 nao fica "entre" 2 e
+    4), entao o cruzamento troca genes inteiros e a mutacao sorteia uma nova
+    opcao do grupo.
+
+    Args:
+        mode: "uniform" (troca gene a gene) ou "group_swap" (troca um bloco
+            contiguo de grupos entre os pais).
+
+    Returns:
+        Tupla (crossover, mutation) do pymoo.
+    """
+    from pymoo.core.crossover import Crossover
+    from pymoo.core.mutation import Mutation
+
+    class CategoricalCrossover(Crossover):
+        def __init__(self, prob=0.9):
+            super().__init__(2, 2, prob=prob)
+
+        def _do(self, problem, X, **kwargs):
+            _, n_matings, n_var = X.shape
+            if mode == "group_swap":
+                bounds = np.sort(np.random.randint(0, n_var + 1, size=(n_matings, 2)), axis=1)
+                columns = np.arange(n_var)
+                mask = (columns >= bounds[:, :1]) & (columns < bounds[:, 1:])
+            else:
+                mask = np.random.random((n_matings, n_var)) < 0.5
+            Y = X.copy()
+            Y[0][mask] = X[1][mask]
+            Y[1][mask] = X[0][mask]
+            return Y
+
+    class ResetMutation(Mutation):
+        def _do(self, problem, X, **kwargs):
+            X = np.rint(X).astype(int)
+            prob_var = self.get_prob_var(problem, size=len(X))
+            mask = np.random.random(X.shape) < prob_var[:, None]
+            fresh = np.random.randint(problem.xl, problem.xu + 1, size=X.shape)
+            X[mask] = fresh[mask]
+            return X
+
+    return CategoricalCrossover(), ResetMutation()
+
+
+def _nsga2_steps(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+    initial: Optional[np.ndarray] = None,
+    operators: Optional[str] = None,
+    initial_objectives: Optional[np.ndarray] = None,
+) -> Iterator[Any]:
+    """Executa o NSGA-II do pymoo sobre um cenario compilado, geracao a geracao.
+
+    A avaliacao e feita em lote (``Problem`` nao elementwise), pontuando a
+    populacao inteira com ``_evaluate_batch`` a cada geracao. Com
+    config.SOLVER_EVAL_CACHE_SIZE > 0, genomas repetidos saem de um
+    ``EvaluationCache``. Os contadores do cache vao para ``stats`` quando o
+    gerador termina ou e fechado.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        population_size: tamanho da populacao.
+        generations: numero de geracoes.
+        seed: semente para reproducibilidade.
+        stats: acumulador opcional de contadores (cache_hits/cache_misses).
+        initial: populacao inicial (matriz inteira); amostragem aleatoria
+            quando None.
+        operators: "integer" (SBX/polinomial inteiros), "uniform" ou
+            "group_swap" (operadores categoricos); usa config.SOLVER_OPERATORS
+            quando None.
+        initial_objectives: objetivos ja conhecidos de ``initial``; esses
+            individuos nao sao reavaliados (a geracao 1 fica sem avaliacoes).
+
+    Yields:
+        O algoritmo do pymoo ao fim de cada geracao (``n_gen``, ``opt``,
+        ``pop``, ``result()``).
+    """
+    try:
+        from pymoo.algorithms.moo.nsga2 import NSGA2
+        from pymoo.core.problem import Problem
+    except Exception as exc:
+        raise RuntimeError(
+            "pymoo nao instalado. Instale com: pip install -r requirements.txt"
+        ) from exc
+
+    try:
+        from pymoo.operators.sampling.rnd import IntegerRandomSampling
+    except Exception:
+        IntegerRandomSampling = None
+    try:
+        from pymoo.operators.crossover.sbx import IntegerSBX
+    except Exception:
+        IntegerSBX = None
+    try:
+        from pymoo.operators.mutation.pm import IntegerPolynomialMutation
+    except Exception:
+        IntegerPolynomialMutation = None
+
+    cache_size = getattr(config, "SOLVER_EVAL_CACHE_SIZE", 0)
+    cache = EvaluationCache(lambda X: _evaluate_batch(compiled, X), cache_size) if cache_size else None
+    evaluated = [0]
+
+    class TravelProblem(Problem):
+        def __init__(self):
+            super().__init__(
+                n_var=len(compiled["upper"]),
+                n_obj=2,
+                xl=compiled["lower"],
+                xu=compiled["upper"],
+                vtype=int,
+            )
+
+        def _evaluate(self, x, out, *args, **kwargs):
+            X = _decode_choices(compiled, x)
+            evaluated[0] += len(X)
+            out["F"] = cache.evaluate(X) if cache else _evaluate_batch(compiled, X)
+
+    algo_kwargs = {"pop_size": population_size}
+    if initial is not None and len(initial) and initial_objectives is not None:
+        from pymoo.core.population import Population
+
+        sampling = Population.new("X", np.asarray(initial, dtype=float), "F", np.asarray(initial_objectives, dtype=float))
+        sampling.apply(lambda ind: ind.evaluated.update(("F", "G", "H")))
+        algo_kwargs["sampling"] = sampling
+    elif initial is not None and len(initial):
+        algo_kwargs["sampling"] = np.asarray(initial, dtype=float)
+    elif IntegerRandomSampling:
+        algo_kwargs["sampling"] = IntegerRandomSampling()
+    operators = operators or getattr(config, "SOLVER_OPERATORS", "integer")
+    if operators in ("uniform", "group_swap"):
+        algo_kwargs["crossover"], algo_kwargs["mutation"] = _categorical_operators(operators)
+    else:
+        if IntegerSBX:
+            algo_kwargs["crossover"] = IntegerSBX(prob=0.9, eta=15)
+        if IntegerPolynomialMutation:
+            algo_kwargs["mutation"] = IntegerPolynomialMutation(eta=20)
+
+    algorithm = NSGA2(**algo_kwargs)
+    algorithm.setup(TravelProblem(), termination=("n_gen", generations), seed=seed, verbose=False)
+    try:
+        while algorithm.has_next():
+            algorithm.next()
+            yield algorithm
+    finally:
+        if stats is not None:
+            _add_stats(stats, {"evaluations": evaluated[0]})
+        if cache and stats is not None:
+            _add_stats(stats, {"cache_hits": cache.hits, "cache_misses": cache.misses})
+
+
+def _run_nsga2(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+    initial: Optional[np.ndarray] = None,
+    operators: Optional[str] = None,
+    on_generation: Optional[Callable[[int, np.ndarray, int], None]] = None,
+    initial_objectives: Optional[np.ndarray] = None,
+    objectives: Optional[List[np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Executa o NSGA-II ate o fim e devolve a frente e a populacao final.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        population_size: tamanho da populacao.
+        generations: numero de geracoes.
+        seed: semente para reproducibilidade.
+        stats: acumulador opcional de contadores (cache_hits/cache_misses).
+        initial: populacao inicial; ver ``_nsga2_steps``.
+        operators: operadores geneticos; ver ``_nsga2_steps``.
+        on_generation: funcao chamada ao fim de cada geracao com (numero da
+            geracao, objetivos da frente atual, avaliacoes acumuladas).
+        initial_objectives: objetivos de ``initial``; ver ``_nsga2_steps``.
+        objectives: lista que recebe os objetivos da populacao final.
+
+    Returns:
+        Tupla (escolhas da frente final, populacao final), ambas inteiras.
+    """
+    algorithm = None
+    steps = _nsga2_steps(compiled, population_size, generations, seed, stats, initial, operators, initial_objectives)
+    for generation, algorithm in enumerate(steps, start=1):
+        if on_generation:
+            on_generation(generation, algorithm.opt.get("F"), algorithm.evaluator.n_eval)
+    empty = np.zeros((0, len(compiled["upper"])), dtype=int)
+    if algorithm is None:
+        return empty, empty
+    res = algorithm.result()
+    population = _decode_choices(compiled, res.pop.get("X")) if res.pop is not None else empty
+    if objectives is not None:
+        objectives.append(res.pop.get("F") if res.pop is not None else np.zeros((0, 2)))
+    if res.X is None:
+        return empty, population
+    return _decode_choices(compiled, res.X), population
+
+
+SolverEngine = Callable[[Dict[str, Any], int, int, int, Optional[Dict[str, Any]]], np.ndarray]
+
+ENGINES: Dict[str, SolverEngine] = {}
+
+
+def register_engine(name: str) -> Callable[[SolverEngine], SolverEngine]:
+    """Registra um motor de otimizacao sob um nome (uso como decorador).
+
+    Um motor recebe (compilado, populacao, geracoes, semente, stats) e
+    devolve a matriz inteira de escolhas da frente encontrada; deve somar em
+    ``stats["evaluations"]`` quantas combinacoes avaliou.
+
+    Args:
+        name: nome usado em config.SOLVER_ENGINE / ``engine=``.
+
+    Returns:
+        Decorador que registra e devolve a funcao.
+    """
+
+    def _register(engine: SolverEngine) -> SolverEngine:
+        ENGINES[name] = engine
+        return engine
+
+    return _register
+
+
+def get_engine(name: str) -> SolverEngine:
+    """Busca um motor registrado.
+
+    Args:
+        name: nome do motor.
+
+    Returns:
+        Funcao do motor.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Motor de otimizacao desconhecido: {name!r}. Opcoes: {', '.join(sorted(ENGINES))}")
+    return ENGINES[name]
+
+
+@register_engine("nsga2")
+def _engine_nsga2(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """Motor NSGA-II (pymoo) de populacao unica."""
+    return _run_nsga2(compiled, population_size, generations, seed, stats)[0]
+
+
+@register_engine("exact")
+def _engine_exact(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """Motor de frente exata por combinacao de frentes parciais."""
+    return _exact_pareto_front(compiled, stats)
+
+
+@register_engine("enumerate")
+def _engine_enumerate(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """Motor de forca bruta (todas as combinacoes; apenas espacos pequenos)."""
+    if stats is not None:
+        _add_stats(stats, {"evaluations": _search_space_size(compiled)})
+    return _enumerate_front(compiled)
+
+
+@register_engine("random")
+def _engine_random(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """Motor de referencia: amostra aleatoria com o mesmo orcamento do NSGA-II."""
+    rng = np.random.default_rng(seed)
+    samples = population_size * generations
+    X = np.unique(rng.integers(compiled["lower"], compiled["upper"] + 1, size=(samples, len(compiled["upper"]))), axis=0)
+    if stats is not None:
+        _add_stats(stats, {"evaluations": samples})
+    return X[_nondominated_mask(_evaluate_batch(compiled, X))]
+
+
+def _select_best(compiled: Dict[str, Any], X: np.ndarray, n: int, F: Optional[np.ndarray] = None) -> np.ndarray:
+    """Seleciona os n melhores individuos por (frente, crowding distance).
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        X: matriz inteira de escolhas.
+        n: quantidade desejada.
+        F: objetivos ja conhecidos de ``X``; avaliados quando None.
+
+    Returns:
+        Indices (em ``X``) de ate n individuos.
+    """
+    if F is None:
+        F = _evaluate_batch(compiled, X)
+    chosen: List[int] = []
+    for front in _fast_nondominated_sort(F):
+        if len(chosen) + len(front) <= n:
+            chosen.extend(front.tolist())
+            continue
+        distance = _crowding_distance(F[front])
+        chosen.extend(front[np.argsort(-distance, kind="stable")[: n - len(chosen)]].tolist())
+        break
+    return np.array(chosen, dtype=int)
+
+
+def _island_epoch(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    initial: Optional[np.ndarray],
+    initial_objectives: Optional[np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Roda algumas geracoes de uma ilha (executado em processo filho).
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        population_size: tamanho da populacao da ilha.
+        generations: geracoes desta epoca.
+        seed: semente da ilha nesta epoca.
+        initial: populacao vinda da epoca anterior (None na primeira).
+        initial_objectives: objetivos de ``initial`` (nao reavaliados).
+
+    Returns:
+        Tupla (populacao final, objetivos da populacao, contadores).
+    """
+    stats: Dict[str, Any] = {}
+    objectives: List[np.ndarray] = []
+    _, population = _run_nsga2(
+        compiled, population_size, generations, seed, stats, initial,
+        initial_objectives=initial_objectives, objectives=objectives,
+    )
+    return population, objectives[0] if objectives else np.zeros((0, 2)), stats
+
+
+def _process_pool(tasks: int) -> Any:
+    """Cria o ProcessPoolExecutor do solver (ate config.SOLVER_MAX_WORKERS).
+
+    Args:
+        tasks: maior numero de tarefas simultaneas esperado.
+
+    Returns:
+        Executor com min(processos, tarefas) processos.
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = getattr(config, "SOLVER_MAX_WORKERS", None) or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=max(1, min(workers, tasks)))
+
+
+def _run_islands(
+    compiled: Dict[str, Any],
+    population_size: int,
+    generations: int,
+    seed: int,
+    islands: int,
+    stats: Optional[Dict[str, Any]] = None,
+    executor: Optional[Any] = None,
+) -> np.ndarray:
+    """Executa o NSGA-II em modelo de ilhas com migracao periodica.
+
+    O orcamento do cenario (populacao x geracoes) e dividido entre as ilhas:
+    cada uma evolui uma populacao de ``population_size / islands`` (minimo
+    ``_MIN_POPULATION``) em um processo com semente propria. A cada
+    config.SOLVER_MIGRATION_INTERVAL geracoes, os config.SOLVER_MIGRANTS
+    melhores individuos de cada ilha migram para a proxima (anel) e
+    competem pela sobrevivencia na populacao destino. Populacoes e migrantes
+    levam seus objetivos, entao nao sao reavaliados entre epocas. No fim, as
+    populacoes das ilhas sao unidas em uma unica frente.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        population_size: populacao de referencia do cenario.
+        generations: geracoes de referencia do cenario.
+        seed: semente base (cada ilha usa uma derivada).
+        islands: numero de ilhas.
+        stats: acumulador opcional de contadores do solver.
+        executor: ProcessPoolExecutor reaproveitado; cria um proprio quando
+            None.
+
+    Returns:
+        Matriz inteira de escolhas da frente combinada.
+    """
+    interval = max(1, int(getattr(config, "SOLVER_MIGRATION_INTERVAL", 10)))
+    migrants = max(0, int(getattr(config, "SOLVER_MIGRANTS", 5)))
+    island_size = max(_MIN_POPULATION, population_size // islands)
+    island_generations = max(1, population_size * generations // (island_size * islands))
+    pool = executor if executor is not None else _process_pool(islands)
+    populations: List[Optional[np.ndarray]] = [None] * islands
+    objectives: List[Optional[np.ndarray]] = [None] * islands
+    try:
+        done = 0
+        epoch = 0
+        while done < island_generations:
+            n_gen = min(interval, island_generations - done)
+            # Populacao ja avaliada: a geracao 1 do pymoo nao gera filhos
+            futures = [
+                pool.submit(
+                    _island_epoch,
+                    compiled,
+                    island_size,
+                    n_gen if populations[island] is None else n_gen + 1,
+                    seed + 1000 * island + epoch,
+                    populations[island],
+                    objectives[island],
+                )
+                for island in range(islands)
+            ]
+            outcomes = [future.result() for future in futures]
+            populations = [population for population, _, _ in outcomes]
+            objectives = [F for _, F, _ in outcomes]
+            for _, _, island_stats in outcomes:
+                if stats is not None:
+                    _add_stats(stats, island_stats)
+            done += n_gen
+            epoch += 1
+            if done < island_generations and migrants and islands > 1:
+                best = [_select_best(compiled, X, migrants, F) for X, F in zip(populations, objectives)]
+                merged = [
+                    (
+                        np.vstack([populations[island], populations[island - 1][best[island - 1]]]),
+                        np.vstack([objectives[island], objectives[island - 1][best[island - 1]]]),
+                    )
+                    for island in range(islands)
+                ]
+                keep = [_select_best(compiled, X, island_size, F) for X, F in merged]
+                populations = [X[idx] for (X, _), idx in zip(merged, keep)]
+                objectives = [F[idx] for (_, F), idx in zip(merged, keep)]
+    finally:
+        if executor is None:
+            pool.shutdown()
+    if not populations or populations[0] is None:
+        return np.zeros((0, len(compiled["upper"])), dtype=int)
+    X, unique = np.unique(np.vstack(populations), axis=0, return_index=True)
+    F = np.vstack(objectives)[unique]
+    return X[_nondominated_mask(F)]
+
+
+def _uses_ga(compiled: Dict[str, Any], engine: str, evaluations: int = 0) -> bool:
+    """Indica se o cenario sera resolvido pelo NSGA-II (e nao enumerado).
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        engine: nome do motor (so "nsga2" usa o GA).
+        evaluations: orcamento de avaliacoes do cenario (``_allocate_budgets``).
+
+    Returns:
+        True se o espaco de busca excede config.SOLVER_ENUMERATION_LIMIT e o
+        orcamento do cenario.
+    """
+    limit = max(getattr(config, "SOLVER_ENUMERATION_LIMIT", 0), evaluations)
+    return engine == "nsga2" and _search_space_size(compiled) > limit
+
+
+def _scenario_budgets(
+    prepared: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]],
+    population_size: int,
+    generations: int,
+    stats: Dict[str, Any],
+) -> List[Tuple[int, int, int]]:
+    """Define (populacao, geracoes, avaliacoes) de cada cenario conforme config.
+
+    Com config.SOLVER_BUDGET_ALLOCATION desligado, todos os cenarios recebem
+    ``population_size``/``generations``. O resumo vai para ``stats["budget"]``.
+
+    Args:
+        prepared: cenarios preparados por ``_prepare_scenarios``.
+        population_size: populacao de referencia (NSGA-II).
+        generations: geracoes de referencia (NSGA-II).
+        stats: dicionario ``meta.solver_stats``.
+
+    Returns:
+        Tupla (populacao, geracoes, avaliacoes) por cenario.
+    """
+    if not getattr(config, "SOLVER_BUDGET_ALLOCATION", False):
+        stats.pop("budget", None)
+        return [(population_size, generations, 0)] * len(prepared)
+    budgets = _allocate_budgets(
+        prepared, population_size, generations, getattr(config, "SOLVER_EVALUATION_BUDGET", None)
     )
-    options = []
-    for item in flight_index.get(key_flight, []):
-        copy_item = dict(item)
-        copy_item["_kind"] = "flight"
-        copy_item["_duration_hours"] = _parse_time_range(copy_item.get("details", {}).get("times", ""))
-        options.append(copy_item)
-    for item in car_index.get(key_car, []):
-        copy_item = dict(item)
-        copy_item["_kind"] = "car"
-        copy_item["_duration_hours"] = float(leg.get("drive_time_hours") or 0.0)
-        fuel_cost = float(leg.get("drive_distance_km") or 0.0) * config.CAR_FUEL_COST_PER_KM
-        copy_item["_fuel_cost"] = round(fuel_cost, 2)
-        details = dict(copy_item.get("details") or {})
-        details["fuel_cost"] = round(fuel_cost, 2)
-        copy_item["details"] = details
-        options.append(copy_item)
-    return options
+    stats["budget"] = {
+        "evaluations": sum(evaluations for _, _, evaluations in budgets),
+        "exhaustive": sum(
+            1 for (_, _, compiled, _), (_, _, evaluations) in zip(prepared, budgets)
+            if not _uses_ga(compiled, "nsga2", evaluations)
+        ),
+    }
+    return budgets
+
+
+_MIN_POPULATION = 10
+
+
+def _allocate_budgets(
+    prepared: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]],
+    population_size: int,
+    generations: int,
+    total: Optional[int] = None,
+) -> List[Tuple[int, int, int]]:
+    """Divide um orcamento total de avaliacoes entre os cenarios.
+
+    Cenarios que cabem em config.SOLVER_ENUMERATION_LIMIT sao enumerados fora
+    do orcamento. O orcamento vai para os demais proporcionalmente a
+    log(1 + tamanho do espaco) x promessa, sendo a promessa (entre 0.5 e 1)
+    maior quanto melhor o ponto ideal do cenario frente aos outros. Cenarios
+    cuja fatia cobre todo o espaco passam a ser enumerados e a sobra e
+    redistribuida. Nenhum cenario do GA fica abaixo de populacao x geracoes
+    (o orcamento sem alocacao), mesmo que o total seja excedido.
+
+    Args:
+        prepared: cenarios preparados por ``_prepare_scenarios``.
+        population_size: populacao de referencia (NSGA-II).
+        generations: geracoes de referencia (NSGA-II).
+        total: orcamento total dos cenarios que precisam do GA; None usa
+            populacao x geracoes por cenario (o mesmo total sem alocacao).
+
+    Returns:
+        Tupla (populacao, geracoes, avaliacoes) por cenario, na ordem de
+        ``prepared``.
+    """
+    limit = getattr(config, "SOLVER_ENUMERATION_LIMIT", 0)
+    sizes = [_search_space_size(compiled) for _, _, compiled, _ in prepared]
+    budgets: List[Tuple[int, int, int]] = [(population_size, generations, size) for size in sizes]
+    pending = [idx for idx, size in enumerate(sizes) if size > limit]
+    if not pending:
+        return budgets
+    # No pymoo a populacao inicial conta como a geracao 1
+    floor = population_size * generations
+    remaining = floor * len(pending) if total is None else total
+
+    ideals = np.array([prepared[idx][3] for idx in pending], dtype=float)
+    span = np.ptp(ideals, axis=0)
+    distance = ((ideals - ideals.min(axis=0)) / np.where(span > 0, span, 1.0)).sum(axis=1)
+    weight = {
+        idx: math.log1p(sizes[idx]) * (1.0 - distance[pos] / 4.0) for pos, idx in enumerate(pending)
+    }
+    while pending:
+        total_weight = sum(weight[idx] for idx in pending)
+        exhaustive = [idx for idx in pending if remaining * weight[idx] / total_weight >= sizes[idx]]
+        if not exhaustive:
+            break
+        for idx in exhaustive:
+            remaining -= sizes[idx]
+            pending.remove(idx)
+    if pending:
+        total_weight = sum(weight[idx] for idx in pending)
+        for idx in pending:
+            evaluations = max(int(remaining * weight[idx] / total_weight), floor, 2 * _MIN_POPULATION)
+            population = int(np.clip(round(math.sqrt(evaluations)), _MIN_POPULATION, 2 * population_size))
+            n_gen = max(1, -(-evaluations // population))
+            budgets[idx] = (population, n_gen, population * n_gen)
+    return budgets
+
+
+def _solve_compiled(
+    compiled: Dict[str, Any],
+    engine: str,
+    population_size: int,
+    generations: int,
+    seed: int,
+    stats: Optional[Dict[str, Any]] = None,
+    islands: int = 1,
+    initial: Optional[np.ndarray] = None,
+    final: Optional[List[np.ndarray]] = None,
+    evaluations: int = 0,
+    trace: Optional[List[Dict[str, Any]]] = None,
+    executor: Optional[Any] = None,
+) -> np.ndarray:
+    """Resolve um cenario compilado com o motor escolhido.
+
+    Motores diferentes de "nsga2" sao chamados direto do registro
+    (``ENGINES``). No motor "nsga2", cenarios com ate config.SOLVER_ENUMERATION_LIMIT
+    combinacoes (ou ate ``evaluations``) sao enumerados por completo em vez de rodar o GA; os demais
+    usam o modelo de ilhas quando ``islands`` > 1.
+
+    Args:
+        compiled: grupos compilados por ``_compile_groups``.
+        engine: nome de um motor registrado em ``ENGINES``.
+        population_size: tamanho da populacao (NSGA-II).
+        generations: numero de geracoes (NSGA-II).
+        seed: semente para reproducibilidade (NSGA-II).
+        stats: acumulador opcional de contadores do solver.
+        islands: numero de ilhas do NSGA-II (1 = populacao unica).
+        initial: populacao inicial do NSGA-II de populacao unica.
+        final: lista que recebe a populacao final do NSGA-II de populacao
+            unica (para warm start).
+        evaluations: orcamento de avaliacoes; o cenario e enumerado quando
+            o espaco de busca cabe nele.
+        trace: lista que recebe os pontos de convergencia
+            (``_scenario_tracer``): um por geracao no NSGA-II de populacao
+            unica, um unico ponto final nos demais casos.
+        executor: ProcessPoolExecutor compartilhado pelas ilhas.
+
+    Returns:
+        Matriz inteira de escolhas da frente encontrada.
+    """
+    tracer = _scenario_tracer(compiled, trace) if trace is not None else None
+    if engine == "nsga2" and _uses_ga(compiled, engine, evaluations) and islands <= 1:
+        front, population = _run_nsga2(
+            compiled, population_size, generations, seed, stats, initial, on_generation=tracer
+        )
+        if final is not None:
+            final.append(population)
+        return front
+    counters: Dict[str, Any] = {}
+    if engine != "nsga2":
+        X = get_engine(engine)(compiled, population_size, generations, seed, counters)
+    elif not _uses_ga(compiled, engine, evaluations):
+        X = get_engine("enumerate")(compiled, population_size, generations, seed, counters)
+    else:
+        X = _run_islands(compiled, population_size, generations, seed, islands, counters, executor)
+    if stats is not None:
+        _add_stats(stats, counters)
+    if tracer:
+        F = _evaluate_batch(compiled, X) if len(X) else np.zeros((0, 2))
+        tracer(generations if _uses_ga(compiled, engine, evaluations) else 1, F, counters.get("evaluations", 0))
+    return X
+
+
+def _solve_shared_scenario(
+    shm_name: str,
+    total_size: int,
+    offset: int,
+    upper: List[int],
+    width: int,
+    engine: str,
+    population_size: int,
+    generations: int,
+    seed: int,
+    evaluations: int = 0,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Resolve, em um processo filho, um cenario lido da memoria compartilhada.
+
+    O bloco do cenario fica em ``offset`` com layout (2, n_grupos, width):
+    custos seguidos das duracoes.
+
+    Args:
+        shm_name: nome do bloco de memoria compartilhada.
+        total_size: quantidade total de floats do bloco.
+        offset: posicao inicial do cenario no bloco.
+        upper: maior indice valido por grupo.
+        width: largura (maior cardinalidade) das matrizes do cenario.
+        engine: nome de um motor registrado em ``ENGINES``.
+        population_size: tamanho da populacao (NSGA-II).
+        generations: numero de geracoes (NSGA-II).
+        seed: semente para reproducibilidade (NSGA-II).
+        evaluations: orcamento de avaliacoes do cenario.
+
+    Returns:
+        Tupla (matriz de escolhas da frente, contadores do solver).
+    """
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffer = np.ndarray((total_size,), dtype=float, buffer=shm.buf)
+        n_groups = len(upper)
+        block = buffer[offset : offset + 2 * n_groups * width].reshape(2, n_groups, width)
+        compiled = {
+            "cost": block[0],
+            "duration": block[1],
+            "lower": np.zeros(n_groups, dtype=int),
+            "upper": np.array(upper, dtype=int),
+        }
+        stats: Dict[str, Any] = {}
+        X = _solve_compiled(compiled, engine, population_size, generations, seed, stats, evaluations=evaluations)
+        del compiled, block, buffer
+        return X, stats
+    finally:
+        shm.close()
+
+
+def _solve_scenarios_parallel(
+    compiled_list: List[Dict[str, Any]],
+    engine: str,
+    budgets: List[Tuple[int, int, int]],
+    seed: int,
+    executor: Optional[Any] = None,
+) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """Resolve varios cenarios em paralelo com ProcessPoolExecutor.
+
+    As matrizes compiladas de todos os cenarios sao copiadas uma unica vez
+    para um bloco de memoria compartilhada; cada tarefa recebe apenas o nome
+    do bloco e o deslocamento do seu cenario.
+
+    Args:
+        compiled_list: cenarios compilados por ``_compile_groups``.
+        engine: nome de um motor registrado em ``ENGINES``.
+        budgets: (populacao, geracoes, avaliacoes) por cenario.
+        seed: semente para reproducibilidade (NSGA-II).
+        executor: ProcessPoolExecutor reaproveitado; cria um proprio
+            (``_process_pool``) quando None.
+
+    Returns:
+        Tuplas (matriz de escolhas, contadores) na ordem de ``compiled_list``.
+    """
+    from multiprocessing import shared_memory
+
+    offsets = []
+    total_size = 0
+    for compiled in compiled_list:
+        offsets.append(total_size)
+        total_size += 2 * compiled["cost"].size
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total_size) * np.dtype(float).itemsize)
+    try:
+        buffer = np.ndarray((total_size,), dtype=float, buffer=shm.buf)
+        for compiled, offset in zip(compiled_list, offsets):
+            size = compiled["cost"].size
+            buffer[offset : offset + size] = compiled["cost"].ravel()
+            buffer[offset + size : offset + 2 * size] = compiled["duration"].ravel()
+        del buffer
+        pool = executor if executor is not None else _process_pool(len(compiled_list))
+        try:
+            futures = [
+                pool.submit(
+                    _solve_shared_scenario,
+                    shm.name,
+                    total_size,
+                    offset,
+                    compiled["upper"].tolist(),
+                    compiled["cost"].shape[1],
+                    engine,
+                    population,
+                    n_gen,
+                    seed,
+                    evaluations,
+                )
+                for compiled, offset, (population, n_gen, evaluations) in zip(compiled_list, offsets, budgets)
+            ]
+            return [future.result() for future in futures]
+        finally:
+            if executor is None:
+                pool.shutdown()
+    finally:
+        shm.close()
+        shm.unlink()
 
 
 def _build_groups_for_scenario(
     scenario: Dict[str, Any],
     trip: Dict[str, Any],
-    flight_index: Dict[Tuple[str, str, str], List[Dict[str, Any]]],
-    hotel_index: Dict[Tuple[str, str, str], List[Dict[str, Any]]],
-    car_index: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]],
+    offers: CompiledOfferSet,
 ) -> List[Dict[str, Any]]:
     """Cria grupos de decisao para um cenario.
 
     Args:
         scenario: cenario com estadas.
         trip: dados de inicio/fim.
-        flight_index: indice de voos.
-        hotel_index: indice de hoteis.
-        car_index: indice de carros.
+        offers: ofertas compiladas.
 
     Returns:
-        Lista de grupos (transporte/hotel); vazia se incompleto.
+        Lista de grupos (transporte/hotel) com ids de linha; vazia se incompleto.
     """
     groups: List[Dict[str, Any]] = []
     stays = [s for s in scenario.get("stays", []) if s.get("type") == "main"]
     legs = _build_legs_from_stays(scenario.get("stays", []), trip)
     for leg in legs:
-        options = _build_transport_options(leg, flight_index, car_index)
-        if not options:
+        rows = offers.transport_rows(leg)
+        if not len(rows):
             return []
-        groups.append({"type": "transport", "key": (leg["origin"], leg["destination"]), "options": options})
+        groups.append({"type": "transport", "key": (leg["origin"], leg["destination"]), "rows": rows})
     for stay in stays:
-        key = (stay.get("location"), _date_key(stay.get("checkin")), _date_key(stay.get("checkout")))
-        options = hotel_index.get(key, [])
-        if not options:
+        rows = offers.hotel_rows(stay)
+        if not len(rows):
             return []
-        groups.append({"type": "hotel", "key": key, "options": options})
+        key = (stay.get("location"), _date_key(stay.get("checkin")), _date_key(stay.get("checkout")))
+        groups.append({"type": "hotel", "key": key, "rows": rows})
     return groups
 
 
+def _sort_group_options(offers: CompiledOfferSet, groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reordena as opcoes de cada grupo por custo crescente.
+
+    Com opcoes ordenadas, indices proximos representam opcoes de custo
+    proximo, o que da sentido aos operadores inteiros (SBX/polinomial).
+
+    Args:
+        offers: ofertas compiladas.
+        groups: grupos de decisao (transporte/hotel).
+
+    Returns:
+        Grupos reordenados; "kept" continua apontando para a lista original.
+    """
+    ordered: List[Dict[str, Any]] = []
+    for group in groups:
+        rows = group["rows"]
+        kept = group.get("kept", np.arange(len(rows)))
+        order = np.lexsort((offers.duration[rows], offers.cost[rows]))
+        ordered.append(dict(group, rows=rows[order], kept=kept[order]))
+    return ordered
+
+
+def rank_front(
+    front: List[Dict[str, Any]],
+    preference: str = "best",
+    weights: Optional[Tuple[float, float]] = None,
+) -> List[Dict[str, Any]]:
+    """Ordena solucoes conforme a preferencia do usuario.
+
+    Custa O(n log n) sobre a frente, sem resolver nada de novo: serve para
+    trocar a preferencia ou os pesos de uma frente ja calculada.
+
+    Args:
+        front: solucoes com "objectives".
+        preference: "best", "price" ou "duration".
+        weights: pesos (custo, duracao) do "best"; usa
+            config.NSGA_WEIGHT_COST/NSGA_WEIGHT_DURATION quando None.
+
+    Returns:
+        Nova lista ordenada.
+    """
+    if not front:
+        return []
+    if preference == "price":
+        return sorted(
+            front,
+            key=lambda s: (s["objectives"]["cost_total"], s["objectives"]["flight_duration_hours"]),
+        )
+    if preference == "duration":
+        return sorted(
+            front,
+            key=lambda s: (s["objectives"]["flight_duration_hours"], s["objectives"]["cost_total"]),
+        )
+    if weights is None:
+        weights = (getattr(config, "NSGA_WEIGHT_COST", 0.5), getattr(config, "NSGA_WEIGHT_DURATION", 0.5))
+    weight_cost, weight_duration = weights
+    min_cost = min(s["objectives"]["cost_total"] for s in front)
+    max_cost = max(s["objectives"]["cost_total"] for s in front)
+    min_dur = min(s["objectives"]["flight_duration_hours"] for s in front)
+    max_dur = max(s["objectives"]["flight_duration_hours"] for s in front)
+
+    def _score(sol: Dict[str, Any]) -> float:
+        cost = sol["objectives"]["cost_total"]
+        dur = sol["objectives"]["flight_duration_hours"]
+        norm_cost = 0.0 if max_cost == min_cost else (cost - min_cost) / (max_cost - min_cost)
+        norm_dur = 0.0 if max_dur == min_dur else (dur - min_dur) / (max_dur - min_dur)
+        return (weight_cost * norm_cost) + (weight_duration * norm_dur)
+
+    return sorted(front, key=_score)
+
+
+def _prune_dominated_options(
+    offers: CompiledOfferSet,
+    groups: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Remove de cada grupo as opcoes dominadas (mais caras e mais lentas).
+
+    Uma opcao dominada dentro do proprio grupo nunca participa de um
+    itinerario Pareto-otimo. Cada grupo podado guarda em "kept" as posicoes
+    das opcoes mantidas na lista original.
+
+    Args:
+        offers: ofertas compiladas.
+        groups: grupos de decisao (transporte/hotel).
+
+    Returns:
+        Tupla (grupos podados, contagem de opcoes antes/depois).
+    """
+    pruned: List[Dict[str, Any]] = []
+    before = 0
+    after = 0
+    for group in groups:
+        rows = group["rows"]
+        F = np.column_stack([offers.cost[rows], offers.duration[rows]])
+        kept = np.flatnonzero(_nondominated_mask(F))
+        pruned.append(dict(group, rows=rows[kept], kept=kept))
+        before += len(rows)
+        after += len(kept)
+    return pruned, {"options_before": before, "options_after": after}
+
+
+def _prepare_scenarios(
+    data: Dict[str, Any],
+    offers: CompiledOfferSet,
+    prune_options: bool,
+) -> Tuple[List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]], Dict[str, Any]]:
+    """Monta e compila os grupos de cada cenario viavel.
+
+    Args:
+        data: JSON completo com voos/hoteis/carros e meta.
+        offers: ofertas compiladas.
+        prune_options: remove opcoes dominadas dentro de cada grupo.
+
+    Returns:
+        Tupla (lista de (cenario, grupos, compilado, ponto ideal), contagens
+        de opcoes antes/depois da poda).
+    """
+    scenarios = data.get("meta", {}).get("scenarios", [])
+    trip = data.get("meta", {}).get("trip", {})
+    pruning = {"options_before": 0, "options_after": 0}
+    prepared = []
+    for scenario in scenarios:
+        groups = _build_groups_for_scenario(scenario, trip, offers)
+        if not groups:
+            continue
+        if prune_options:
+            groups, counts = _prune_dominated_options(offers, groups)
+        else:
+            total = sum(len(group["rows"]) for group in groups)
+            counts = {"options_before": total, "options_after": total}
+        for name, value in counts.items():
+            pruning[name] += value
+        if getattr(config, "SOLVER_SORT_OPTIONS", False):
+            groups = _sort_group_options(offers, groups)
+        compiled = _compile_groups(offers, groups)
+        prepared.append((scenario, groups, compiled, _ideal_point(compiled)))
+    pruning["pruned_ratio"] = (
+        round(1 - pruning["options_after"] / pruning["options_before"], 4) if pruning["options_before"] else 0.0
+    )
+    return prepared, pruning
+
+
+def _archive_front(
+    offers: CompiledOfferSet,
+    prepared: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]],
+    archive: ParetoArchive,
+) -> List[Dict[str, Any]]:
+    """Converte a frente global do arquivo em solucoes (sem ranking).
+
+    Selecoes (dicts) sao montadas apenas para a frente global final.
+
+    Args:
+        offers: ofertas compiladas.
+        prepared: cenarios preparados por ``_prepare_scenarios``.
+        archive: arquivo com payloads (posicao do cenario, escolhas).
+
+    Returns:
+        Lista de solucoes com objetivos e selecoes.
+    """
+    front = []
+    for _, _, (position, choice) in archive.items():
+        scenario, groups, _, _ = prepared[position]
+        sol = _evaluate_solution(offers, groups, choice)
+        front.append(
+            {
+                "scenario_order": scenario.get("order", []),
+                "objectives": sol["objectives"],
+                "selections": sol["selections"],
+            }
+        )
+    return front
+
+
+def _archive_solutions(
+    offers: CompiledOfferSet,
+    prepared: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any], Tuple[float, float]]],
+    archive: ParetoArchive,
+    preference: str,
+    max_solutions: int,
+) -> List[Dict[str, Any]]:
+    """Converte a frente global do arquivo em solucoes ranqueadas.
+
+    Args:
+        offers: ofertas compiladas.
+        prepared: cenarios preparados por ``_prepare_scenarios``.
+        archive: arquivo com payloads (posicao do cenario, escolhas).
+        preference: "best", "price" ou "duration".
+        max_solutions: limite de solucoes retornadas.
+
+    Returns:
+        Lista de solucoes com objetivos e selecoes.
+    """
+    return rank_front(_archive_front(offers, prepared, archive), preference)[:max_solutions]
+
+
+def _archive_add(
+    archive: ParetoArchive,
+    position: int,
+    groups: List[Dict[str, Any]],
+    compiled: Dict[str, Any],
+    X: np.ndarray,
+) -> int:
+    """Insere escolhas de um cenario no arquivo global.
+
+    A chave sao as linhas de oferta escolhidas, o que deduplica selecoes
+    iguais entre cenarios.
+
+    Args:
+        archive: arquivo de Pareto global.
+        position: indice do cenario em ``prepared``.
+        groups: grupos do cenario.
+        compiled: grupos compilados do cenario.
+        X: matriz inteira de escolhas.
+
+    Returns:
+        Quantidade de candidatos que permaneceram no arquivo.
+    """
+    if not len(X):
+        return 0
+    rows = np.column_stack([group["rows"][X[:, g]] for g, group in enumerate(groups)])
+    return archive.add(
+        _evaluate_batch(compiled, X),
+        [tuple(row) for row in rows.tolist()],
+        [(position, x) for x in X.tolist()],
+    )
+
+
+TRACE_CSV_COLUMNS = ("scenario", "order", "generation", "evaluations", "seconds", "best_cost", "hypervolume", "igd")
+
+
+def write_trace_csv(traces: List[Dict[str, Any]], path: str) -> None:
+    """Grava os traces de convergencia em CSV (uma linha por geracao).
+
+    Args:
+        traces: lista de ``meta.solver_stats.traces``.
+        path: caminho do arquivo CSV.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(TRACE_CSV_COLUMNS)
+        for scenario_idx, scenario_trace in enumerate(traces):
+            order = " -> ".join(scenario_trace.get("scenario_order", []))
+            for point in scenario_trace["points"]:
+                writer.writerow([scenario_idx, order] + [point[name] for name in TRACE_CSV_COLUMNS[2:]])
+
+
+_FRONT_CACHE: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+
+def _front_cache_key(offers: CompiledOfferSet, params: Tuple[Any, ...]) -> str:
+    """Monta a chave do cache de frentes.
+
+    A parte pesada (ofertas, cenarios e viagem) e a impressao digital das
+    ofertas, calculada uma vez por ``CompiledOfferSet``; a cada chamada so os
+    parametros sao serializados.
+
+    Args:
+        offers: ofertas compiladas.
+        params: argumentos e valores de config lidos pelo solver que
+            alteram a frente.
+
+    Returns:
+        Hash das ofertas, dos cenarios/viagem e dos parametros.
+    """
+    digest = hashlib.sha1(offers.fingerprint().encode("utf-8"))
+    digest.update(repr(params).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _cache_summary(counters: Dict[str, Any]) -> Dict[str, Any]:
+    """Resume os contadores do cache de avaliacoes.
+
+    Args:
+        counters: acumulador com cache_hits/cache_misses.
+
+    Returns:
+        Dicionario com hits, misses e hit_rate.
+    """
+    hits = counters.get("cache_hits", 0)
+    lookups = hits + counters.get("cache_misses", 0)
+    return {
+        "hits": hits,
+        "misses": counters.get("cache_misses", 0),
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+
 def solve_nsga2(
     data: Dict[str, Any],
     max_solutions: int = 3,
@@ -410,9 +2376,22 @@ def solve_nsga2(
     generations: int = 40,
     seed: int = 42,
     preference: str = "best",
+    engine: Optional[str] = None,
+    parallel: Optional[bool] = None,
+    prune_scenarios: Optional[bool] = None,
+    offers: Optional[CompiledOfferSet] = None,
+    prune_options: Optional[bool] = None,
+    islands: Optional[int] = None,
+    warm_start: Optional[bool] = None,
+    trace: Optional[bool] = None,
 ) -> List[Dict[str, Any]]:
     """Executa o NSGA-II via pymoo e retorna as melhores solucoes por preferencia.
 
+    Com config.SOLVER_FRONT_CACHE_SIZE > 0 a frente global completa fica em
+    cache pela impressao digital das ofertas/cenarios/parametros; repetir a
+    chamada com outra preferencia ("best") ou outros pesos so reordena a
+    frente com ``rank_front``. "price"/"duration" seguem pelo k-best exato.
+
     Args:
         data: JSON completo com voos/hoteis/carros e meta.
         max_solutions: limite de solucoes retornadas.
@@ -420,160 +2399,370 @@ def solve_nsga2(
         generations: numero de geracoes.
         seed: semente para reproducibilidade.
         preference: "best", "price" ou "duration".
+        engine: motor registrado em ``ENGINES`` ("nsga2", "exact",
+            "enumerate", "random"); usa config.SOLVER_ENGINE quando None.
+        parallel: resolve os cenarios em processos paralelos; usa
+            config.SOLVER_PARALLEL quando None.
+        prune_scenarios: processa cenarios pelo melhor ponto ideal e pula os
+            que ja sao dominados pelas solucoes encontradas; usa
+            config.SOLVER_PRUNE_SCENARIOS quando None.
+        offers: ofertas ja compiladas (``compile_offers``); compiladas a
+            partir de ``data`` quando None.
+        prune_options: remove opcoes dominadas dentro de cada grupo antes de
+            otimizar; usa config.SOLVER_PRUNE_OPTIONS quando None. As
+            contagens ficam em ``data["meta"]["solver_stats"]["pruning"]``.
+        islands: numero de ilhas do NSGA-II em processos paralelos (<= 1
+            desativa); usa config.SOLVER_ISLANDS quando None. Ignorado no
+            modo ``parallel``, que ja ocupa os processos com cenarios.
+        warm_start: semeia o NSGA-II com a populacao final da ultima execucao
+            do mesmo cenario (``WarmStartStore``) e guarda a nova; ativo
+            quando config.SOLVER_WARM_START_SIZE > 0 se None. Vale apenas
+            para cenarios resolvidos em sequencia com populacao unica.
+        trace: registra por cenario a convergencia (avaliacoes, tempo, menor
+            custo, hipervolume e IGD por geracao) em
+            ``data["meta"]["solver_stats"]["traces"]`` e, se
+            config.SOLVER_TRACE_CSV estiver definido, em CSV; usa
+            config.SOLVER_TRACE quando None. Ignora o cache de frentes e nao
+            se aplica ao modo ``parallel``.
 
     Returns:
         Lista de solucoes com objetivos e selecoes.
     """
-    try:
-        import numpy as np
-        from pymoo.algorithms.moo.nsga2 import NSGA2
-        from pymoo.core.problem import ElementwiseProblem
-        from pymoo.optimize import minimize
-    except Exception as exc:
-        raise RuntimeError(
-            "pymoo nao instalado. Instale com: pip install -r requirements.txt"
-        ) from exc
-
-    try:
-        from pymoo.operators.sampling.rnd import IntegerRandomSampling
-    except Exception:
-        IntegerRandomSampling = None
-    try:
-        from pymoo.operators.crossover.sbx import IntegerSBX
-    except Exception:
-        IntegerSBX = None
-    try:
-        from pymoo.operators.mutation.pm import IntegerPolynomialMutation
-    except Exception:
-        IntegerPolynomialMutation = None
-
-    scenarios = data.get("meta", {}).get("scenarios", [])
-    trip = data.get("meta", {}).get("trip", {})
-    flight_index = _index_flights(data)
-    hotel_index = _index_hotels(data)
-    car_index = _index_cars(data)
-    results: List[Dict[str, Any]] = []
-    seen_selection_keys = set()
-
-    for scenario in scenarios:
-        groups = _build_groups_for_scenario(scenario, trip, flight_index, hotel_index, car_index)
-        if not groups:
-            continue
+    if offers is None:
+        offers = compile_offers(data)
+    engine = engine or getattr(config, "SOLVER_ENGINE", "nsga2")
+    get_engine(engine)  # falha cedo com nome de motor invalido
+    if parallel is None:
+        parallel = getattr(config, "SOLVER_PARALLEL", False)
+    if prune_scenarios is None:
+        prune_scenarios = getattr(config, "SOLVER_PRUNE_SCENARIOS", True)
+    if prune_options is None:
+        prune_options = getattr(config, "SOLVER_PRUNE_OPTIONS", True)
+    if islands is None:
+        islands = getattr(config, "SOLVER_ISLANDS", 1)
+    if trace is None:
+        trace = getattr(config, "SOLVER_TRACE", False)
+    trace = trace and not parallel
+    warm = _warm_start_store() if warm_start is not False else None
+    fast_path = preference in ("price", "duration") and getattr(config, "SOLVER_KBEST_FAST_PATH", True)
+    cache_size = getattr(config, "SOLVER_FRONT_CACHE_SIZE", 0)
+    front_key = None
+    if cache_size and not fast_path and not trace:
+        params = (
+            engine,
+            population_size,
+            generations,
+            seed,
+            prune_scenarios,
+            prune_options,
+            islands,
+            parallel,
+            warm.digest() if warm is not None else None,
+            getattr(config, "SOLVER_OPERATORS", "integer"),
+            getattr(config, "SOLVER_BUDGET_ALLOCATION", False),
+            getattr(config, "SOLVER_EVALUATION_BUDGET", None),
+            getattr(config, "SOLVER_ENUMERATION_LIMIT", 0),
+            getattr(config, "SOLVER_ARCHIVE_SIZE", None),
+            getattr(config, "SOLVER_SORT_OPTIONS", False),
+            getattr(config, "SOLVER_MIGRATION_INTERVAL", 10),
+            getattr(config, "SOLVER_MIGRANTS", 5),
+        )
+        front_key = _front_cache_key(offers, params)
+        front = _FRONT_CACHE.get(front_key)
+        stats = data.setdefault("meta", {}).setdefault("solver_stats", {})
+        stats["front_cache"] = {"hit": front is not None, "front_size": len(front) if front is not None else 0}
+        if front is not None:
+            # Mesma frente: trocar preferencia/pesos so reordena
+            _FRONT_CACHE.move_to_end(front_key)
+            return copy.deepcopy(rank_front(front, preference)[:max_solutions])
+    prepared, pruning = _prepare_scenarios(data, offers, prune_options and not fast_path)
+    data.setdefault("meta", {}).setdefault("solver_stats", {})["pruning"] = pruning
+    if fast_path:
+        # Problema separavel: os k melhores por uma chave sao exatos sem pymoo
+        data["meta"]["solver_stats"].pop("front_cache", None)
+        return _solve_kbest(offers, prepared, preference, max_solutions)
+    if prune_scenarios:
+        # Melhor limite primeiro: cenarios promissores alimentam o arquivo cedo
+        prepared.sort(key=lambda item: item[3])
+    budgets = _scenario_budgets(prepared, population_size, generations, data["meta"]["solver_stats"])
+
+    # Um unico pool de processos por busca (cenarios em paralelo ou ilhas)
+    tasks = len(prepared) if parallel and len(prepared) > 1 else (islands if islands > 1 else 0)
+    with _process_pool(tasks) if tasks else contextlib.nullcontext() as executor:
+        fronts: Optional[List[Tuple[np.ndarray, Dict[str, Any]]]] = None
+        if parallel and len(prepared) > 1:
+            fronts = _solve_scenarios_parallel(
+                [compiled for _, _, compiled, _ in prepared],
+                engine,
+                budgets,
+                seed,
+                executor,
+            )
 
-        xu = np.array([len(group["options"]) - 1 for group in groups], dtype=int)
-        xl = np.zeros(len(groups), dtype=int)
-
-        class TravelProblem(ElementwiseProblem):
-            def __init__(self):
-                super().__init__(
-                    n_var=len(groups),
-                    n_obj=2,
-                    xl=xl,
-                    xu=xu,
-                    vtype=int,
+        archive = ParetoArchive(max_size=getattr(config, "SOLVER_ARCHIVE_SIZE", None))
+        counters: Dict[str, Any] = {}
+        traces: List[Dict[str, Any]] = []
+        for position, (scenario, groups, compiled, ideal) in enumerate(prepared):
+            if prune_scenarios and archive.dominates(ideal):
+                continue
+            population, n_gen, evaluations = budgets[position]
+            points: Optional[List[Dict[str, Any]]] = [] if trace else None
+            if fronts is not None:
+                X, scenario_stats = fronts[position]
+                _add_stats(counters, scenario_stats)
+            else:
+                initial = None
+                final: Optional[List[np.ndarray]] = None
+                if warm and islands <= 1 and _uses_ga(compiled, engine, evaluations):
+                    initial, reused = warm.initial(offers, groups, compiled, population, seed)
+                    _add_stats(counters, {"warm_scenarios": int(reused > 0), "warm_individuals": reused})
+                    final = []
+                X = _solve_compiled(
+                    compiled, engine, population, n_gen, seed, counters, islands, initial, final, evaluations, points,
+                    executor,
                 )
-
-            def _evaluate(self, x, out, *args, **kwargs):
-                x_int = np.rint(x).astype(int)
-                x_int = np.clip(x_int, xl, xu)
-                sol = _evaluate_solution(groups, x_int.tolist())
-                out["F"] = np.array(
-                    [
-                        sol["objectives"]["cost_total"],
-                        sol["objectives"]["flight_duration_hours"],
-                    ],
-                    dtype=float,
+                if final:
+                    warm.save(offers, groups, final[0])
+            if points is not None:
+                traces.append(
+                    {
+                        "scenario_order": scenario.get("order", []),
+                        "population_size": population,
+                        "generations": n_gen,
+                        "points": points,
+                    }
                 )
+            _archive_add(archive, position, groups, compiled, X)
 
-        algo_kwargs = {"pop_size": population_size}
-        if IntegerRandomSampling:
-            algo_kwargs["sampling"] = IntegerRandomSampling()
-        if IntegerSBX:
-            algo_kwargs["crossover"] = IntegerSBX(prob=0.9, eta=15)
-        if IntegerPolynomialMutation:
-            algo_kwargs["mutation"] = IntegerPolynomialMutation(eta=20)
+    data["meta"]["solver_stats"]["evaluations"] = counters.get("evaluations", 0)
+    data["meta"]["solver_stats"]["eval_cache"] = _cache_summary(counters)
+    data["meta"]["solver_stats"]["warm_start"] = {
+        "scenarios": counters.get("warm_scenarios", 0),
+        "individuals": counters.get("warm_individuals", 0),
+    }
+    if warm is not None:
+        warm.flush()
+    if trace:
+        data["meta"]["solver_stats"]["traces"] = traces
+        if getattr(config, "SOLVER_TRACE_CSV", None):
+            write_trace_csv(traces, config.SOLVER_TRACE_CSV)
+    else:
+        data["meta"]["solver_stats"].pop("traces", None)
+    front = _archive_front(offers, prepared, archive)
+    if front_key is not None:
+        # Copia propria: quem recebe as solucoes pode altera-las
+        _FRONT_CACHE[front_key] = copy.deepcopy(front)
+        data["meta"]["solver_stats"]["front_cache"]["front_size"] = len(front)
+        while len(_FRONT_CACHE) > cache_size:
+            _FRONT_CACHE.popitem(last=False)
+    return rank_front(front, preference)[:max_solutions]
+
+
+def solve_nsga2_anytime(
+    data: Dict[str, Any],
+    max_solutions: int = 3,
+    population_size: int = 50,
+    generations: int = 40,
+    seed: int = 42,
+    preference: str = "best",
+    engine: Optional[str] = None,
+    deadline: Optional[float] = None,
+    stagnation_generations: Optional[int] = None,
+    stagnation_tolerance: Optional[float] = None,
+    prune_scenarios: Optional[bool] = None,
+    offers: Optional[CompiledOfferSet] = None,
+    prune_options: Optional[bool] = None,
+    warm_start: Optional[bool] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Versao "anytime" de ``solve_nsga2``: gera a frente global parcial.
+
+    Cenarios enumeraveis (ou todos, com motores diferentes de "nsga2") sao
+    resolvidos primeiro, do melhor ponto ideal para o pior, com uma entrega
+    apos cada um. Os demais avancam uma geracao do NSGA-II por vez, em rodizio entre cenarios, com
+    uma entrega sempre que o arquivo global muda. A execucao para no prazo,
+    quando o hipervolume do arquivo estagna ou ao fim das geracoes; o
+    motivo fica em ``data["meta"]["solver_stats"]["anytime"]``; o total de
+    avaliacoes em ``["evaluations"]`` e atualizado a cada rodada.
+
+    O prazo conta a partir do fim da compilacao das ofertas e so e checado
+    depois da primeira frente avaliada, entao ha sempre ao menos uma entrega;
+    ao parar, o arquivo final e entregue se mudou desde a ultima entrega.
 
-        algorithm = NSGA2(**algo_kwargs)
-        res = minimize(
-            TravelProblem(),
-            algorithm,
-            ("n_gen", generations),
-            seed=seed,
-            verbose=False,
+    Args:
+        data: JSON completo com voos/hoteis/carros e meta.
+        max_solutions: limite de solucoes por entrega.
+        population_size: tamanho da populacao.
+        generations: numero maximo de geracoes por cenario.
+        seed: semente para reproducibilidade.
+        preference: "best", "price" ou "duration".
+        engine: motor registrado em ``ENGINES``; usa config.SOLVER_ENGINE
+            quando None.
+        deadline: tempo maximo em segundos (relogio de parede); usa
+            config.SOLVER_DEADLINE_S quando None (None = sem prazo).
+        stagnation_generations: rodadas seguidas sem ganho de hipervolume
+            para parar; usa config.SOLVER_STAGNATION_GENERATIONS quando None
+            (0 desativa).
+        stagnation_tolerance: ganho relativo minimo de hipervolume por
+            rodada; usa config.SOLVER_STAGNATION_TOL quando None.
+        prune_scenarios: descarta cenarios cujo ponto ideal ja e dominado;
+            usa config.SOLVER_PRUNE_SCENARIOS quando None.
+        offers: ofertas ja compiladas (``compile_offers``); compiladas a
+            partir de ``data`` quando None.
+        prune_options: remove opcoes dominadas dentro de cada grupo; usa
+            config.SOLVER_PRUNE_OPTIONS quando None.
+        warm_start: semeia e guarda populacoes no ``WarmStartStore`` (a
+            populacao da ultima geracao executada, mesmo com parada antecipada);
+            ativo quando config.SOLVER_WARM_START_SIZE > 0 se None.
+
+    Yields:
+        Lista ranqueada de solucoes (mesmo formato de ``solve_nsga2``).
+    """
+    if offers is None:
+        offers = compile_offers(data)
+    started = time.monotonic()
+    engine = engine or getattr(config, "SOLVER_ENGINE", "nsga2")
+    get_engine(engine)  # falha cedo com nome de motor invalido
+    if deadline is None:
+        deadline = getattr(config, "SOLVER_DEADLINE_S", None)
+    if stagnation_generations is None:
+        stagnation_generations = getattr(config, "SOLVER_STAGNATION_GENERATIONS", 0)
+    if stagnation_tolerance is None:
+        stagnation_tolerance = getattr(config, "SOLVER_STAGNATION_TOL", 0.0)
+    if prune_scenarios is None:
+        prune_scenarios = getattr(config, "SOLVER_PRUNE_SCENARIOS", True)
+    if prune_options is None:
+        prune_options = getattr(config, "SOLVER_PRUNE_OPTIONS", True)
+    warm = _warm_start_store() if warm_start is not False else None
+    fast_path = preference in ("price", "duration") and getattr(config, "SOLVER_KBEST_FAST_PATH", True)
+    prepared, pruning = _prepare_scenarios(data, offers, prune_options and not fast_path)
+    stats = data.setdefault("meta", {}).setdefault("solver_stats", {})
+    stats["pruning"] = pruning
+    progress = {"rounds": 0, "stopped": "completed", "elapsed_s": 0.0}
+    stats["anytime"] = progress
+    if fast_path:
+        yield _solve_kbest(offers, prepared, preference, max_solutions)
+        return
+    prepared.sort(key=lambda item: item[3])
+    budgets = _scenario_budgets(prepared, population_size, generations, stats)
+
+    archive = ParetoArchive(max_size=getattr(config, "SOLVER_ARCHIVE_SIZE", None))
+
+    def _expired() -> bool:
+        # Sem nenhuma frente ainda, o prazo espera a primeira entrega
+        return deadline is not None and len(archive) > 0 and time.monotonic() - started >= deadline
+
+    counters: Dict[str, Any] = {}
+    running = []
+    latest: Dict[int, Any] = {}
+
+    def _evaluations() -> int:
+        # Cenarios encerrados ja somaram em counters; os ativos, pelo avaliador do pymoo
+        return counters.get("evaluations", 0) + sum(
+            latest[position].evaluator.n_eval for position, _ in running if position in latest
         )
 
-        if res.X is None:
-            continue
-        X = np.array(res.X)
-        if X.ndim == 1:
-            X = np.array([X])
-
-        best_candidates = []
-        for x in X:
-            x_int = np.rint(x).astype(int)
-            x_int = np.clip(x_int, xl, xu)
-            best_candidates.append(_evaluate_solution(groups, x_int.tolist()))
-        if not best_candidates:
-            continue
+    def _save(position: int) -> None:
+        algorithm = latest.pop(position, None)
+        if warm and algorithm is not None and algorithm.pop is not None:
+            _, groups, compiled, _ = prepared[position]
+            warm.save(offers, groups, _decode_choices(compiled, algorithm.pop.get("X")))
 
-        if preference == "price":
-            best = sorted(
-                best_candidates,
-                key=lambda s: (s["objectives"]["cost_total"], s["objectives"]["flight_duration_hours"]),
-            )[:max_solutions]
-        elif preference == "duration":
-            best = sorted(
-                best_candidates,
-                key=lambda s: (s["objectives"]["flight_duration_hours"], s["objectives"]["cost_total"]),
-            )[:max_solutions]
-        else:
-            weight_cost = getattr(config, "NSGA_WEIGHT_COST", 0.5)
-            weight_duration = getattr(config, "NSGA_WEIGHT_DURATION", 0.5)
-            min_cost = min(s["objectives"]["cost_total"] for s in best_candidates)
-            max_cost = max(s["objectives"]["cost_total"] for s in best_candidates)
-            min_dur = min(s["objectives"]["flight_duration_hours"] for s in best_candidates)
-            max_dur = max(s["objectives"]["flight_duration_hours"] for s in best_candidates)
-
-            def _score(sol: Dict[str, Any]) -> float:
-                cost = sol["objectives"]["cost_total"]
-                dur = sol["objectives"]["flight_duration_hours"]
-                norm_cost = 0.0 if max_cost == min_cost else (cost - min_cost) / (max_cost - min_cost)
-                norm_dur = 0.0 if max_dur == min_dur else (dur - min_dur) / (max_dur - min_dur)
-                return (weight_cost * norm_cost) + (weight_duration * norm_dur)
-
-            best = sorted(best_candidates, key=_score)[:max_solutions]
-
-        for sol in best:
-            selection_key = json.dumps(sol["selections"], sort_keys=True)
-            if selection_key in seen_selection_keys:
-                continue
-            seen_selection_keys.add(selection_key)
-            results.append(
-                {
-                    "scenario_order": scenario.get("order", []),
-                    "objectives": sol["objectives"],
-                    "selections": sol["selections"],
-                }
-            )
-            if len(results) >= max_solutions:
-                return results
-    return results
+    delivered = [0, -1]  # [versao do arquivo, versao entregue]
 
+    def _delivery() -> List[Dict[str, Any]]:
+        delivered[0] += 1
+        stats["evaluations"] = _evaluations()
+        return _archive_solutions(offers, prepared, archive, preference, max_solutions)
 
-def diagnose_missing(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _deliveries() -> Iterator[List[Dict[str, Any]]]:
+        for position, (_, groups, compiled, ideal) in enumerate(prepared):
+            if prune_scenarios and archive.dominates(ideal):
+                continue
+            population, n_gen, evaluations = budgets[position]
+            if _uses_ga(compiled, engine, evaluations):
+                initial, reused = warm.initial(offers, groups, compiled, population, seed) if warm else (None, 0)
+                _add_stats(counters, {"warm_scenarios": int(reused > 0), "warm_individuals": reused})
+                steps = _nsga2_steps(compiled, population, n_gen, seed, counters, initial)
+                running.append((position, steps))
+                continue
+            if _expired():
+                progress["stopped"] = "deadline"
+                return
+            X = _solve_compiled(compiled, engine, population, n_gen, seed, counters, evaluations=evaluations)
+            if _archive_add(archive, position, groups, compiled, X):
+                yield _delivery()
+
+        # Referencia do hipervolume: pior custo e pior duracao entre os cenarios
+        reference = (
+            max((float(c["cost"].max(axis=1).sum()) for _, _, c, _ in prepared), default=0.0) + 1.0,
+            max((float(c["duration"].max(axis=1).sum()) for _, _, c, _ in prepared), default=0.0) + 1.0,
+        )
+        best_hv = _hypervolume_2d(archive.objectives(), reference)
+        stale = 0
+        while running:
+            progress["rounds"] += 1
+            for position, steps in list(running):
+                if _expired():
+                    progress["stopped"] = "deadline"
+                    return
+                _, groups, compiled, ideal = prepared[position]
+                algorithm = next(steps, None)
+                if algorithm is None or (prune_scenarios and archive.dominates(ideal)):
+                    steps.close()
+                    running.remove((position, steps))
+                    _save(position)
+                    continue
+                latest[position] = algorithm
+                X = _decode_choices(compiled, algorithm.opt.get("X"))
+                if _archive_add(archive, position, groups, compiled, X):
+                    yield _delivery()
+            stats["evaluations"] = _evaluations()
+            hv = _hypervolume_2d(archive.objectives(), reference)
+            stale = stale + 1 if hv - best_hv <= stagnation_tolerance * max(best_hv, 1e-12) else 0
+            best_hv = max(hv, best_hv)
+            if stagnation_generations and stale >= stagnation_generations:
+                progress["stopped"] = "stagnation"
+                return
+
+    deliveries = _deliveries()
+    try:
+        for solutions in deliveries:
+            delivered[1] = delivered[0]
+            yield solutions
+        if delivered[1] != delivered[0] or delivered[0] == 0:
+            # Parada (prazo/estagnacao) ou nenhuma entrega: devolve o arquivo final
+            yield _archive_solutions(offers, prepared, archive, preference, max_solutions)
+    finally:
+        deliveries.close()
+        for position, steps in running:
+            steps.close()
+            _save(position)
+        if warm is not None:
+            warm.flush()
+        progress["elapsed_s"] = round(time.monotonic() - started, 3)
+        stats["evaluations"] = counters.get("evaluations", 0)
+        stats["eval_cache"] = _cache_summary(counters)
+        stats["warm_start"] = {
+            "scenarios": counters.get("warm_scenarios", 0),
+            "individuals": counters.get("warm_individuals", 0),
+        }
+
+
+def diagnose_missing(data: Dict[str, Any], offers: Optional[CompiledOfferSet] = None) -> List[Dict[str, Any]]:
     """Diagnostica pernas/estadas sem opcoes para cada cenario.
 
     Args:
         data: JSON completo com voos/hoteis/carros e meta.
+        offers: ofertas ja compiladas (``compile_offers``); compiladas a
+            partir de ``data`` quando None.
 
     Returns:
         Lista de diagnosticos por cenario com faltas.
     """
     scenarios = data.get("meta", {}).get("scenarios", [])
     trip = data.get("meta", {}).get("trip", {})
-    flight_index = _index_flights(data)
-    hotel_index = _index_hotels(data)
-    car_index = _index_cars(data)
+    if offers is None:
+        offers = compile_offers(data)
     diagnostics: List[Dict[str, Any]] = []
 
     for scenario in scenarios:
@@ -582,8 +2771,7 @@ def diagnose_missing(data: Dict[str, Any]) -> List[Dict[str, Any]]:
         stays = [s for s in scenario.get("stays", []) if s.get("type") == "main"]
         legs = _build_legs_from_stays(scenario.get("stays", []), trip)
         for leg in legs:
-            options = _build_transport_options(leg, flight_index, car_index)
-            if not options:
+            if not len(offers.transport_rows(leg)):
                 missing_legs.append(
                     {
                         "origin": leg["origin"],
@@ -592,9 +2780,7 @@ def diagnose_missing(data: Dict[str, Any]) -> List[Dict[str, Any]]:
                     }
                 )
         for stay in stays:
-            key = (stay.get("location"), _date_key(stay.get("checkin")), _date_key(stay.get("checkout")))
-            options = hotel_index.get(key, [])
-            if not options:
+            if not len(offers.hotel_rows(stay)):
                 missing_hotels.append(
                     {
                         "location": stay.get("location"),
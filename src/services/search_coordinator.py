@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
 import itertools
 from datetime import datetime, timedelta
 
@@ -8,8 +8,8 @@ from src.scrapers.kayak_flights import scrape_flights
 from src.scrapers.kayak_hotels import scrape_hotels
 from src.scrapers.kayak_cars import scrape_cars
 from src.utils.normalization import cap_results
-from src.utils.autocomplete import search_locations
-from src.utils.geo import drive_distance_and_time
+from src.utils.geo import DriveMatrix, drive_matrix, nearby_airports
+from src.utils.cancel import is_cancelled
 from src.utils.logs import clear_log, get_log
 
 
@@ -49,305 +49,633 @@ def _compute_stop_windows(stops: List[Stop], trip_start: datetime, trip_end: dat
     return windows
 
 
-def _build_stays_and_legs(stops: List[Stop], trip_start: datetime, trip_end: datetime, start_loc: str, end_loc: str):
-    """Gera combinações (permutando flex) com estadas e pernas; sem gap final.
+# Penalidade (km equivalentes) por dia de estada que excede o fim da viagem
+_OVERRUN_PENALTY_KM = 10000.0
+
+
+def _request_matrix(stops: Sequence[Stop], start_loc: str, end_loc: str) -> DriveMatrix:
+    """Matriz de distâncias/tempos de carro entre todas as localidades da requisição.
 
     Args:
         stops: lista de localidades (fixas e flexíveis).
-        trip_start: data/hora inicial da viagem.
-        trip_end: data/hora final da viagem.
         start_loc: local de partida da viagem.
         end_loc: local de chegada da viagem.
 
     Returns:
-        Tuple (stays, legs, warnings, scenarios) com estadas, pernas, avisos e cenários testados.
+        Matriz calculada de uma vez (ou recortada da matriz de aeroportos).
     """
-    fixed = [s for s in stops if s.constraint_type == "fixed_window"]
-    flex = [s for s in stops if s.constraint_type != "fixed_window"]
-    fixed_sorted = sorted(fixed, key=lambda s: _parse_date(s.window_start) or trip_start)
+    return drive_matrix([start_loc, end_loc] + [s.location for s in stops])
 
-    warnings: List[str] = []
-    scenarios: List[Dict[str, Any]] = []
 
-    flex_orders = list(itertools.permutations(flex)) if len(flex) <= 6 else [tuple(flex)]
-    if len(flex) > 6:
-        warnings.append("Stops flexíveis > 6, mantendo ordem de entrada.")
+def _collect_nearby_airports(legs: List[Dict[str, Any]], nearby: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Consulta os aeroportos alternativos próximos das pontas das pernas.
 
-    seen_orders = set()
+    Cada código é consultado uma vez no índice espacial (raio de estrada
+    NEARBY_AIRPORT_RADIUS_KM, até NEARBY_AIRPORT_MAX alternativas), como base
+    para rotas mistas (carro até outro aeroporto, voo, carro). As pernas não
+    são alteradas: elas são as mesmas entregues aos scrapers e a cada oferta.
 
-    for order in flex_orders:
-        # Evita combinações onde a mesma cidade fica em sequência (ex.: MIA -> MIA)
-        sequence = [s.location for s in fixed_sorted] + [s.location for s in order]
-        if any(sequence[i] == sequence[i - 1] for i in range(1, len(sequence))):
-            continue
-        # Evita duplicar cenários quando há localidades iguais em flex (mesma sequência)
-        seq_key = tuple(sequence)
-        if seq_key in seen_orders:
-            continue
-        seen_orders.add(seq_key)
-        stays: List[Dict[str, Any]] = []
-        feasible = True
-        overrun_days = 0
-
-        # Monta slots de tempo livre entre janelas fixas (inclui antes da 1a e entre fixas)
-        slots: List[Dict[str, Any]] = []
-        prev_end = trip_start
-        for stop in fixed_sorted:
-            start = _parse_date(stop.window_start)
-            end = _parse_date(stop.window_end)
-            if start > trip_end or end > trip_end:
-                feasible = False
-                break
-            if start > prev_end:
-                slots.append(
-                    {
-                        "start": prev_end,
-                        "end": start,
-                        "fill_location": stop.location.strip().upper(),
-                        "assigned": [],
-                        "remaining": (start - prev_end).days,
-                    }
+    Args:
+        legs: pernas de um lote do pipeline.
+        nearby: mapa código -> alternativas, completado no lugar.
+
+    Returns:
+        None.
+    """
+    if not config.NEARBY_AIRPORT_RADIUS_KM or not config.NEARBY_AIRPORT_MAX:
+        return
+    for leg in legs:
+        for code in (leg["origin"], leg["destination"]):
+            if code not in nearby:
+                nearby[code] = nearby_airports(code, config.NEARBY_AIRPORT_RADIUS_KM, config.NEARBY_AIRPORT_MAX)
+
+
+def _beam_flex_orders(
+    flex: Sequence[Stop],
+    fixed_sorted: Sequence[Stop],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    matrix: DriveMatrix,
+    beam_width: int,
+    max_orders: int,
+) -> Iterator[Tuple[Stop, ...]]:
+    """Busca em feixe das ordens flexiveis com menor distancia de estrada.
+
+    Cada estado e uma ordem parcial; o stop seguinte ocupa o primeiro slot
+    livre entre janelas fixas com dias suficientes (mesma regra do
+    empacotamento de ``_iter_scenarios``) ou excede o fim da viagem
+    (penalizado por dia). O custo e a distancia do roteiro inicio -> slots /
+    fixas -> excedentes -> fim. Estados equivalentes para o restante do
+    roteiro (mesmos stops usados, dias livres e ultima cidade de cada slot)
+    ficam so com o prefixo mais curto, como no Held-Karp, e so os
+    ``beam_width`` melhores seguem para o proximo nivel.
+
+    Args:
+        flex: stops flexiveis.
+        fixed_sorted: stops de janela fixa em ordem cronologica.
+        trip_start: inicio da viagem.
+        trip_end: fim da viagem.
+        start_loc: local de partida.
+        end_loc: local de chegada.
+        matrix: distancias de carro entre as localidades da requisicao.
+        beam_width: estados mantidos por nivel.
+        max_orders: quantas ordens completas entregar.
+
+    Yields:
+        Ordens de ``flex``, da menor para a maior distancia.
+    """
+    # Cadeia do roteiro: codigos fixos intercalados com indices de slots livres
+    chain: List[Any] = [start_loc.strip().upper()] if start_loc else []
+    capacities: List[int] = []
+    prev_end = trip_start
+    for stop in fixed_sorted:
+        start = _parse_date(stop.window_start)
+        end = _parse_date(stop.window_end)
+        if start > trip_end or end > trip_end:
+            # Nenhuma ordem e viavel; o chamador descarta o cenario
+            yield tuple(flex)
+            return
+        if start > prev_end:
+            chain.append(len(capacities))
+            capacities.append((start - prev_end).days)
+        chain.append(stop.location.strip().upper())
+        prev_end = end
+    if trip_end > prev_end:
+        chain.append(len(capacities))
+        capacities.append((trip_end - prev_end).days)
+    overflow = len(capacities)
+    chain.append(overflow)
+    if end_loc:
+        chain.append(end_loc.strip().upper())
+
+    locations = [s.location.strip().upper() for s in flex]
+    last_fixed = fixed_sorted[-1].location.strip().upper() if fixed_sorted else None
+
+    def _distance(a: str, b: str) -> float:
+        drive = matrix.lookup(a, b)
+        return drive[0] if drive else 0.0
+
+    def _route_cost(assigned: Tuple[Tuple[int, ...], ...]) -> float:
+        route: List[str] = []
+        for item in chain:
+            if isinstance(item, str):
+                route.append(item)
+            else:
+                route.extend(locations[i] for i in assigned[item])
+        return sum(_distance(route[i - 1], route[i]) for i in range(1, len(route)))
+
+    # Estado: (custo, indices da ordem, dias livres por slot, indices por slot, dias excedidos)
+    beam = [(0.0, (), tuple(capacities), tuple(() for _ in range(overflow + 1)), 0)]
+    for _ in range(len(flex)):
+        candidates: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        for _, order, remaining, assigned, overrun in beam:
+            previous = locations[order[-1]] if order else last_fixed
+            for j in range(len(flex)):
+                if j in order or locations[j] == previous:
+                    continue
+                min_days = flex[j].min_days or 1
+                slot = next((k for k, free in enumerate(remaining) if free >= min_days), overflow)
+                new_remaining = remaining
+                new_overrun = overrun
+                if slot < overflow:
+                    new_remaining = remaining[:slot] + (remaining[slot] - min_days,) + remaining[slot + 1:]
+                else:
+                    new_overrun += min_days
+                new_assigned = assigned[:slot] + (assigned[slot] + (j,),) + assigned[slot + 1:]
+                new_order = order + (j,)
+                cost = _route_cost(new_assigned) + _OVERRUN_PENALTY_KM * new_overrun
+                # Mesmo conjunto de stops, mesmos dias livres e mesma ultima cidade por slot: o
+                # restante do roteiro custa igual, entao so o melhor prefixo segue (Held-Karp)
+                key = (
+                    frozenset(new_order),
+                    new_remaining,
+                    tuple(locations[a[-1]] if a else None for a in new_assigned),
+                    locations[j],
                 )
+                state = (cost, new_order, new_remaining, new_assigned, new_overrun)
+                if key not in candidates or state[:2] < candidates[key][:2]:
+                    candidates[key] = state
+        # Custos arredondados: roteiros espelhados (mesma distancia) desempatam pela ordem de entrada
+        beam = sorted(candidates.values(), key=lambda st: (round(st[0], 6), st[1]))[:beam_width]
+        if not beam:
+            # Todas as ordens repetem cidades em sequencia
+            yield tuple(flex)
+            return
+    for _, order, _, _, _ in beam[:max_orders]:
+        yield tuple(flex[i] for i in order)
+
+
+def _iter_flex_orders(
+    flex: Sequence[Stop],
+    fixed_sorted: Sequence[Stop],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    matrix: DriveMatrix,
+) -> Iterator[Tuple[Stop, ...]]:
+    """Gera ordens candidatas dos stops flexiveis sob demanda.
+
+    Ate SCENARIO_EXHAUSTIVE_LIMIT stops entrega todas as permutacoes (na ordem
+    de ``itertools.permutations``); acima disso, as SCENARIO_MAX_ORDERS ordens
+    de menor distancia da busca em feixe (``_beam_flex_orders``).
+
+    Args:
+        flex: stops flexiveis.
+        fixed_sorted: stops de janela fixa em ordem cronologica.
+        trip_start: inicio da viagem.
+        trip_end: fim da viagem.
+        start_loc: local de partida.
+        end_loc: local de chegada.
+        matrix: distancias de carro entre as localidades da requisicao.
+
+    Yields:
+        Tuplas com os stops flexiveis na ordem candidata.
+    """
+    if len(flex) <= config.SCENARIO_EXHAUSTIVE_LIMIT:
+        yield from itertools.permutations(flex)
+        return
+    yield from _beam_flex_orders(
+        flex,
+        fixed_sorted,
+        trip_start,
+        trip_end,
+        start_loc,
+        end_loc,
+        matrix,
+        max(config.SCENARIO_BEAM_WIDTH, config.SCENARIO_MAX_ORDERS),
+        config.SCENARIO_MAX_ORDERS,
+    )
+
+
+def _scenario_for_order(
+    order: Sequence[Stop], fixed_sorted: Sequence[Stop], trip_start: datetime, trip_end: datetime
+) -> Optional[Dict[str, Any]]:
+    """Monta o cenário de uma ordem de flex: janelas fixas, flex nos slots livres e gap-fill.
+
+    Args:
+        order: stops flexíveis na ordem candidata.
+        fixed_sorted: stops de janela fixa em ordem cronológica.
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+
+    Returns:
+        Cenário com stays/order/is_feasible/overrun_days, ou None se uma janela fixa sai da viagem.
+    """
+    stays: List[Dict[str, Any]] = []
+    feasible = True
+    overrun_days = 0
+
+    # Monta slots de tempo livre entre janelas fixas (inclui antes da 1a e entre fixas)
+    slots: List[Dict[str, Any]] = []
+    prev_end = trip_start
+    for stop in fixed_sorted:
+        start = _parse_date(stop.window_start)
+        end = _parse_date(stop.window_end)
+        if start > trip_end or end > trip_end:
+            feasible = False
+            break
+        if start > prev_end:
+            slots.append(
+                {
+                    "start": prev_end,
+                    "end": start,
+                    "fill_location": stop.location.strip().upper(),
+                    "assigned": [],
+                    "remaining": (start - prev_end).days,
+                }
+            )
+        stays.append(
+            {
+                "location": stop.location.strip().upper(),
+                "checkin": start.isoformat(),
+                "checkout": end.isoformat(),
+                "nights": max(1, (end - start).days),
+                "type": "main",
+            }
+        )
+        prev_end = end
+    if not feasible:
+        return None
+    if trip_end > prev_end:
+        slots.append(
+            {
+                "start": prev_end,
+                "end": trip_end,
+                "fill_location": None,  # não preenche gap final
+                "assigned": [],
+                "remaining": (trip_end - prev_end).days,
+            }
+        )
+
+    # Flex na ordem candidata, preenchendo slots dispon?veis
+    overflow_cursor = trip_end
+    for stop in order:
+        min_days = stop.min_days or 1
+        placed = False
+        for slot in slots:
+            if slot["remaining"] >= min_days:
+                slot["assigned"].append(stop)
+                slot["remaining"] -= min_days
+                placed = True
+                break
+        if not placed:
+            # excedeu o intervalo da viagem
+            start = overflow_cursor
+            end = start + timedelta(days=min_days)
             stays.append(
                 {
                     "location": stop.location.strip().upper(),
                     "checkin": start.isoformat(),
                     "checkout": end.isoformat(),
-                    "nights": max(1, (end - start).days),
+                    "nights": min_days,
                     "type": "main",
                 }
             )
-            prev_end = end
-        if not feasible:
+            overflow_cursor = end
+            feasible = False
+
+    # Agenda as estadas flexiveis dentro de cada slot (alinhadas ao fim do slot)
+    for slot in slots:
+        if not slot["assigned"]:
             continue
-        if trip_end > prev_end:
-            slots.append(
+        total_days = sum((s.min_days or 1) for s in slot["assigned"])
+        if slot["fill_location"] is None:
+            start = slot["start"]
+        else:
+            start = slot["end"] - timedelta(days=total_days)
+            if start < slot["start"]:
+                start = slot["start"]
+        current = start
+        for stop in slot["assigned"]:
+            min_days = stop.min_days or 1
+            end = current + timedelta(days=min_days)
+            stays.append(
                 {
-                    "start": prev_end,
-                    "end": trip_end,
-                    "fill_location": None,  # não preenche gap final
-                    "assigned": [],
-                    "remaining": (trip_end - prev_end).days,
+                    "location": stop.location.strip().upper(),
+                    "checkin": current.isoformat(),
+                    "checkout": end.isoformat(),
+                    "nights": min_days,
+                    "type": "main",
                 }
             )
+            current = end
+        # Evita gap-fill no inicio do slot (antes do primeiro flex)
+        slot["start"] = current
 
-        # Flex na ordem candidata, preenchendo slots dispon?veis
-        overflow_cursor = trip_end
-        for stop in order:
-            min_days = stop.min_days or 1
-            placed = False
-            for slot in slots:
-                if slot["remaining"] >= min_days:
-                    slot["assigned"].append(stop)
-                    slot["remaining"] -= min_days
-                    placed = True
-                    break
-            if not placed:
-                # excedeu o intervalo da viagem
-                start = overflow_cursor
-                end = start + timedelta(days=min_days)
-                stays.append(
-                    {
-                        "location": stop.location.strip().upper(),
-                        "checkin": start.isoformat(),
-                        "checkout": end.isoformat(),
-                        "nights": min_days,
-                        "type": "main",
-                    }
-                )
-                overflow_cursor = end
-                feasible = False
+    if overflow_cursor > trip_end:
+        overrun_days = (overflow_cursor - trip_end).days
 
-        # Agenda as estadas flexiveis dentro de cada slot (alinhadas ao fim do slot)
-        for slot in slots:
-            if not slot["assigned"]:
-                continue
-            total_days = sum((s.min_days or 1) for s in slot["assigned"])
-            if slot["fill_location"] is None:
-                start = slot["start"]
-            else:
-                start = slot["end"] - timedelta(days=total_days)
-                if start < slot["start"]:
-                    start = slot["start"]
-            current = start
-            for stop in slot["assigned"]:
-                min_days = stop.min_days or 1
-                end = current + timedelta(days=min_days)
-                stays.append(
-                    {
-                        "location": stop.location.strip().upper(),
-                        "checkin": current.isoformat(),
-                        "checkout": end.isoformat(),
-                        "nights": min_days,
-                        "type": "main",
-                    }
-                )
-                current = end
-            # Evita gap-fill no inicio do slot (antes do primeiro flex)
-            slot["start"] = current
+    # Gap-fill apenas para slots remanescentes pequenos (exceto gap final)
+    for slot in slots:
+        gap = (slot["end"] - slot["start"]).days
+        if gap > 0 and gap <= config.GAP_FILL_DAYS and slot["fill_location"]:
+            stays.append(
+                {
+                    "location": slot["fill_location"],
+                    "checkin": slot["start"].isoformat(),
+                    "checkout": slot["end"].isoformat(),
+                    "nights": gap,
+                    "type": "gap_fill",
+                }
+            )
 
-        if overflow_cursor > trip_end:
-            overrun_days = (overflow_cursor - trip_end).days
+    stays_sorted = sorted(stays, key=lambda s: s["checkin"])
+    order_list = [s["location"] for s in stays_sorted if s["type"] == "main"]
+    return {
+        "stays": stays_sorted,
+        "order": order_list,
+        "is_feasible": feasible and overrun_days == 0,
+        "overrun_days": max(0, overrun_days),
+    }
 
-        # Gap-fill apenas para slots remanescentes pequenos (exceto gap final)
-        for slot in slots:
-            gap = (slot["end"] - slot["start"]).days
-            if gap > 0 and gap <= config.GAP_FILL_DAYS and slot["fill_location"]:
-                stays.append(
-                    {
-                        "location": slot["fill_location"],
-                        "checkin": slot["start"].isoformat(),
-                        "checkout": slot["end"].isoformat(),
-                        "nights": gap,
-                        "type": "gap_fill",
-                    }
-                )
 
-        stays_sorted = sorted(stays, key=lambda s: s["checkin"])
-        order_list = [s["location"] for s in stays_sorted if s["type"] == "main"]
-        scenarios.append(
-            {
-                "stays": stays_sorted,
-                "order": order_list,
-                "is_feasible": feasible and overrun_days == 0,
-                "overrun_days": max(0, overrun_days),
-            }
-        )
+def _merge_adjacent_stays(stays_seq: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Mescla estadas adjacentes/contiguas na mesma cidade para evitar legs redundantes.
 
-    # Deduplica cenários por ordem final efetiva (evita repetições no JSON/NSGA-II)
-    unique_scenarios: List[Dict[str, Any]] = []
-    seen_orders = set()
-    for sc in scenarios:
-        order_key = tuple(sc["order"])
-        if order_key in seen_orders:
+    Args:
+        stays_seq: lista de estadas do cenario.
+
+    Returns:
+        Lista de estadas mescladas.
+    """
+    if not stays_seq:
+        return []
+    stays_sorted = sorted(stays_seq, key=lambda s: s["checkin"])
+    merged: List[Dict[str, Any]] = []
+    for stay in stays_sorted:
+        if not merged:
+            merged.append(dict(stay))
             continue
-        seen_orders.add(order_key)
-        unique_scenarios.append(sc)
-    scenarios = unique_scenarios
+        last = merged[-1]
+        same_location = stay["location"] == last["location"]
+        last_end = _parse_date(last["checkout"])
+        stay_start = _parse_date(stay["checkin"])
+        stay_end = _parse_date(stay["checkout"])
+        if same_location and stay_start <= last_end:
+            new_end = max(last_end, stay_end)
+            last["checkout"] = new_end.isoformat()
+            last["nights"] = max(1, (new_end - _parse_date(last["checkin"])).days)
+            if stay.get("type") == "main":
+                last["type"] = "main"
+            continue
+        merged.append(dict(stay))
+    return merged
 
-    # Escolhe a primeira combinação (feasible se houver) para rodar scrapers
-    chosen = next((s for s in scenarios if s["is_feasible"]), scenarios[0] if scenarios else {"stays": [], "order": [], "is_feasible": True, "overrun_days": 0})
-    stays = chosen["stays"]
 
-    def _merge_adjacent_stays(stays_seq: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Mescla estadas adjacentes/contiguas na mesma cidade para evitar legs redundantes.
-
-        Args:
-            stays_seq: lista de estadas do cenario.
-
-        Returns:
-            Lista de estadas mescladas.
-        """
-        if not stays_seq:
-            return []
-        stays_sorted = sorted(stays_seq, key=lambda s: s["checkin"])
-        merged: List[Dict[str, Any]] = []
-        for stay in stays_sorted:
-            if not merged:
-                merged.append(dict(stay))
-                continue
-            last = merged[-1]
-            same_location = stay["location"] == last["location"]
-            last_end = _parse_date(last["checkout"])
-            stay_start = _parse_date(stay["checkin"])
-            stay_end = _parse_date(stay["checkout"])
-            if same_location and stay_start <= last_end:
-                new_end = max(last_end, stay_end)
-                last["checkout"] = new_end.isoformat()
-                last["nights"] = max(1, (new_end - _parse_date(last["checkin"])).days)
-                if stay.get("type") == "main":
-                    last["type"] = "main"
-                continue
-            merged.append(dict(stay))
-        return merged
-
-    def _legs_from_stays(stays_seq: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Gera pernas a partir das estadas mescladas.
-
-        Args:
-            stays_seq: lista de estadas do cenario.
-
-        Returns:
-            Lista de pernas com origem/destino/partida/chegada.
-        """
-        stays_seq = _merge_adjacent_stays(stays_seq)
-        legs_local: List[Dict[str, Any]] = []
-
-        if not stays_seq:
-            # return legs_local
-            if start_loc and end_loc:
-                legs_local.append(
-                    {
-                        "origin": start_loc.strip().upper(),
-                        "destination": end_loc.strip().upper(),
-                        "departure": trip_start.isoformat(),
-                        "arrival": trip_end.isoformat(),
-                    }
-                )
-            return legs_local
-        first = stays_seq[0]
-        if start_loc:
-            origin = start_loc.strip().upper()
-            destination = first["location"]
-            if origin != destination:
-                first_checkin = first["checkin"]
-                legs_local.append(
-                    {
-                        "origin": origin,
-                        "destination": destination,
-                        "departure": first_checkin,
-                        "arrival": first_checkin,
-                    }
-                )
-        for idx in range(len(stays_seq) - 1):
+def _legs_from_stays(
+    stays_seq: List[Dict[str, Any]], trip_start: datetime, trip_end: datetime, start_loc: str, end_loc: str
+) -> List[Dict[str, Any]]:
+    """Gera pernas a partir das estadas mescladas.
+
+    Args:
+        stays_seq: lista de estadas do cenario.
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+        start_loc: local de partida da viagem.
+        end_loc: local de chegada da viagem.
+
+    Returns:
+        Lista de pernas com origem/destino/partida/chegada.
+    """
+    stays_seq = _merge_adjacent_stays(stays_seq)
+    legs_local: List[Dict[str, Any]] = []
+
+    if not stays_seq:
+        # return legs_local
+        if start_loc and end_loc:
             legs_local.append(
                 {
-                    "origin": stays_seq[idx]["location"],
-                    "destination": stays_seq[idx + 1]["location"],
-                    "departure": stays_seq[idx]["checkout"],
-                    "arrival": stays_seq[idx + 1]["checkin"],
+                    "origin": start_loc.strip().upper(),
+                    "destination": end_loc.strip().upper(),
+                    "departure": trip_start.isoformat(),
+                    "arrival": trip_end.isoformat(),
                 }
             )
-        if end_loc:
+        return legs_local
+    first = stays_seq[0]
+    if start_loc:
+        origin = start_loc.strip().upper()
+        destination = first["location"]
+        if origin != destination:
+            first_checkin = first["checkin"]
             legs_local.append(
                 {
-                    "origin": stays_seq[-1]["location"],
-                    "destination": end_loc.strip().upper(),
-                    "departure": stays_seq[-1]["checkout"],
-                    "arrival": trip_end.isoformat(),
+                    "origin": origin,
+                    "destination": destination,
+                    "departure": first_checkin,
+                    "arrival": first_checkin,
                 }
             )
-        return [leg for leg in legs_local if leg["origin"] != leg["destination"]]
+    for idx in range(len(stays_seq) - 1):
+        legs_local.append(
+            {
+                "origin": stays_seq[idx]["location"],
+                "destination": stays_seq[idx + 1]["location"],
+                "departure": stays_seq[idx]["checkout"],
+                "arrival": stays_seq[idx + 1]["checkin"],
+            }
+        )
+    if end_loc:
+        legs_local.append(
+            {
+                "origin": stays_seq[-1]["location"],
+                "destination": end_loc.strip().upper(),
+                "departure": stays_seq[-1]["checkout"],
+                "arrival": trip_end.isoformat(),
+            }
+        )
+    return [leg for leg in legs_local if leg["origin"] != leg["destination"]]
+
+
+def _iter_scenarios(
+    stops: List[Stop],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    warnings: List[str],
+    matrix: DriveMatrix,
+) -> Iterator[Dict[str, Any]]:
+    """Gera cenários únicos sob demanda, uma ordem de flex por vez.
+
+    Ordens com a mesma cidade em sequência (ex.: MIA -> MIA) ou com sequência
+    já vista são puladas antes de montar estadas; cenários cuja ordem final
+    efetiva já saiu também (evita repetições no JSON/NSGA-II).
+
+    Args:
+        stops: lista de localidades (fixas e flexíveis).
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+        start_loc: local de partida da viagem.
+        end_loc: local de chegada da viagem.
+        warnings: lista mutável de avisos.
+        matrix: distâncias de carro da requisição (``_request_matrix``).
+
+    Yields:
+        Cenários com stays/order/is_feasible/overrun_days.
+    """
+    fixed = [s for s in stops if s.constraint_type == "fixed_window"]
+    flex = [s for s in stops if s.constraint_type != "fixed_window"]
+    fixed_sorted = sorted(fixed, key=lambda s: _parse_date(s.window_start) or trip_start)
+
+    if len(flex) > config.SCENARIO_EXHAUSTIVE_LIMIT:
+        warnings.append(
+            f"Stops flexíveis > {config.SCENARIO_EXHAUSTIVE_LIMIT}, avaliando as {config.SCENARIO_MAX_ORDERS} ordens de menor distância."
+        )
+
+    seen_sequences = set()
+    seen_orders = set()
+    for order in _iter_flex_orders(flex, fixed_sorted, trip_start, trip_end, start_loc, end_loc, matrix):
+        sequence = tuple([s.location for s in fixed_sorted] + [s.location for s in order])
+        if any(sequence[i] == sequence[i - 1] for i in range(1, len(sequence))):
+            continue
+        if sequence in seen_sequences:
+            continue
+        seen_sequences.add(sequence)
+        scenario = _scenario_for_order(order, fixed_sorted, trip_start, trip_end)
+        if scenario is None:
+            continue
+        order_key = tuple(scenario["order"])
+        if order_key in seen_orders:
+            continue
+        seen_orders.add(order_key)
+        yield scenario
+
+
+def _iter_plan(
+    stops: List[Stop],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    warnings: List[str],
+    matrix: DriveMatrix,
+) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Pipeline de planejamento: cada cenário com as pernas e estadas que ele traz de novo.
 
-    # Usa pernas do cenário escolhido, mas busca em todas as pernas únicas de todos os cenários para os scrapers
-    legs = _legs_from_stays(stays)
-    all_legs = []
+    Pernas (origem/destino/partida/chegada) e estadas (local/check-in/check-out)
+    são deduplicadas entre cenários à medida que saem, sem uma segunda
+    passada sobre todos os cenários.
+
+    Args:
+        stops: lista de localidades (fixas e flexíveis).
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+        start_loc: local de partida da viagem.
+        end_loc: local de chegada da viagem.
+        warnings: lista mutável de avisos.
+        matrix: distâncias de carro da requisição (``_request_matrix``).
+
+    Yields:
+        Tupla (cenário, pernas inéditas, estadas inéditas).
+    """
     seen_leg_keys = set()
-    for sc in scenarios:
-        for leg in _legs_from_stays(sc["stays"]):
+    seen_stay_keys = set()
+    for scenario in _iter_scenarios(stops, trip_start, trip_end, start_loc, end_loc, warnings, matrix):
+        new_legs = []
+        for leg in _legs_from_stays(scenario["stays"], trip_start, trip_end, start_loc, end_loc):
             key = (leg["origin"], leg["destination"], leg["departure"], leg["arrival"])
             if key in seen_leg_keys:
                 continue
             seen_leg_keys.add(key)
-            all_legs.append(leg)
+            new_legs.append(leg)
+        new_stays = []
+        for stay in scenario["stays"]:
+            key = (stay["location"], stay["checkin"], stay["checkout"])
+            if key in seen_stay_keys:
+                continue
+            seen_stay_keys.add(key)
+            new_stays.append(stay)
+        yield scenario, new_legs, new_stays
+
+
+def _iter_plan_batches(
+    stops: List[Stop],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    warnings: List[str],
+    matrix: DriveMatrix,
+    size: Optional[int],
+) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Agrupa o pipeline de planejamento em lotes de cenários.
+
+    Cada lote traz só as pernas/estadas que ainda não saíram em lotes
+    anteriores, para que os scrapers comecem antes do fim da enumeração e
+    nunca recebam a mesma busca duas vezes.
+
+    Args:
+        stops: lista de localidades (fixas e flexíveis).
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+        start_loc: local de partida da viagem.
+        end_loc: local de chegada da viagem.
+        warnings: lista mutável de avisos.
+        matrix: distâncias de carro da requisição (``_request_matrix``).
+        size: cenários por lote (None/0 = um lote só).
+
+    Yields:
+        Tupla (cenários, pernas inéditas, estadas inéditas) de cada lote.
+    """
+    plan = _iter_plan(stops, trip_start, trip_end, start_loc, end_loc, warnings, matrix)
+    while True:
+        batch = list(itertools.islice(plan, size)) if size else list(plan)
+        if not batch:
+            return
+        yield (
+            [scenario for scenario, _, _ in batch],
+            [leg for _, new_legs, _ in batch for leg in new_legs],
+            [stay for _, _, new_stays in batch for stay in new_stays],
+        )
 
+
+def _chosen_plan(
+    scenarios: List[Dict[str, Any]],
+    trip_start: datetime,
+    trip_end: datetime,
+    start_loc: str,
+    end_loc: str,
+    matrix: DriveMatrix,
+    nearby: Dict[str, List[Dict[str, Any]]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Escolhe o cenário exibido no plano e monta suas pernas; sem gap final.
+
+    Args:
+        scenarios: cenários gerados pelo pipeline.
+        trip_start: data/hora inicial da viagem.
+        trip_end: data/hora final da viagem.
+        start_loc: local de partida da viagem.
+        end_loc: local de chegada da viagem.
+        matrix: distâncias de carro da requisição (``_request_matrix``).
+        nearby: aeroportos alternativos por código (``_collect_nearby_airports``).
+
+    Returns:
+        Tuple (stays, legs) do primeiro cenário viável (ou do primeiro, se
+        nenhum for), com as pernas anotadas com distância de carro e
+        ``nearby_origins``/``nearby_destinations``.
+    """
+    chosen = next((scenario for scenario in scenarios if scenario["is_feasible"]), None)
+    if chosen is None:
+        chosen = scenarios[0] if scenarios else {"stays": [], "order": [], "is_feasible": True, "overrun_days": 0}
+    stays = chosen["stays"]
+
+    legs = _legs_from_stays(stays, trip_start, trip_end, start_loc, end_loc)
     enhanced_legs = []
     for leg in legs:
         leg_copy = dict(leg)
-        loc_o = next((l for l in search_locations(leg["origin"], limit=50) if l["code"] == leg["origin"]), None)
-        loc_d = next((l for l in search_locations(leg["destination"], limit=50) if l["code"] == leg["destination"]), None)
-        if loc_o and loc_d and loc_o.get("lat") and loc_o.get("lng") and loc_d.get("lat") and loc_d.get("lng"):
-            try:
-                dist_km, time_h = drive_distance_and_time(
-                    (float(loc_o["lat"]), float(loc_o["lng"])), (float(loc_d["lat"]), float(loc_d["lng"]))
-                )
-                leg_copy["drive_distance_km"] = dist_km
-                leg_copy["drive_time_hours"] = time_h
-            except Exception:
-                pass
+        drive = matrix.lookup(leg["origin"], leg["destination"])
+        if drive:
+            leg_copy["drive_distance_km"], leg_copy["drive_time_hours"] = drive
+        if nearby:
+            leg_copy["nearby_origins"] = nearby.get(leg["origin"], [])
+            leg_copy["nearby_destinations"] = nearby.get(leg["destination"], [])
         enhanced_legs.append(leg_copy)
 
-    return stays, enhanced_legs, warnings, scenarios, all_legs
+    return stays, enhanced_legs
 
 
 def _build_stays(windows: List[Dict[str, Any]], trip_start: datetime, trip_end: datetime) -> List[Dict[str, Any]]:
@@ -404,30 +732,26 @@ def _build_stays(windows: List[Dict[str, Any]], trip_start: datetime, trip_end:
     return stays
 
 
-def _build_rentals(legs: List[Dict[str, Any]], warnings: List[str]) -> List[Dict[str, Any]]:
+def _build_rentals(legs: List[Dict[str, Any]], warnings: List[str], matrix: DriveMatrix) -> List[Dict[str, Any]]:
     """Cria blocos de locação de carro correspondentes às pernas, respeitando limite de distância.
 
     Args:
         legs: pernas calculadas da viagem.
         warnings: lista mutável de avisos.
+        matrix: distâncias de carro da requisição (``_request_matrix``).
 
     Returns:
         Lista de blocos de locação para cada perna válida.
     """
     rentals: List[Dict[str, Any]] = []
     for leg in legs:
-        dist = leg.get("drive_distance_km")
+        drive = None
+        if leg.get("drive_distance_km") is not None:
+            drive = (leg["drive_distance_km"], leg.get("drive_time_hours"))
         # Se n╞o houver dist╞ncia na perna agregada, tenta calcular via geolocaliza├º├úo.
-        if dist is None:
-            loc_o = next((l for l in search_locations(leg["origin"], limit=50) if l["code"] == leg["origin"]), None)
-            loc_d = next((l for l in search_locations(leg["destination"], limit=50) if l["code"] == leg["destination"]), None)
-            if loc_o and loc_d and loc_o.get("lat") and loc_o.get("lng") and loc_d.get("lat") and loc_d.get("lng"):
-                try:
-                    dist, _ = drive_distance_and_time(
-                        (float(loc_o["lat"]), float(loc_o["lng"])), (float(loc_d["lat"]), float(loc_d["lng"]))
-                    )
-                except Exception:
-                    dist = None
+        if drive is None:
+            drive = matrix.lookup(leg["origin"], leg["destination"])
+        dist = drive[0] if drive else None
         if dist and config.MAX_CAR_DISTANCE_KM and dist > config.MAX_CAR_DISTANCE_KM:
             warnings.append(
                 f"Perna {leg['origin']} -> {leg['destination']} ({dist:.0f} km) excede limite de carro ({config.MAX_CAR_DISTANCE_KM} km)."
@@ -444,15 +768,17 @@ def _build_rentals(legs: List[Dict[str, Any]], warnings: List[str]) -> List[Dict
                 dropoff_date = d2.isoformat()
         except Exception:
             pass
-        rentals.append(
-            {
-                "pickup": leg["origin"],
-                "dropoff": leg["destination"],
-                "pickup_date": pickup_date,
-                "dropoff_date": dropoff_date,
-                "segments": [],
-            }
-        )
+        rental = {
+            "pickup": leg["origin"],
+            "dropoff": leg["destination"],
+            "pickup_date": pickup_date,
+            "dropoff_date": dropoff_date,
+            "segments": [],
+        }
+        # Distancia/tempo de estrada seguem no bloco (e nas ofertas) para o solver
+        if drive:
+            rental["drive_distance_km"], rental["drive_time_hours"] = drive
+        rentals.append(rental)
     return rentals
 
 
@@ -479,27 +805,29 @@ def run_search(req: SearchRequest, include_scrapers: bool = True) -> SearchRespo
         trip_end = _parse_date(req.trip_end_date)
     else:
         trip_end = trip_start + timedelta(days=min_days_required)
-    stays, legs, warnings, scenarios, all_legs = _build_stays_and_legs(req.stops, trip_start, trip_end, req.trip_start_location or "", req.trip_end_location or "")
-    rentals = _build_rentals(all_legs, warnings)
-
-    if include_scrapers:
-        flights = scrape_flights(req, all_legs)  # limite é por perna dentro do scraper
-        # Monta stays únicas para buscar hotéis em todas as combinações (limite por estada no scraper)
-        unique_stays: List[Dict[str, Any]] = []
-        seen_stay = set()
-        for sc in scenarios:
-            for st in sc["stays"]:
-                key = (st["location"], st["checkin"], st["checkout"])
-                if key in seen_stay:
-                    continue
-                seen_stay.add(key)
-                unique_stays.append(st)
-        hotels = scrape_hotels(req, unique_stays)
-        cars = scrape_cars(req, rentals)
-    else:
-        flights = []
-        hotels = []
-        cars = []
+    start_loc = req.trip_start_location or ""
+    end_loc = req.trip_end_location or ""
+    # Uma matriz de distâncias por requisição, usada pelo planejamento e pelos carros
+    matrix = _request_matrix(req.stops, start_loc, end_loc)
+    warnings: List[str] = []
+    scenarios: List[Dict[str, Any]] = []
+    flights: List[Dict[str, Any]] = []
+    hotels: List[Dict[str, Any]] = []
+    cars: List[Dict[str, Any]] = []
+    nearby: Dict[str, List[Dict[str, Any]]] = {}
+    batches = _iter_plan_batches(
+        req.stops, trip_start, trip_end, start_loc, end_loc, warnings, matrix, config.SCRAPE_BATCH_SCENARIOS
+    )
+    for batch_scenarios, new_legs, new_stays in batches:
+        # Os cenários ficam (meta/solver); pernas e estadas de cada lote vão direto aos scrapers
+        scenarios.extend(batch_scenarios)
+        _collect_nearby_airports(new_legs, nearby)
+        rentals = _build_rentals(new_legs, warnings, matrix)
+        if include_scrapers and not is_cancelled():
+            flights.extend(scrape_flights(req, new_legs))  # limite é por perna dentro do scraper
+            hotels.extend(scrape_hotels(req, new_stays))  # limite por estada no scraper
+            cars.extend(scrape_cars(req, rentals))
+    stays, legs = _chosen_plan(scenarios, trip_start, trip_end, start_loc, end_loc, matrix, nearby)
 
     meta: Dict[str, Any] = {
         "currency": req.currency,
@@ -538,6 +866,8 @@ def run_search(req: SearchRequest, include_scrapers: bool = True) -> SearchRespo
         ],
         "legs": legs,
         "stays": stays,
+        # Alternativas para as pontas de todas as pernas de todos os cenários
+        "nearby_airports": nearby,
         "warnings": warnings,
         "logs": get_log(),
         "scenarios": [
@@ -0,0 +1,255 @@
+"""Benchmarks do solver em instancias sinteticas.
+
+Instancias: grupos de opcoes com custo e duracao em conflito, em ordem
+aleatoria como vem dos provedores.
+
+- operators: quantas geracoes cada conjunto de operadores do NSGA-II
+  precisa para atingir uma fracao do hipervolume da frente exata.
+- engines: compara os motores registrados (``ENGINES``) em instancias de
+  tamanho crescente: tempo, avaliacoes, hipervolume e se o menor custo
+  exato foi encontrado.
+
+Uso:
+    python -m src.services.solver_benchmark [operators|engines]
+"""
+
+import argparse
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.services.nsga2_solver import (
+    ENGINES,
+    _evaluate_batch,
+    _exact_pareto_front,
+    _hypervolume_2d,
+    _reference_point,
+    _run_nsga2,
+    _search_space_size,
+)
+
+# (rotulo, operadores, ordenar opcoes por custo)
+VARIANTS = [
+    ("integer", "integer", False),
+    ("integer+sorted", "integer", True),
+    ("uniform", "uniform", False),
+    ("group_swap", "group_swap", False),
+]
+
+
+def synthetic_instance(n_groups: int, n_options: int, seed: int = 0) -> Dict[str, Any]:
+    """Gera um cenario compilado sintetico.
+
+    Args:
+        n_groups: numero de grupos (trechos/estadias).
+        n_options: numero de opcoes por grupo.
+        seed: semente do gerador.
+
+    Returns:
+        Dicionario no formato de ``_compile_groups``.
+    """
+    rng = np.random.default_rng(seed)
+    # Opcoes mais rapidas tendem a ser mais caras
+    duration = rng.uniform(1.0, 12.0, size=(n_groups, n_options))
+    cost = 2000.0 / duration + rng.uniform(0.0, 300.0, size=(n_groups, n_options))
+    return {
+        "cost": np.round(cost, 2),
+        "duration": np.round(duration, 2),
+        "lower": np.zeros(n_groups, dtype=int),
+        "upper": np.full(n_groups, n_options - 1, dtype=int),
+    }
+
+
+def _sorted_instance(compiled: Dict[str, Any]) -> Dict[str, Any]:
+    """Reordena as opcoes de cada grupo por custo (como SOLVER_SORT_OPTIONS)."""
+    order = np.argsort(compiled["cost"], axis=1, kind="stable")
+    return dict(
+        compiled,
+        cost=np.take_along_axis(compiled["cost"], order, axis=1),
+        duration=np.take_along_axis(compiled["duration"], order, axis=1),
+    )
+
+
+def generations_to_target(
+    compiled: Dict[str, Any],
+    operators: str,
+    target_hv: float,
+    reference: Tuple[float, float],
+    population_size: int = 50,
+    max_generations: int = 200,
+    seed: int = 42,
+) -> Tuple[Optional[int], float]:
+    """Roda o NSGA-II e registra a primeira geracao que atinge o alvo.
+
+    Args:
+        compiled: cenario compilado.
+        operators: operadores passados para ``_run_nsga2``.
+        target_hv: hipervolume alvo.
+        reference: ponto de referencia do hipervolume.
+        population_size: tamanho da populacao.
+        max_generations: limite de geracoes.
+        seed: semente.
+
+    Returns:
+        Tupla (geracao em que o alvo foi atingido ou None, hipervolume final).
+    """
+    reached: List[int] = []
+    history: List[float] = []
+
+    def _observe(generation: int, F: np.ndarray, evaluations: int) -> None:
+        hv = _hypervolume_2d(F, reference)
+        history.append(hv)
+        if not reached and hv >= target_hv:
+            reached.append(generation)
+
+    _run_nsga2(compiled, population_size, max_generations, seed, operators=operators, on_generation=_observe)
+    return (reached[0] if reached else None), (history[-1] if history else 0.0)
+
+
+def run_benchmark(
+    sizes: Tuple[Tuple[int, int], ...] = ((6, 20), (10, 30), (14, 40)),
+    seeds: Tuple[int, ...] = (1, 2, 3),
+    target_ratio: float = 0.95,
+    population_size: int = 50,
+    max_generations: int = 200,
+) -> List[Dict[str, Any]]:
+    """Compara os operadores em varias instancias sinteticas.
+
+    Args:
+        sizes: pares (grupos, opcoes por grupo).
+        seeds: sementes das instancias e do NSGA-II.
+        target_ratio: fracao do hipervolume exato usada como alvo.
+        population_size: tamanho da populacao.
+        max_generations: limite de geracoes por execucao.
+
+    Returns:
+        Lista de linhas com instancia, variante, geracoes ate o alvo e
+        razao de hipervolume final.
+    """
+    rows = []
+    for n_groups, n_options in sizes:
+        for seed in seeds:
+            compiled = synthetic_instance(n_groups, n_options, seed)
+            exact_F = _evaluate_batch(compiled, _exact_pareto_front(compiled))
+            reference = _reference_point(compiled)
+            exact_hv = _hypervolume_2d(exact_F, reference)
+            for label, operators, sort_options in VARIANTS:
+                instance = _sorted_instance(compiled) if sort_options else compiled
+                generation, final_hv = generations_to_target(
+                    instance,
+                    operators,
+                    target_ratio * exact_hv,
+                    reference,
+                    population_size,
+                    max_generations,
+                    seed,
+                )
+                rows.append(
+                    {
+                        "instance": f"{n_groups}x{n_options}#{seed}",
+                        "variant": label,
+                        "generations": generation,
+                        "hv_ratio": round(final_hv / exact_hv, 4) if exact_hv else 0.0,
+                    }
+                )
+    return rows
+
+
+def run_engine_benchmark(
+    sizes: Tuple[Tuple[int, int], ...] = ((3, 8), (4, 10), (6, 20), (10, 30), (14, 40)),
+    seeds: Tuple[int, ...] = (1, 2, 3),
+    engines: Optional[Sequence[str]] = None,
+    population_size: int = 50,
+    generations: int = 40,
+    enumeration_cap: int = 2_000_000,
+) -> List[Dict[str, Any]]:
+    """Roda todos os motores nas mesmas instancias e mede a qualidade.
+
+    Args:
+        sizes: pares (grupos, opcoes por grupo), do menor para o maior.
+        seeds: sementes das instancias e dos motores.
+        engines: nomes dos motores; todos os registrados quando None.
+        population_size: populacao dos motores que a usam.
+        generations: geracoes dos motores que as usam.
+        enumeration_cap: maior espaco de busca em que "enumerate" e rodado.
+
+    Returns:
+        Lista de linhas com instancia, motor, tempo (s), avaliacoes, razao de
+        hipervolume frente a frente exata e se o menor custo exato foi
+        encontrado.
+    """
+    rows = []
+    for n_groups, n_options in sizes:
+        for seed in seeds:
+            compiled = synthetic_instance(n_groups, n_options, seed)
+            reference = _reference_point(compiled)
+            exact_F = _evaluate_batch(compiled, _exact_pareto_front(compiled))
+            exact_hv = _hypervolume_2d(exact_F, reference)
+            min_cost = float(compiled["cost"].min(axis=1).sum())
+            space = _search_space_size(compiled)
+            for name in engines or sorted(ENGINES):
+                if name == "enumerate" and space > enumeration_cap:
+                    continue
+                stats: Dict[str, Any] = {}
+                started = time.perf_counter()
+                X = ENGINES[name](compiled, population_size, generations, seed, stats)
+                elapsed = time.perf_counter() - started
+                F = _evaluate_batch(compiled, X) if len(X) else np.zeros((0, 2))
+                rows.append(
+                    {
+                        "instance": f"{n_groups}x{n_options}#{seed}",
+                        "log10_space": round(math.log10(space), 1),
+                        "engine": name,
+                        "seconds": round(elapsed, 4),
+                        "evaluations": stats.get("evaluations", 0),
+                        "hv_ratio": round(_hypervolume_2d(F, reference) / exact_hv, 4) if exact_hv else 0.0,
+                        "found_min_cost": bool(len(F)) and math.isclose(F[:, 0].min(), min_cost, abs_tol=1e-6),
+                    }
+                )
+    return rows
+
+
+def _print_engine_report(rows: List[Dict[str, Any]]) -> None:
+    """Imprime tabela por execucao e resumo por motor."""
+    print(f"{'instancia':<12}{'log10|S|':>9}  {'motor':<10}{'tempo(s)':>10}{'avaliacoes':>12}{'hv':>8}{'min custo':>11}")
+    for row in rows:
+        print(
+            f"{row['instance']:<12}{row['log10_space']:>9}  {row['engine']:<10}{row['seconds']:>10.4f}"
+            f"{row['evaluations']:>12}{row['hv_ratio']:>8.4f}{'sim' if row['found_min_cost'] else 'nao':>11}"
+        )
+    print()
+    print(f"{'motor':<10}{'execucoes':>10}{'tempo medio':>13}{'hv medio':>10}{'min custo':>11}")
+    for name in sorted({row["engine"] for row in rows}):
+        runs = [row for row in rows if row["engine"] == name]
+        found = sum(row["found_min_cost"] for row in runs)
+        print(
+            f"{name:<10}{len(runs):>10}{np.mean([r['seconds'] for r in runs]):>13.4f}"
+            f"{np.mean([r['hv_ratio'] for r in runs]):>10.4f}{found:>6}/{len(runs):<4}"
+        )
+
+
+def _print_report(rows: List[Dict[str, Any]], max_generations: int) -> None:
+    """Imprime tabela por execucao e resumo por variante."""
+    print(f"{'instancia':<14}{'variante':<16}{'geracoes':>10}{'hv final':>10}")
+    for row in rows:
+        generations = row["generations"] if row["generations"] is not None else f">{max_generations}"
+        print(f"{row['instance']:<14}{row['variant']:<16}{generations!s:>10}{row['hv_ratio']:>10.4f}")
+    print()
+    print(f"{'variante':<16}{'atingiu':>10}{'media ger.':>12}")
+    for label, _, _ in VARIANTS:
+        runs = [row for row in rows if row["variant"] == label]
+        hits = [row["generations"] for row in runs if row["generations"] is not None]
+        mean = f"{np.mean(hits):.1f}" if hits else "-"
+        print(f"{label:<16}{len(hits):>5}/{len(runs):<4}{mean:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do solver em instancias sinteticas.")
+    parser.add_argument("mode", nargs="?", choices=("operators", "engines"), default="operators")
+    args = parser.parse_args()
+    if args.mode == "engines":
+        _print_engine_report(run_engine_benchmark())
+    else:
+        _print_report(run_benchmark(), 200)
@@ -1,85 +1,231 @@
-"""Autocomplete local para cidades/aeroportos (BR/US) a partir de CSVs."""
+"""Autocomplete local para cidades/aeroportos (BR/US) a partir de CSVs.
 
-import csv
+Busca textual em ``search_locations`` (trie de codigos + indice invertido de
+n-gramas sem acentos, com ranking); consultas por codigo exato (planejamento,
+distancias) usam o indice de ``get_location``/``location_coords``.
+"""
+
+import unicodedata
+from dataclasses import dataclass, field
 from functools import lru_cache
-from typing import List, Dict
+from itertools import chain, islice
+from typing import Dict, List, Optional, Set, Tuple
 
 from src import config
+from src.utils.location_store import LocationTable, load_location_store
 
 
 @lru_cache(maxsize=1)
-def load_locations() -> List[Dict]:
-    """Carrega lista de localidades (IATA/cidade/estado/país) dos CSVs configurados.
+def load_locations() -> LocationTable:
+    """Carrega as localidades (IATA/cidade/estado/país) dos CSVs configurados.
+
+    Usa a base colunar pre-compilada (``location_store``), aberta via memmap e
+    reconstruida quando algum CSV muda. O indice da busca textual
+    (``_build_search_index``) e montado aqui, junto com a carga, e fica em
+    ``table.search_index``.
 
     Args:
         None.
 
     Returns:
-        Lista de dicionarios com localidades.
+        Tabela colunar de localidades (itens montados como dicionarios).
+    """
+    table = load_location_store(config.LOCATIONS_FILES, config.LOCATIONS_CACHE_DIR)
+    table.search_index = _build_search_index(table)
+    return table
+
+
+@lru_cache(maxsize=1)
+def _code_index() -> Dict[str, int]:
+    """Indice codigo -> linha de ``load_locations``.
+
+    Codigos repetidos ficam com a primeira ocorrencia (ordem dos arquivos).
+
+    Args:
+        None.
+
+    Returns:
+        Dicionario indexado pelo codigo em maiusculas.
+    """
+    table = load_locations()
+    index: Dict[str, int] = {}
+    for i in range(len(table)):
+        index.setdefault(table.field(i, "code"), i)
+    return index
+
+
+def get_location(code: str) -> Optional[Dict]:
+    """Busca uma localidade pelo codigo exato (IATA), em O(1).
+
+    Args:
+        code: codigo da localidade (case-insensitive).
+    Returns:
+        Dicionario da localidade ou None.
     """
-    locations: List[Dict] = []
-    for file_path in config.LOCATIONS_FILES:
-        try:
-            with open(file_path, newline="", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    # Normaliza campos conforme presença
-                    code = row.get("IATA") or row.get("iata_code") or row.get("iata")
-                    if not code:
-                        continue
-                    country = row.get("Country_CodeA2") or row.get("iso_country") or ""
-                    if country not in ("US", "BR"):
-                        continue
-                    city = row.get("City_Name") or row.get("municipality") or row.get("city") or ""
-                    state = row.get("iso_region", "")
-                    if state and "-" in state:
-                        state = state.split("-")[-1]
-                    state = row.get("region_name") or row.get("local_region") or state
-                    lat = row.get("GeoPointLat") or row.get("latitude_deg")
-                    lng = row.get("GeoPointLong") or row.get("longitude_deg")
-                    loc_type = row.get("type") or row.get("type_airport") or "airport"
-                    locations.append(
-                        {
-                            "code": code.strip().upper(),
-                            "name": row.get("AirportName") or row.get("name") or "",
-                            "city": city,
-                            "state": state,
-                            "country": country,
-                            "type": loc_type,
-                            "lat": lat,
-                            "lng": lng,
-                        }
-                    )
-        except FileNotFoundError:
-            continue
-    return locations
+    row = _code_index().get((code or "").strip().upper())
+    return load_locations()[row] if row is not None else None
+
+
+def location_coords(code: str) -> Optional[Tuple[float, float]]:
+    """Coordenadas (lat, lng) em float de um codigo exato.
+
+    Args:
+        code: codigo da localidade (case-insensitive).
+    Returns:
+        Tupla (lat, lng) ou None se o codigo nao existir ou nao tiver coordenadas.
+    """
+    row = _code_index().get((code or "").strip().upper())
+    return load_locations().coords(row) if row is not None else None
+
+
+# Tamanho dos n-gramas do indice invertido (consultas menores usam listas proprias)
+_NGRAM = 3
+
+# Ordem de relevancia dos tipos de localidade (menor = melhor; ausentes ficam no fim)
+_TYPE_RANK = {
+    "large_airport": 0,
+    "medium_airport": 1,
+    "airport": 2,
+    "small_airport": 3,
+    "seaplane_base": 4,
+    "heliport": 5,
+    "balloonport": 5,
+    "closed": 6,
+}
+
+
+def _fold(text: str) -> str:
+    """Remove acentos e converte para minusculas ("São" -> "sao").
+
+    Args:
+        text: texto original.
+    Returns:
+        Texto normalizado.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+@dataclass
+class _SearchIndex:
+    """Indices da busca textual sobre ``load_locations``.
+
+    Toda lista de ids (trie e n-gramas curtos) esta em ordem de ``rank``,
+    entao os melhores resultados sao sempre os primeiros.
+
+    Attributes:
+        texts: texto normalizado (codigo, nome, cidade, UF, pais) por localidade.
+        codes: codigo em minusculas por localidade.
+        code_trie: trie de codigos; cada no guarda os ids do seu ramo.
+        ngrams: n-grama -> ids das localidades cujo texto o contem.
+        short: n-grama curto (menor que ``_NGRAM``) -> ids das localidades
+            cujo texto o contem.
+        rank: posicao de cada localidade na ordem de relevancia fixa (tipo,
+            voos regulares, ordem dos arquivos).
+    """
+
+    texts: List[str] = field(default_factory=list)
+    codes: List[str] = field(default_factory=list)
+    code_trie: Dict[str, Tuple[Dict, List[int]]] = field(default_factory=dict)
+    ngrams: Dict[str, Set[int]] = field(default_factory=dict)
+    short: Dict[str, List[int]] = field(default_factory=dict)
+    rank: List[int] = field(default_factory=list)
+
+    def code_prefix(self, prefix: str) -> List[int]:
+        """Ids das localidades cujo codigo comeca com ``prefix`` (minusculo)."""
+        children = self.code_trie
+        ids: List[int] = []
+        for ch in prefix:
+            node = children.get(ch)
+            if node is None:
+                return []
+            children, ids = node
+        return ids
+
+    def candidates(self, q: str) -> List[int]:
+        """Localidades que casam com a consulta normalizada ``q``, por ``rank``.
+
+        Em qualquer tamanho a consulta casa como substring do texto. Com pelo
+        menos ``_NGRAM`` caracteres: intersecao das listas dos n-gramas e
+        confirmacao por substring. Menores: lista pronta do n-grama curto.
+        """
+        if len(q) < _NGRAM:
+            return self.short.get(q, [])
+        grams = sorted({q[i : i + _NGRAM] for i in range(len(q) - _NGRAM + 1)}, key=lambda g: len(self.ngrams.get(g, ())))
+        found = set(self.ngrams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not found:
+                break
+            found &= self.ngrams.get(gram, set())
+        if len(grams) > 1 or len(q) > _NGRAM:
+            found = {i for i in found if q in self.texts[i]}
+        return sorted(found, key=self.rank.__getitem__)
+
+
+def _build_search_index(table: LocationTable) -> _SearchIndex:
+    """Constroi os indices de busca sobre a tabela de localidades.
+
+    Le as colunas direto (sem montar dicionarios); chamado uma vez por
+    ``load_locations``.
+
+    Args:
+        table: tabela de ``load_locations``.
+
+    Returns:
+        Indice de busca textual.
+    """
+    index = _SearchIndex()
+    keys = []
+    for i in range(len(table)):
+        code = table.field(i, "code").lower()
+        index.codes.append(code)
+        index.texts.append(_fold(" ".join([code] + [table.field(i, name) for name in ("name", "city", "state", "country")])))
+        scheduled = int(table.scheduled[i])
+        keys.append((_TYPE_RANK.get(table.field(i, "type"), len(_TYPE_RANK)), 0 if scheduled > 0 else 1 if scheduled < 0 else 2, i))
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    index.rank = [0] * len(order)
+    # Inserir em ordem de relevancia deixa todas as listas de ids ordenadas
+    for position, i in enumerate(order):
+        index.rank[i] = position
+        text = index.texts[i]
+        children = index.code_trie
+        for ch in index.codes[i]:
+            node = children.setdefault(ch, ({}, []))
+            node[1].append(i)
+            children = node[0]
+        for pos in range(len(text) - _NGRAM + 1):
+            index.ngrams.setdefault(text[pos : pos + _NGRAM], set()).add(i)
+        short = {text[pos : pos + size] for size in range(1, _NGRAM) for pos in range(len(text) - size + 1)}
+        for gram in short:
+            index.short.setdefault(gram, []).append(i)
+    return index
 
 
 def search_locations(query: str, limit: int = 10) -> List[Dict]:
-    """Filtra localidades por código/nome/cidade/UF.
+    """Busca localidades por codigo/nome/cidade/UF/pais, sem diferenciar acentos.
+
+    Resultados ordenados por: codigo exato, codigo comecando com o termo, tipo
+    (aeroportos grandes primeiro), voos regulares e ordem dos arquivos. O
+    ranking percorre so o inicio das listas ordenadas do indice; apenas os
+    ``limit`` vencedores viram dicionarios.
 
     Args:
-        query: termo de busca (case-insensitive).
+        query: termo de busca (case/acento-insensitive).
         limit: quantidade máxima de resultados.
     Returns:
         Lista de dicionários com match.
     """
-    q = (query or "").strip().lower()
+    q = _fold((query or "").strip())
+    locations = load_locations()
     if not q:
-        return load_locations()[:limit]
-    results = []
-    for loc in load_locations():
-        text = " ".join(
-            [
-                loc.get("code", ""),
-                loc.get("name", ""),
-                loc.get("city", ""),
-                loc.get("state", ""),
-                loc.get("country", ""),
-            ]
-        ).lower()
-        if q in text:
-            results.append(loc)
-        if len(results) >= limit:
-            break
-    return results
+        return locations[:limit]
+    index = locations.search_index
+    codes = index.codes
+    by_code = index.code_prefix(q)
+    listed = set(by_code)
+    ranked = chain(
+        (i for i in by_code if codes[i] == q),
+        (i for i in by_code if codes[i] != q),
+        (i for i in index.candidates(q) if i not in listed),
+    )
+    return [locations[i] for i in islice(ranked, limit)]
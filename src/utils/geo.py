@@ -1,9 +1,27 @@
-"""Utilidades geográficas (distância e tempo estimado)."""
+"""Utilidades geográficas (distância e tempo estimado).
 
+Além das funções escalares, ``drive_matrix`` calcula de uma vez (NumPy) as
+distâncias de carro entre todas as localidades de uma requisição; os tempos
+saem da distância e de AVG_DRIVE_SPEED_KMH na consulta. Com
+DRIVE_MATRIX_AIRPORTS, a matriz (float32) de todos os aeroportos com voos
+regulares fica em um ``.npy`` (memmap) em LOCATIONS_CACHE_DIR, indexado por
+DRIVE_DISTANCE_FACTOR e pelas coordenadas.
+
+``SpatialIndex`` (grade de células em graus) responde consultas por raio e
+k vizinhos mais próximos; ``airport_index`` indexa os aeroportos com voos
+regulares.
+"""
+
+import hashlib
 import math
-from typing import Optional, Tuple
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from src import config
+from src.utils.autocomplete import load_locations, location_coords
 
 EARTH_RADIUS_KM = 6371.0
 
@@ -55,3 +73,322 @@ def drive_distance_and_time(latlon1: Tuple[float, float], latlon2: Tuple[float,
     d_km = haversine_km(latlon1[0], latlon1[1], latlon2[0], latlon2[1]) * config.DRIVE_DISTANCE_FACTOR
     t_h = estimate_drive_time_hours(d_km, avg_speed_kmh)
     return d_km, t_h
+
+
+def haversine_km_matrix(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Distâncias Haversine (km) entre todos os pares de dois conjuntos de pontos.
+
+    Args:
+        lat1: latitudes do conjunto 1 (graus), shape (n,).
+        lon1: longitudes do conjunto 1 (graus), shape (n,).
+        lat2: latitudes do conjunto 2 (graus), shape (m,).
+        lon2: longitudes do conjunto 2 (graus), shape (m,).
+    Returns:
+        Matriz (n, m) em quilômetros (NaN onde faltar coordenada).
+    """
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lon2, dtype=np.float64))[None, :] - np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class DriveMatrix:
+    """Distâncias (km, ajustadas) de carro entre pares de códigos.
+
+    Os tempos não são guardados: ``lookup`` divide a distância pela
+    velocidade média.
+
+    Attributes:
+        codes: códigos na ordem das linhas/colunas.
+        index: código -> posição.
+        distance: matriz (n, n) float32 de distâncias (NaN sem coordenadas).
+        avg_speed_kmh: velocidade média; None usa config.AVG_DRIVE_SPEED_KMH
+            no momento da consulta.
+    """
+
+    def __init__(self, codes: Sequence[str], distance: np.ndarray, avg_speed_kmh: Optional[float] = None):
+        self.codes = list(codes)
+        self.index: Dict[str, int] = {}
+        for pos, code in enumerate(self.codes):
+            self.index.setdefault(code, pos)
+        self.distance = distance
+        self.avg_speed_kmh = avg_speed_kmh
+
+    @classmethod
+    def from_coords(cls, codes: Sequence[str], coords: Sequence[Optional[Tuple[float, float]]], avg_speed_kmh: Optional[float] = None) -> "DriveMatrix":
+        """Calcula a matriz de uma vez a partir das coordenadas.
+
+        Args:
+            codes: códigos das localidades.
+            coords: (lat, lng) de cada código ou None.
+            avg_speed_kmh: velocidade média; None usa config.AVG_DRIVE_SPEED_KMH.
+        Returns:
+            Matriz de distâncias.
+        """
+        lat = np.array([c[0] if c else np.nan for c in coords], dtype=np.float64)
+        lng = np.array([c[1] if c else np.nan for c in coords], dtype=np.float64)
+        distance = haversine_km_matrix(lat, lng, lat, lng) * config.DRIVE_DISTANCE_FACTOR
+        # Espelha o triangulo superior: ida e volta com exatamente o mesmo valor
+        distance = np.triu(distance) + np.triu(distance, 1).T
+        return cls(codes, distance.astype(np.float32), avg_speed_kmh)
+
+    def subset(self, codes: Sequence[str]) -> "DriveMatrix":
+        """Recorta a matriz para ``codes`` (todos presentes no índice)."""
+        rows = [self.index[code] for code in codes]
+        return DriveMatrix(codes, np.asarray(self.distance[np.ix_(rows, rows)]), self.avg_speed_kmh)
+
+    def lookup(self, origin: str, destination: str) -> Optional[Tuple[float, float]]:
+        """Distância (km) e tempo (h) entre dois códigos.
+
+        Args:
+            origin: código de origem.
+            destination: código de destino.
+        Returns:
+            Tupla (distância km, tempo horas) ou None se faltar código/coordenada.
+        """
+        i = self.index.get((origin or "").strip().upper())
+        j = self.index.get((destination or "").strip().upper())
+        if i is None or j is None:
+            return None
+        dist = float(self.distance[i, j])
+        if math.isnan(dist):
+            return None
+        speed = config.AVG_DRIVE_SPEED_KMH if self.avg_speed_kmh is None else self.avg_speed_kmh
+        return dist, estimate_drive_time_hours(dist, speed)
+
+
+@lru_cache(maxsize=1)
+def _scheduled_airports() -> Tuple[List[str], List[Tuple[float, float]]]:
+    """Códigos e coordenadas dos aeroportos com voos regulares.
+
+    Entram os códigos com coordenadas e ``scheduled_service`` verdadeiro ou
+    desconhecido (primeira ocorrência de cada código). O desconhecido entra
+    de propósito: arquivos sem a coluna (como ``us-airports.csv``, que só
+    lista aeroportos com código IATA) ficariam inteiros de fora. Só os
+    marcados explicitamente sem voos regulares (``scheduled_service`` = 0)
+    são descartados.
+
+    Args:
+        None.
+    Returns:
+        Tupla (códigos, coordenadas (lat, lng)).
+    """
+    table = load_locations()
+    codes: List[str] = []
+    coords: List[Tuple[float, float]] = []
+    seen = set()
+    for i in range(len(table)):
+        code = table.field(i, "code")
+        point = table.coords(i)
+        if code in seen or point is None or table.scheduled[i] == 0:
+            continue
+        seen.add(code)
+        codes.append(code)
+        coords.append(point)
+    return codes, coords
+
+
+@lru_cache(maxsize=1)
+def airport_drive_matrix() -> Optional[DriveMatrix]:
+    """Matriz de todos os aeroportos com voos regulares, em cache ``.npy`` (memmap).
+
+    Aeroportos de ``_scheduled_airports``. O arquivo ``drive_<chave>.npy``
+    guarda só as distâncias, shape (n, n) em float32, e é indexado por
+    DRIVE_DISTANCE_FACTOR e pelas coordenadas (a velocidade entra só na
+    consulta); sem LOCATIONS_CACHE_DIR a matriz fica só em memória.
+    Arquivos de outras chaves não são apagados (podem estar em uso por
+    outros processos).
+
+    Args:
+        None.
+    Returns:
+        Matriz dos aeroportos ou None se DRIVE_MATRIX_AIRPORTS estiver desligado.
+    """
+    if not config.DRIVE_MATRIX_AIRPORTS:
+        return None
+    codes, coords = _scheduled_airports()
+    digest = hashlib.sha1(
+        repr(("float32", config.DRIVE_DISTANCE_FACTOR, codes)).encode("utf-8")
+        + np.asarray(coords, dtype=np.float64).tobytes()
+    ).hexdigest()[:16]
+    cache_dir = config.LOCATIONS_CACHE_DIR
+    path = os.path.join(cache_dir, f"drive_{digest}.npy") if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            distance = np.load(path, mmap_mode="r")
+            if distance.shape == (len(codes), len(codes)) and distance.dtype == np.float32:
+                return DriveMatrix(codes, distance)
+        except (OSError, ValueError):
+            pass
+    matrix = DriveMatrix.from_coords(codes, coords)
+    if path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Temporario por processo: outro worker pode gravar a mesma chave ao mesmo tempo
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as handle:
+                np.save(handle, matrix.distance)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return matrix
+
+
+def drive_matrix(codes: Sequence[str]) -> DriveMatrix:
+    """Matriz de distâncias de carro entre os códigos de uma requisição.
+
+    Recorta a matriz dos aeroportos quando ela cobre todos os códigos; senão,
+    calcula a matriz dos códigos de uma vez.
+
+    Args:
+        codes: códigos envolvidos (repetições são ignoradas).
+    Returns:
+        Matriz indexada pelos códigos em maiúsculas.
+    """
+    unique = list(dict.fromkeys((code or "").strip().upper() for code in codes if code))
+    airports = airport_drive_matrix()
+    if airports is not None and all(code in airports.index for code in unique):
+        return airports.subset(unique)
+    return DriveMatrix.from_coords(unique, [location_coords(code) for code in unique])
+
+
+# Lado das células da grade do índice espacial (graus)
+_GRID_CELL_DEG = 1.0
+
+
+class SpatialIndex:
+    """Índice espacial em grade (lat/lng) para consultas por raio e k vizinhos.
+
+    Cada ponto fica na célula ``(lat, lng) // cell_deg``. Uma consulta visita
+    só as células da caixa que envolve o círculo (com a largura em longitude
+    corrigida pela latitude e volta em +-180) e confere a distância Haversine
+    exata dos candidatos em NumPy.
+
+    Attributes:
+        codes: códigos dos pontos.
+        lat: latitudes (graus).
+        lng: longitudes (graus).
+        cell_deg: lado da célula em graus.
+    """
+
+    def __init__(self, codes: Sequence[str], coords: Sequence[Tuple[float, float]], cell_deg: float = _GRID_CELL_DEG):
+        self.codes = list(codes)
+        self.lat = np.array([c[0] for c in coords], dtype=np.float64)
+        self.lng = np.array([c[1] for c in coords], dtype=np.float64)
+        self.cell_deg = cell_deg
+        self._lng_cells = max(1, int(round(360.0 / cell_deg)))
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lat, lng) in enumerate(zip(self.lat, self.lng)):
+            self._cells.setdefault(self._cell(lat, lng), []).append(i)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor((lat + 90.0) / self.cell_deg)), int(math.floor(((lng + 180.0) % 360.0) / self.cell_deg)) % self._lng_cells
+
+    def _candidates(self, lat: float, lng: float, radius_km: float) -> List[int]:
+        """Índices dos pontos nas células que podem estar a até ``radius_km``."""
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        row_lo = int(math.floor((max(-90.0, lat - dlat) + 90.0) / self.cell_deg))
+        row_hi = int(math.floor((min(90.0, lat + dlat) + 90.0) / self.cell_deg))
+        if abs(lat) + dlat >= 90.0 or angle >= math.pi / 2:
+            columns = range(self._lng_cells)
+        else:
+            dlng = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+            col_lo = int(math.floor((lng - dlng + 180.0) / self.cell_deg))
+            col_hi = int(math.floor((lng + dlng + 180.0) / self.cell_deg))
+            if col_hi - col_lo + 1 >= self._lng_cells:
+                columns = range(self._lng_cells)
+            else:
+                columns = sorted({c % self._lng_cells for c in range(col_lo, col_hi + 1)})
+        found: List[int] = []
+        for row in range(row_lo, row_hi + 1):
+            for col in columns:
+                found.extend(self._cells.get((row, col), ()))
+        return found
+
+    def _distances(self, lat: float, lng: float, ids: List[int]) -> np.ndarray:
+        return haversine_km_matrix(np.array([lat]), np.array([lng]), self.lat[ids], self.lng[ids])[0]
+
+    def within_radius(self, lat: float, lng: float, radius_km: float) -> List[Tuple[str, float]]:
+        """Pontos a até ``radius_km`` (Haversine) de (lat, lng).
+
+        Args:
+            lat: latitude do centro.
+            lng: longitude do centro.
+            radius_km: raio em km.
+        Returns:
+            Pares (código, distância km) do mais próximo ao mais distante.
+        """
+        ids = self._candidates(lat, lng, radius_km)
+        if not ids:
+            return []
+        dist = self._distances(lat, lng, ids)
+        order = np.argsort(dist, kind="stable")
+        return [(self.codes[ids[k]], float(dist[k])) for k in order if dist[k] <= radius_km]
+
+    def nearest(self, lat: float, lng: float, k: int) -> List[Tuple[str, float]]:
+        """Os ``k`` pontos mais próximos de (lat, lng).
+
+        Dobra o raio da consulta (a partir de uma célula) até cobrir k pontos;
+        tudo fora do raio está mais longe que os encontrados.
+
+        Args:
+            lat: latitude do centro.
+            lng: longitude do centro.
+            k: quantidade de vizinhos.
+        Returns:
+            Pares (código, distância km) do mais próximo ao mais distante.
+        """
+        if k <= 0 or not self.codes:
+            return []
+        radius = self.cell_deg * math.pi / 180.0 * EARTH_RADIUS_KM
+        while True:
+            hits = self.within_radius(lat, lng, radius)
+            if len(hits) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+                return hits[:k]
+            radius *= 2
+
+
+@lru_cache(maxsize=1)
+def airport_index() -> SpatialIndex:
+    """Índice espacial dos aeroportos com voos regulares (``_scheduled_airports``).
+
+    Args:
+        None.
+    Returns:
+        Índice em grade dos aeroportos.
+    """
+    codes, coords = _scheduled_airports()
+    return SpatialIndex(codes, coords)
+
+
+def nearby_airports(code: str, radius_km: float, limit: int) -> List[Dict[str, Any]]:
+    """Aeroportos alternativos a até ``radius_km`` de carro de uma localidade.
+
+    Args:
+        code: código da localidade.
+        radius_km: raio em distância de estrada (Haversine x DRIVE_DISTANCE_FACTOR).
+        limit: quantidade máxima de alternativas.
+    Returns:
+        Lista de dicionários code/drive_distance_km/drive_time_hours, do mais
+        próximo ao mais distante, sem o próprio código.
+    """
+    code = (code or "").strip().upper()
+    point = location_coords(code)
+    if point is None or not radius_km or limit <= 0:
+        return []
+    factor = config.DRIVE_DISTANCE_FACTOR or 1.0
+    alternatives = []
+    for other, km in airport_index().within_radius(point[0], point[1], radius_km / factor):
+        if other == code:
+            continue
+        dist = km * factor
+        alternatives.append(
+            {"code": other, "drive_distance_km": dist, "drive_time_hours": estimate_drive_time_hours(dist, config.AVG_DRIVE_SPEED_KMH)}
+        )
+        if len(alternatives) >= limit:
+            break
+    return alternatives
@@ -0,0 +1,306 @@
+"""Base de localidades pre-compilada em formato colunar (NumPy).
+
+Os CSVs de ``config.LOCATIONS_FILES`` sao convertidos uma vez em arquivos
+``.npy`` dentro de ``config.LOCATIONS_CACHE_DIR``:
+
+- lat.npy / lng.npy: coordenadas em float64 (NaN quando ausentes);
+- scheduled.npy: voos regulares em int8 (1 sim, 0 nao, -1 desconhecido);
+- strings.npy / offsets.npy: tabela de strings UTF-8 (codigo, nome, cidade,
+  UF, pais, tipo) e posicoes de inicio de cada campo;
+- meta.json: versao e, por CSV de origem, caminho, mtime, tamanho e sha1.
+
+Na carga os arrays sao abertos com ``mmap_mode="r"`` (paginas compartilhadas
+entre processos). Se um CSV mudou de mtime/tamanho, o sha1 e recalculado e a
+base e reconstruida quando o conteudo difere.
+
+Uso (reconstroi se necessario):
+    python -m src.utils.location_store
+"""
+
+import csv
+import hashlib
+import json
+import math
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src import config
+
+# Versao do formato em disco (mudancas invalidam a base compilada)
+STORE_VERSION = 1
+
+# Campos texto guardados na tabela de strings, na ordem das colunas
+STRING_FIELDS = ("code", "name", "city", "state", "country", "type")
+
+_ARRAYS = ("lat", "lng", "scheduled", "offsets", "strings")
+
+
+def _parse_float(value: Optional[str]) -> float:
+    """Converte coordenada textual em float (NaN se vazia/invalida)."""
+    try:
+        return float(value) if value else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def read_location_csvs(files: Sequence[str]) -> List[Dict[str, Any]]:
+    """Le e normaliza as localidades (IATA/cidade/estado/pais) dos CSVs.
+
+    Args:
+        files: caminhos dos CSVs; arquivos inexistentes sao ignorados.
+
+    Returns:
+        Lista de dicionarios com code/name/city/state/country/type,
+        lat/lng (str) e scheduled_service (bool ou None).
+    """
+    locations: List[Dict[str, Any]] = []
+    for file_path in files:
+        try:
+            with open(file_path, newline="", encoding="utf-8") as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    # Normaliza campos conforme presença
+                    code = row.get("IATA") or row.get("iata_code") or row.get("iata")
+                    if not code:
+                        continue
+                    country = row.get("Country_CodeA2") or row.get("iso_country") or ""
+                    if country not in ("US", "BR"):
+                        continue
+                    city = row.get("City_Name") or row.get("municipality") or row.get("city") or ""
+                    state = row.get("iso_region", "")
+                    if state and "-" in state:
+                        state = state.split("-")[-1]
+                    state = row.get("region_name") or row.get("local_region") or state
+                    lat = row.get("GeoPointLat") or row.get("latitude_deg")
+                    lng = row.get("GeoPointLong") or row.get("longitude_deg")
+                    loc_type = row.get("type") or row.get("type_airport") or "airport"
+                    scheduled = (row.get("scheduled_service") or "").strip().lower()
+                    locations.append(
+                        {
+                            "code": code.strip().upper(),
+                            "name": row.get("AirportName") or row.get("name") or "",
+                            "city": city,
+                            "state": state,
+                            "country": country,
+                            "type": loc_type,
+                            "lat": lat,
+                            "lng": lng,
+                            "scheduled_service": scheduled in ("1", "yes", "true") if scheduled else None,
+                        }
+                    )
+        except FileNotFoundError:
+            continue
+    return locations
+
+
+class LocationTable:
+    """Sequencia de localidades sobre arrays colunares (em memoria ou memmap).
+
+    Cada item e montado sob demanda como dicionario (code, name, city, state,
+    country, type, lat, lng, scheduled_service), com lat/lng em float ou None.
+    """
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, scheduled: np.ndarray, offsets: np.ndarray, strings: np.ndarray):
+        self.lat = lat
+        self.lng = lng
+        self.scheduled = scheduled
+        self.offsets = offsets
+        self.strings = strings
+        # Indice da busca textual, montado por ``autocomplete.load_locations``
+        self.search_index: Optional[Any] = None
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "LocationTable":
+        """Compila registros normalizados (``read_location_csvs``) em colunas.
+
+        Args:
+            records: localidades normalizadas.
+
+        Returns:
+            Tabela em memoria.
+        """
+        blob = bytearray()
+        offsets = [0]
+        for rec in records:
+            for name in STRING_FIELDS:
+                blob.extend(str(rec.get(name) or "").encode("utf-8"))
+                offsets.append(len(blob))
+        scheduled = [-1 if rec.get("scheduled_service") is None else int(rec["scheduled_service"]) for rec in records]
+        return cls(
+            np.array([_parse_float(rec.get("lat")) for rec in records], dtype=np.float64),
+            np.array([_parse_float(rec.get("lng")) for rec in records], dtype=np.float64),
+            np.array(scheduled, dtype=np.int8),
+            np.array(offsets, dtype=np.int64),
+            np.frombuffer(bytes(blob), dtype=np.uint8),
+        )
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def field(self, index: int, name: str) -> str:
+        """Le um campo texto da linha ``index`` sem montar o dicionario."""
+        pos = index * len(STRING_FIELDS) + STRING_FIELDS.index(name)
+        return bytes(self.strings[self.offsets[pos] : self.offsets[pos + 1]]).decode("utf-8")
+
+    def coords(self, index: int) -> Optional[Tuple[float, float]]:
+        """Coordenadas (lat, lng) da linha ``index`` ou None se ausentes."""
+        lat, lng = float(self.lat[index]), float(self.lng[index])
+        if math.isnan(lat) or math.isnan(lng):
+            return None
+        return lat, lng
+
+    def _record(self, index: int) -> Dict[str, Any]:
+        width = len(STRING_FIELDS)
+        bounds = self.offsets[index * width : (index + 1) * width + 1].tolist()
+        raw = bytes(self.strings[bounds[0] : bounds[-1]])
+        base = bounds[0]
+        record: Dict[str, Any] = {
+            name: raw[bounds[k] - base : bounds[k + 1] - base].decode("utf-8") for k, name in enumerate(STRING_FIELDS)
+        }
+        coords = self.coords(index)
+        record["lat"], record["lng"] = coords if coords else (None, None)
+        scheduled = int(self.scheduled[index])
+        record["scheduled_service"] = None if scheduled < 0 else bool(scheduled)
+        return record
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, slice):
+            return [self._record(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self._record(key)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._record(i)
+
+
+def _file_sha1(path: str) -> str:
+    """sha1 do conteudo de um arquivo."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_info(files: Sequence[str], previous: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Descreve os CSVs de origem (mtime, tamanho, sha1).
+
+    O sha1 so e recalculado quando mtime/tamanho diferem do registro anterior.
+
+    Args:
+        files: caminhos dos CSVs.
+        previous: fontes registradas no meta.json atual.
+
+    Returns:
+        Lista com path/mtime/size/sha1 (sha1 None para arquivos ausentes).
+    """
+    known = {item["path"]: item for item in previous or []}
+    sources = []
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            sources.append({"path": path, "mtime": None, "size": None, "sha1": None})
+            continue
+        old = known.get(path)
+        if old and old.get("mtime") == stat.st_mtime and old.get("size") == stat.st_size:
+            sha1 = old.get("sha1")
+        else:
+            sha1 = _file_sha1(path)
+        sources.append({"path": path, "mtime": stat.st_mtime, "size": stat.st_size, "sha1": sha1})
+    return sources
+
+
+def _read_meta(cache_dir: str) -> Optional[Dict[str, Any]]:
+    """Le o meta.json da base compilada (None se ausente/invalido)."""
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir: str, meta: Dict[str, Any]) -> None:
+    """Grava o meta.json de forma atomica."""
+    path = os.path.join(cache_dir, "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as handle:
+        json.dump(meta, handle, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def build_location_store(files: Sequence[str], cache_dir: str, sources: Optional[List[Dict[str, Any]]] = None) -> LocationTable:
+    """Compila os CSVs e grava a base colunar em ``cache_dir``.
+
+    Os arrays sao gravados em arquivos temporarios e renomeados; o meta.json
+    vai por ultimo e so entao a base passa a valer.
+
+    Args:
+        files: caminhos dos CSVs.
+        cache_dir: diretorio da base compilada.
+        sources: descricao das fontes ja calculada (evita reler o sha1).
+
+    Returns:
+        Tabela em memoria recem-compilada.
+    """
+    table = LocationTable.from_records(read_location_csvs(files))
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in _ARRAYS:
+        path = os.path.join(cache_dir, f"{name}.npy")
+        with open(path + ".tmp", "wb") as handle:
+            np.save(handle, getattr(table, name))
+        os.replace(path + ".tmp", path)
+    meta = {
+        "version": STORE_VERSION,
+        "rows": len(table),
+        "fields": list(STRING_FIELDS),
+        "sources": sources if sources is not None else _source_info(files),
+    }
+    _write_meta(cache_dir, meta)
+    return table
+
+
+def load_location_store(files: Sequence[str], cache_dir: Optional[str]) -> LocationTable:
+    """Abre a base compilada (memmap), reconstruindo-a se as fontes mudaram.
+
+    Args:
+        files: caminhos dos CSVs de origem.
+        cache_dir: diretorio da base compilada; None le os CSVs direto.
+
+    Returns:
+        Tabela de localidades.
+    """
+    if not cache_dir:
+        return LocationTable.from_records(read_location_csvs(files))
+    meta = _read_meta(cache_dir)
+    previous = meta.get("sources") if meta and meta.get("version") == STORE_VERSION else None
+    sources = _source_info(files, previous)
+    fresh = previous is not None and [(s["path"], s["sha1"]) for s in sources] == [(s["path"], s.get("sha1")) for s in previous]
+    if fresh:
+        try:
+            arrays = {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        except (OSError, ValueError):
+            fresh = False
+    if not fresh:
+        try:
+            return build_location_store(files, cache_dir, sources)
+        except OSError:
+            # Diretorio sem permissao de escrita: usa a tabela em memoria
+            return LocationTable.from_records(read_location_csvs(files))
+    if sources != previous:
+        # Mesmo conteudo com outro mtime (ex.: checkout): so atualiza o registro
+        try:
+            _write_meta(cache_dir, dict(meta, sources=sources))
+        except OSError:
+            pass
+    return LocationTable(**arrays)
+
+
+if __name__ == "__main__":
+    table = load_location_store(config.LOCATIONS_FILES, config.LOCATIONS_CACHE_DIR)
+    print(f"{len(table)} localidades em {config.LOCATIONS_CACHE_DIR}")